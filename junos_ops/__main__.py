@@ -2,6 +2,6 @@
 
 import sys
 
-from junos_ops.cli import main
+from junos_ops.daemon import main
 
 sys.exit(main())
@@ -0,0 +1,255 @@
+"""Bandwidth budget for package copy: token buckets shared by SCP streams."""
+
+import argparse
+import re
+import threading
+import time
+from logging import getLogger
+
+from junos_ops import common
+from junos_ops import report
+
+logger = getLogger(__name__)
+
+_RATE_RE = re.compile(r"^(\d+(?:\.\d+)?)([KMG]?)$", re.IGNORECASE)
+_RATE_UNITS = {"": 1, "K": 10**3, "M": 10**6, "G": 10**9}
+
+_lock = threading.Lock()
+_global_bucket = None
+_tag_buckets = {}
+# hostname -> [bytes, first_seen, last_seen]
+_stats = {}
+
+
+def parse_rate(value: str) -> float:
+    """Parse a bit rate such as ``400M`` into bytes per second."""
+    m = _RATE_RE.match(value.strip())
+    if m is None:
+        raise ValueError(f"invalid rate: {value}")
+    bits = float(m.group(1)) * _RATE_UNITS[m.group(2).upper()]
+    if bits <= 0:
+        raise ValueError(f"invalid rate: {value}")
+    return bits / 8
+
+
+def rate_type(value: str) -> float:
+    """Validate and parse a bit rate string for argparse."""
+    try:
+        return parse_rate(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            f"{e}: must be bits per second with optional K/M/G suffix. ex. 400M"
+        )
+
+
+class TokenBucket:
+    """Token bucket in bytes per second.
+
+    Callers reserve tokens and sleep off any deficit outside the lock, so
+    concurrent streams are served in arrival order and share the rate.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate / 4, 65536)
+        # [残りトークン, 最終更新時刻]（share() 後は共有メモリ）
+        self._state = [self.capacity, time.monotonic()]
+        self._lock = threading.Lock()
+
+    def share(self, ctx):
+        """Move the bucket into shared memory for ``--processes`` workers.
+
+        The bucket can then be passed to worker processes at start-up, and
+        copies in every process draw from the same tokens.
+        """
+        with self._lock:
+            state = ctx.Array("d", self._state)
+        self._state = state
+        self._lock = state.get_lock()
+
+    def reserve(self, nbytes: int) -> float:
+        """Take nbytes and return how long the caller must wait."""
+        with self._lock:
+            tokens, stamp = self._state[0], self._state[1]
+            now = time.monotonic()
+            tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+            tokens -= nbytes
+            self._state[0], self._state[1] = tokens, now
+            if tokens >= 0:
+                return 0.0
+            return -tokens / self.rate
+
+
+def _get_global_bucket():
+    """Return the ``--copy-bandwidth`` bucket."""
+    global _global_bucket
+    rate = getattr(common.args, "copy_bandwidth", None)
+    if rate is None:
+        return None
+    with _lock:
+        if _global_bucket is None:
+            _global_bucket = TokenBucket(rate)
+        return _global_bucket
+
+
+def _get_tag_bucket(tag):
+    """Return the bucket for ``bandwidth`` in ``[limit:TAG]``, or None."""
+    section = common.LIMIT_PREFIX + tag
+    with _lock:
+        if tag not in _tag_buckets:
+            bucket = None
+            if common.config.has_section(section):
+                value = common.config.get(section, "bandwidth", fallback=None)
+                if value:
+                    bucket = TokenBucket(parse_rate(value))
+            _tag_buckets[tag] = bucket
+        return _tag_buckets[tag]
+
+
+def share(ctx):
+    """Create the global and per-tag buckets in shared memory.
+
+    Called before ``--processes`` workers start, so the budgets hold for
+    the whole run however the hosts are spread across the processes.
+
+    :returns: the buckets to pass to :func:`adopt` in each worker.
+    """
+    _get_global_bucket()
+    for section in common.config.sections():
+        if section.startswith(common.LIMIT_PREFIX):
+            _get_tag_bucket(section[len(common.LIMIT_PREFIX):].strip().lower())
+    with _lock:
+        buckets = [_global_bucket, *_tag_buckets.values()]
+        for bucket in buckets:
+            if bucket is not None:
+                bucket.share(ctx)
+        return _global_bucket, dict(_tag_buckets)
+
+
+def adopt(shared):
+    """Use the buckets created by :func:`share` in the parent process."""
+    global _global_bucket
+    with _lock:
+        _global_bucket, tag_buckets = shared
+        _tag_buckets.clear()
+        _tag_buckets.update(tag_buckets)
+
+
+def buckets_for(hostname) -> list[TokenBucket]:
+    """Return every bucket a copy to hostname must draw from."""
+    buckets = []
+    value = common.config.get(hostname, "copy_bandwidth", fallback=None)
+    if value:
+        buckets.append(TokenBucket(parse_rate(value)))
+    for tag in sorted(common._get_host_tags(hostname)):
+        bucket = _get_tag_bucket(tag)
+        if bucket is not None:
+            buckets.append(bucket)
+    bucket = _get_global_bucket()
+    if bucket is not None:
+        buckets.append(bucket)
+    return buckets
+
+
+def _record(hostname, nbytes):
+    now = time.monotonic()
+    with _lock:
+        entry = _stats.setdefault(hostname, [0, now, now])
+        entry[0] += nbytes
+        entry[2] = now
+
+
+def copy_progress(hostname):
+    """Return a PyEZ/SCP progress callback that throttles and measures.
+
+    PyEZ passes the callback straight to the scp module when it takes
+    three arguments (path, total, transferred); ``SW.safe_copy`` also
+    calls it as (dev, report) for text messages.
+    """
+    buckets = buckets_for(hostname)
+    state = {"sent": 0, "pct": 0}
+
+    def _progress(path_or_dev, total_or_report, xfrd=None):
+        if xfrd is None:
+            # SW.safe_copy からのテキスト報告
+            print(f"{hostname}: {total_or_report}")
+            return
+        delta = xfrd - state["sent"]
+        state["sent"] = xfrd
+        if delta <= 0:
+            return
+        _record(hostname, delta)
+        if buckets:
+            wait = max(bucket.reserve(delta) for bucket in buckets)
+            if wait > 0:
+                time.sleep(wait)
+        pct = int(xfrd * 100 / total_or_report) if total_or_report else 100
+        record = report.current()
+        if record is not None:
+            # --progress の表示用
+            record["detail"] = f"{pct}%"
+        if pct % 10 == 0 and pct != state["pct"]:
+            state["pct"] = pct
+            path = path_or_dev.decode() if isinstance(path_or_dev, bytes) else path_or_dev
+            print(f"{hostname}: {path}: {xfrd} / {total_or_report} ({pct}%)")
+
+    return _progress
+
+
+def total_bytes() -> int:
+    """Return the bytes copied to all hosts so far."""
+    with _lock:
+        return sum(entry[0] for entry in _stats.values())
+
+
+def get_throughput(hostname):
+    """Return (bytes, seconds) copied to hostname, or None."""
+    with _lock:
+        entry = _stats.get(hostname)
+        if entry is None:
+            return None
+        return entry[0], entry[2] - entry[1]
+
+
+def format_throughput(nbytes, seconds) -> str:
+    """Format bytes and duration as ``N MB in S s (R Mbit/s)``."""
+    mbps = nbytes * 8 / seconds / 10**6 if seconds > 0 else 0.0
+    return f"{nbytes / 10**6:.1f} MB in {seconds:.1f} s ({mbps:.1f} Mbit/s)"
+
+
+def snapshot() -> dict:
+    """Return the per-host statistics (sent back from worker processes)."""
+    with _lock:
+        return {host: list(entry) for host, entry in _stats.items()}
+
+
+def merge(more: dict):
+    """Add statistics collected in a worker process."""
+    with _lock:
+        _stats.update(more)
+
+
+def reset():
+    """Forget buckets and statistics (e.g. between daemon jobs)."""
+    global _global_bucket
+    with _lock:
+        _global_bucket = None
+        _tag_buckets.clear()
+        _stats.clear()
+
+
+def print_summary():
+    """Print achieved copy throughput per host, if anything was copied."""
+    with _lock:
+        stats = dict(_stats)
+    if not stats:
+        return
+    print("# copy throughput")
+    total = 0
+    for hostname in sorted(stats):
+        nbytes, first, last = stats[hostname]
+        total += nbytes
+        print(f"  {hostname}: {format_throughput(nbytes, last - first)}")
+    start = min(first for _, first, _ in stats.values())
+    end = max(last for _, _, last in stats.values())
+    print(f"  total: {format_throughput(total, end - start)}")
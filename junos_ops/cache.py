@@ -0,0 +1,152 @@
+"""Persistent on-disk caches under ~/.cache/junos-ops (SQLite)."""
+
+import json
+import os
+import sqlite3
+import time
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+FACTS_DB = "facts.db"
+DIGESTS_DB = "digests.db"
+# キャッシュする facts のキー
+FACTS_KEYS = ("hostname", "model", "version", "personality", "model_info", "srx_cluster")
+DEFAULT_FACTS_TTL = 86400
+
+_SCHEMAS = {
+    FACTS_DB: (
+        "CREATE TABLE IF NOT EXISTS facts ("
+        " host TEXT PRIMARY KEY, facts TEXT NOT NULL, updated REAL NOT NULL)",
+    ),
+    DIGESTS_DB: (
+        # ローカル: ファイルの同一性（パス・サイズ・mtime・inode）が一致する場合のみ有効
+        "CREATE TABLE IF NOT EXISTS digests ("
+        " path TEXT NOT NULL, algo TEXT NOT NULL, size INTEGER NOT NULL,"
+        " mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, digest TEXT NOT NULL,"
+        " updated REAL NOT NULL, PRIMARY KEY (path, algo))",
+        # リモート: 機器上のサイズと mtime が一致する場合のみ有効
+        "CREATE TABLE IF NOT EXISTS remote_digests ("
+        " host TEXT NOT NULL, path TEXT NOT NULL, algo TEXT NOT NULL,"
+        " size INTEGER NOT NULL, mtime INTEGER NOT NULL, digest TEXT NOT NULL,"
+        " updated REAL NOT NULL, PRIMARY KEY (host, path, algo))",
+    ),
+}
+
+
+def cache_dir() -> str:
+    """Return the cache directory (XDG_CACHE_HOME, default ~/.cache)."""
+    xdg = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(xdg, "junos-ops")
+
+
+def _connect(name: str) -> sqlite3.Connection:
+    """Open a cache database, creating the directory if needed.
+
+    A new connection is opened per call so worker threads never share one.
+    """
+    path = os.path.join(cache_dir(), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    for schema in _SCHEMAS[name]:
+        conn.execute(schema)
+    return conn
+
+
+def store_facts(hostname: str, facts: dict, keys=FACTS_KEYS):
+    """Record facts (only :data:`FACTS_KEYS`) for a config section name.
+
+    When keys is a subset of :data:`FACTS_KEYS`, only those keys are
+    replaced and the rest of the cached record is kept.
+    """
+    keys = [key for key in FACTS_KEYS if key in keys]
+    with _connect(FACTS_DB) as conn:
+        row = conn.execute(
+            "SELECT facts FROM facts WHERE host = ?", (hostname,)
+        ).fetchone()
+        record = json.loads(row[0]) if row else {key: None for key in FACTS_KEYS}
+        record.update({key: facts.get(key) for key in keys})
+        data = json.dumps(record, default=str)
+        conn.execute(
+            "INSERT OR REPLACE INTO facts (host, facts, updated) VALUES (?, ?, ?)",
+            (hostname, data, time.time()),
+        )
+    conn.close()
+
+
+def load_facts(ttl: float = DEFAULT_FACTS_TTL) -> dict[str, dict]:
+    """Return {hostname: facts} for every entry younger than ttl seconds."""
+    path = os.path.join(cache_dir(), FACTS_DB)
+    if not os.path.isfile(path):
+        return {}
+    oldest = time.time() - ttl
+    with _connect(FACTS_DB) as conn:
+        rows = conn.execute(
+            "SELECT host, facts FROM facts WHERE updated >= ?", (oldest,)
+        ).fetchall()
+    conn.close()
+    return {host: json.loads(data) for host, data in rows}
+
+
+def file_identity(path: str) -> tuple[str, int, int, int]:
+    """Return (absolute path, size, mtime_ns, inode) of a local file.
+
+    :raises FileNotFoundError: when path does not exist.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def load_digest(identity: tuple, algo: str) -> str | None:
+    """Return the cached digest of a file, or None if the file changed."""
+    path, size, mtime_ns, inode = identity
+    if not os.path.isfile(os.path.join(cache_dir(), DIGESTS_DB)):
+        return None
+    with _connect(DIGESTS_DB) as conn:
+        row = conn.execute(
+            "SELECT digest FROM digests WHERE path = ? AND algo = ?"
+            " AND size = ? AND mtime_ns = ? AND inode = ?",
+            (path, algo, size, mtime_ns, inode),
+        ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def store_digest(identity: tuple, algo: str, digest: str):
+    """Record the digest of a file as identified by :func:`file_identity`."""
+    path, size, mtime_ns, inode = identity
+    with _connect(DIGESTS_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO digests"
+            " (path, algo, size, mtime_ns, inode, digest, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, algo, size, mtime_ns, inode, digest, time.time()),
+        )
+    conn.close()
+
+
+def load_remote_digest(hostname: str, path: str, algo: str) -> tuple[int, int, str] | None:
+    """Return (size, mtime, digest) last verified for a file on a device."""
+    if not os.path.isfile(os.path.join(cache_dir(), DIGESTS_DB)):
+        return None
+    with _connect(DIGESTS_DB) as conn:
+        row = conn.execute(
+            "SELECT size, mtime, digest FROM remote_digests"
+            " WHERE host = ? AND path = ? AND algo = ?",
+            (hostname, path, algo),
+        ).fetchone()
+    conn.close()
+    return tuple(row) if row else None
+
+
+def store_remote_digest(hostname: str, path: str, algo: str, size: int, mtime: int, digest: str):
+    """Record the digest of a file on a device with its size and mtime."""
+    with _connect(DIGESTS_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO remote_digests"
+            " (host, path, algo, size, mtime, digest, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (hostname, path, algo, size, mtime, digest, time.time()),
+        )
+    conn.close()
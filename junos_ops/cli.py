@@ -18,7 +18,9 @@
 from jnpr.junos.exception import ConnectClosedError
 from pprint import pprint
 import argparse
+import contextlib
 import sys
+import time
 import logging
 import logging.config
 import os
@@ -45,7 +47,17 @@ else:
 logger = logging.getLogger(__name__)
 
 from junos_ops import __version__ as version  # noqa: E402
+from junos_ops import bandwidth  # noqa: E402
 from junos_ops import common  # noqa: E402
+from junos_ops import daemon  # noqa: E402
+from junos_ops import journal  # noqa: E402
+from junos_ops import metrics  # noqa: E402
+from junos_ops import output  # noqa: E402
+from junos_ops import profiling  # noqa: E402
+from junos_ops import rpcprofile  # noqa: E402
+from junos_ops import trace  # noqa: E402
+from junos_ops import progress  # noqa: E402
+from junos_ops import report  # noqa: E402
 from junos_ops import upgrade  # noqa: E402
 from junos_ops import rsi  # noqa: E402
 
@@ -89,220 +101,182 @@ def __getattr__(name):
     raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
+# --- サブコマンドのステップ（接続済みセッション上で実行） ---
+
+
+def step_facts(hostname, dev) -> int:
+    """Display device facts."""
+    pprint(dev.facts)
+    return 0
+
+
+def step_install(hostname, dev) -> int:
+    """Copy (if needed) and install package."""
+    return 1 if upgrade.install(hostname, dev) else 0
+
+
+def step_copy(hostname, dev) -> int:
+    """Copy package to remote device."""
+    return 1 if upgrade.copy(hostname, dev) else 0
+
+
+def step_rollback(hostname, dev) -> int:
+    """Rollback to previous version."""
+    pending = upgrade.get_pending_version(hostname, dev)
+    print(f"rollback: pending version is {pending}")
+    if pending is None:
+        print("rollback: skip")
+    else:
+        if upgrade.rollback(hostname, dev):
+            return 1
+        if not common.args.dry_run:
+            print("rollback: successful")
+    return 0
+
+
+def step_version(hostname, dev) -> int:
+    """Show device version information."""
+    return 1 if upgrade.show_version(hostname, dev) else 0
+
+
+def step_reboot(hostname, dev) -> int:
+    """Schedule device reboot."""
+    return upgrade.reboot(hostname, dev, common.args.rebootat)
+
+
+def step_show(hostname, dev) -> int:
+    """Run CLI command on device and print output."""
+    if common.args.showfile:
+        # ファイルから複数コマンドを読み込み、1セッション内で順次実行
+        commands = common.load_commands(common.args.showfile)
+        lines = []
+        for cmd in commands:
+            output = dev.cli(cmd)
+            lines.append(f"## {cmd}\n{output.strip()}")
+        print(f"# {hostname}\n" + "\n\n".join(lines) + "\n")
+    else:
+        output = dev.cli(common.args.show_command)
+        # 1回の print で出力し、並列実行時のインターリーブを軽減
+        print(f"# {hostname}\n{output.strip()}\n")
+    return 0
+
+
+def step_config(hostname, dev) -> int:
+    """Push set command file to device."""
+    return 1 if upgrade.load_config(hostname, dev, common.args.configfile) else 0
+
+
+def step_ls(hostname, dev) -> int:
+    """List remote files."""
+    upgrade.list_remote_path(hostname, dev)
+    return 0
+
+
+# run サブコマンドで使えるステップ: 名前 → (ステップ関数, 接続時に取得する facts)
+# facts の None は全 facts
+STEPS = {
+    "facts": (step_facts, None),
+    "version": (step_version, upgrade.FACTS),
+    "copy": (step_copy, upgrade.FACTS),
+    "install": (step_install, upgrade.FACTS),
+    "upgrade": (step_install, upgrade.FACTS),
+    "rollback": (step_rollback, upgrade.FACTS),
+    "reboot": (step_reboot, upgrade.FACTS),
+    "ls": (step_ls, ()),
+    "config": (step_config, ()),
+    "rsi": (rsi.collect, rsi.FACTS),
+}
+
+
+def steps_type(value: str) -> list[str]:
+    """argparse type for ``run``: comma-separated step names."""
+    steps = [s.strip().lower() for s in value.split(",") if s.strip()]
+    if not steps:
+        raise argparse.ArgumentTypeError("no steps given")
+    for step in steps:
+        if step not in STEPS:
+            raise argparse.ArgumentTypeError(
+                f"unknown step {step!r} (choose from {', '.join(STEPS)})"
+            )
+    # reboot はセッションを閉じるため、後続のステップを実行できない
+    if "reboot" in steps[:-1]:
+        raise argparse.ArgumentTypeError("reboot must be the last step")
+    return steps
+
+
+def steps_facts(steps):
+    """Union of the facts needed by steps (None if any step needs all)."""
+    facts = []
+    for step in steps:
+        needed = STEPS[step][1]
+        if needed is None:
+            return None
+        facts += [key for key in needed if key not in facts]
+    return tuple(facts)
+
+
 # --- サブコマンド用エントリ関数 ---
 
 
 def cmd_facts(hostname) -> int:
     """Display device facts."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        pprint(dev.facts)
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("facts", step_facts)])
 
 
 def cmd_upgrade(hostname) -> int:
     """Copy and install package."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        if upgrade.install(hostname, dev):
-            return 1
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("upgrade", step_install)], facts=upgrade.FACTS)
 
 
 def cmd_copy(hostname) -> int:
     """Copy package to remote device."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        if upgrade.copy(hostname, dev):
-            return 1
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("copy", step_copy)], facts=upgrade.FACTS)
 
 
 def cmd_install(hostname) -> int:
     """Install previously copied package."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        if upgrade.install(hostname, dev):
-            return 1
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("install", step_install)], facts=upgrade.FACTS)
 
 
 def cmd_rollback(hostname) -> int:
     """Rollback to previous version."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        pending = upgrade.get_pending_version(hostname, dev)
-        print(f"rollback: pending version is {pending}")
-        if pending is None:
-            print("rollback: skip")
-        else:
-            if upgrade.rollback(hostname, dev):
-                return 1
-            if not common.args.dry_run:
-                print("rollback: successful")
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("rollback", step_rollback)], facts=upgrade.FACTS)
 
 
 def cmd_version(hostname) -> int:
     """Show device version information."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        if upgrade.show_version(hostname, dev):
-            return 1
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("version", step_version)], facts=upgrade.FACTS)
 
 
 def cmd_reboot(hostname) -> int:
     """Schedule device reboot."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        ret = upgrade.reboot(hostname, dev, common.args.rebootat)
-        return ret
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("reboot", step_reboot)], facts=upgrade.FACTS)
 
 
 def cmd_show(hostname) -> int:
     """Run CLI command on device and print output."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        if common.args.showfile:
-            # ファイルから複数コマンドを読み込み、1セッション内で順次実行
-            commands = common.load_commands(common.args.showfile)
-            lines = []
-            for cmd in commands:
-                output = dev.cli(cmd)
-                lines.append(f"## {cmd}\n{output.strip()}")
-            print(f"# {hostname}\n" + "\n\n".join(lines) + "\n")
-        else:
-            output = dev.cli(common.args.show_command)
-            # 1回の print で出力し、並列実行時のインターリーブを軽減
-            print(f"# {hostname}\n{output.strip()}\n")
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    # ヘッダは出力と一緒に1回の print で出す
+    return common.run_steps(hostname, [("show", step_show)], facts=(), header=False)
 
 
 def cmd_config(hostname) -> int:
     """Push set command file to device."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        if upgrade.load_config(hostname, dev, common.args.configfile):
-            return 1
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("config", step_config)], facts=())
 
 
 def cmd_ls(hostname) -> int:
     """List remote files."""
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
-    try:
-        print(f"# {hostname}")
-        upgrade.list_remote_path(hostname, dev)
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except (ConnectClosedError, Exception):
-            pass
+    return common.run_steps(hostname, [("ls", step_ls)], facts=())
+
+
+def cmd_run(hostname) -> int:
+    """Run the ``run`` pipeline steps on one session, stopping at the first failure."""
+    steps = common.args.steps
+    return common.run_steps(
+        hostname,
+        [(step, STEPS[step][0]) for step in steps],
+        facts=steps_facts(steps),
+    )
 
 
 # --- 後方互換: process_host ---
@@ -375,8 +349,11 @@ def process_host(hostname: str) -> int:
 # --- メイン ---
 
 
-def main():
-    """CLI entry point."""
+def main(argv=None):
+    """CLI entry point.
+
+    :param argv: arguments without the program name (default: sys.argv[1:]).
+    """
     # 共通オプション用の親パーサー
     parent = argparse.ArgumentParser(add_help=False)
     parent.add_argument(
@@ -393,12 +370,95 @@ def main():
     )
     parent.add_argument(
         "--workers", type=int, default=None,
-        help="parallel workers (default: 1 for upgrade, 20 for rsi)",
+        help="parallel workers (default: 1 for upgrade, 20 for rsi); "
+        "upper bound with --adaptive",
+    )
+    parent.add_argument(
+        "--adaptive", action="store_true",
+        help="adapt parallelism to connect latency and timeouts",
+    )
+    parent.add_argument(
+        "--min-workers", dest="min_workers", type=int, default=1,
+        help="lower bound of parallel workers with --adaptive (default: 1)",
+    )
+    parent.add_argument(
+        "--processes", type=int, default=1,
+        help="shard hosts across N worker processes (default: 1)",
+    )
+    parent.add_argument(
+        "--probe", action="store_true",
+        help="TCP-probe the NETCONF port of all hosts first and skip unreachable ones",
+    )
+    parent.add_argument(
+        "--probe-timeout", dest="probe_timeout", type=float, default=3.0,
+        help="deadline in seconds for --probe (default: 3)",
+    )
+    parent.add_argument(
+        "--retries", type=int, default=None,
+        help="retry connect timeouts/refusals N times with backoff "
+        "(default: connect_retries in config, 0)",
+    )
+    parent.add_argument(
+        "--max-auth-failures", dest="max_auth_failures", type=int, default=3,
+        help="abort the run after N consecutive authentication failures "
+        "(default: 3, 0 disables)",
+    )
+    parent.add_argument(
+        "--report", metavar="FILE", default=None,
+        help="write a JSON run report with per-host status and timings",
+    )
+    parent.add_argument(
+        "--metrics", metavar="FILE", default=None,
+        help="write Prometheus textfile metrics of the run to FILE (e.g. junos_ops_rsi.prom)",
+    )
+    parent.add_argument(
+        "--trace", metavar="FILE", default=None,
+        help="write spans of every host's phases and RPCs to FILE",
+    )
+    parent.add_argument(
+        "--trace-format", dest="trace_format", choices=trace.FORMATS, default="chrome",
+        help="trace file format: chrome (trace-event JSON) or otlp (OTLP JSON) (default: chrome)",
+    )
+    parent.add_argument(
+        "--profile-rpc", dest="profile_rpc", action="store_true",
+        help="time every RPC and print p50/p95/p99 latency per RPC and model at the end",
+    )
+    parent.add_argument(
+        "--profile", choices=profiling.MODES, default=None,
+        help="profile this run: cpu (cProfile, all threads) or mem (tracemalloc top lines)",
+    )
+    parent.add_argument(
+        "--profile-output", dest="profile_output", metavar="FILE", default=None,
+        help="profile output file (default: junos-ops.pstats for cpu, "
+        "junos-ops-mem.txt for mem)",
+    )
+    parent.add_argument(
+        "--progress", action="store_true",
+        help="show a live progress view and print each host's output at the end",
+    )
+    parent.add_argument(
+        "--output-dir", dest="output_dir", metavar="DIR", default=None,
+        help="write each host's output to DIR/<host>.log instead of stdout",
+    )
+    resume_group = parent.add_mutually_exclusive_group()
+    resume_group.add_argument(
+        "--resume", metavar="RUN_ID", default=None,
+        help="process only the hosts an interrupted run did not finish ('last' for the latest run)",
+    )
+    resume_group.add_argument(
+        "--retry-failed", dest="retry_failed", metavar="RUN_ID", default=None,
+        help="process only the hosts that failed in a run ('last' for the latest run)",
     )
     parent.add_argument(
         "--tags", type=str, default=None,
         help="filter hosts by tags (comma-separated, AND match)",
     )
+    parent.add_argument(
+        "--where", action="append", default=None, type=common.where_type,
+        metavar="FIELD OP VALUE",
+        help="filter hosts by cached facts, e.g. model=EX2300* or version<20.4 "
+        "(repeatable, AND match)",
+    )
 
     parser = argparse.ArgumentParser(
         description="junos-ops: Juniper Networks デバイス管理ツール",
@@ -425,6 +485,34 @@ def main():
     )
     p_install.add_argument("specialhosts", metavar="hostname", nargs="*")
 
+    # run: 複数ステップを1セッションで順に実行
+    p_run = subparsers.add_parser(
+        "run", parents=[parent],
+        help="run steps in order on one session per host (e.g. version,copy,install)",
+    )
+    p_run.add_argument(
+        "steps", type=steps_type,
+        help=f"comma-separated steps: {', '.join(STEPS)}",
+    )
+    p_run.add_argument(
+        "--at", dest="rebootat", default=None,
+        type=upgrade.yymmddhhmm_type,
+        help="reboot at yymmddhhmm for the reboot step (e.g. 2501020304)",
+    )
+    p_run.add_argument(
+        "-f", "--file", dest="configfile", default=None,
+        help="set command file for the config step",
+    )
+    p_run.add_argument("specialhosts", metavar="hostname", nargs="*")
+
+    # copy 系: 帯域制限
+    for p in (p_upgrade, p_copy, p_install, p_run):
+        p.add_argument(
+            "--copy-bandwidth", dest="copy_bandwidth", default=None,
+            type=bandwidth.rate_type,
+            help="total SCP bandwidth shared by all hosts in bit/s (e.g. 400M)",
+        )
+
     # rollback
     p_rollback = subparsers.add_parser(
         "rollback", parents=[parent], help="rollback installed package",
@@ -452,10 +540,12 @@ def main():
     p_ls = subparsers.add_parser(
         "ls", parents=[parent], help="list remote files",
     )
-    p_ls.add_argument(
-        "-l", action="store_const", dest="list_format", const="long", default="short",
-        help="long format (like ls -l)",
-    )
+    # ls 系: 表示形式（run の ls ステップも同じ）
+    for p in (p_ls, p_run):
+        p.add_argument(
+            "-l", action="store_const", dest="list_format", const="long", default="short",
+            help="long format (like ls -l)",
+        )
     p_ls.add_argument("specialhosts", metavar="hostname", nargs="*")
 
     # show
@@ -479,33 +569,55 @@ def main():
         "-f", "--file", dest="configfile", required=True,
         help="path to set command file",
     )
-    p_config.add_argument(
-        "--confirm", dest="confirm_timeout", type=int, default=1,
-        help="commit confirm timeout in minutes (default: 1)",
-    )
-    hc_group = p_config.add_mutually_exclusive_group()
-    hc_group.add_argument(
-        "--health-check", dest="health_check",
-        default="ping count 3 8.8.8.8 rapid",
-        help='health check CLI command after commit confirmed (default: "ping count 3 8.8.8.8 rapid")',
-    )
-    hc_group.add_argument(
-        "--no-health-check", dest="health_check",
-        action="store_const", const=None,
-        help="skip health check after commit confirmed",
-    )
+    # config 系: commit confirmed とヘルスチェック（run の config ステップも同じ）
+    for p in (p_config, p_run):
+        p.add_argument(
+            "--confirm", dest="confirm_timeout", type=int, default=1,
+            help="commit confirm timeout in minutes (default: 1)",
+        )
+        hc_group = p.add_mutually_exclusive_group()
+        hc_group.add_argument(
+            "--health-check", dest="health_check",
+            default="ping count 3 8.8.8.8 rapid",
+            help='health check CLI command after commit confirmed (default: "ping count 3 8.8.8.8 rapid")',
+        )
+        hc_group.add_argument(
+            "--no-health-check", dest="health_check",
+            action="store_const", const=None,
+            help="skip health check after commit confirmed",
+        )
     p_config.add_argument("specialhosts", metavar="hostname", nargs="*")
 
     # rsi
     p_rsi = subparsers.add_parser(
         "rsi", parents=[parent], help="collect RSI/SCF",
     )
-    p_rsi.add_argument(
-        "--rsi-dir", dest="rsi_dir", default=None,
-        help="output directory for RSI/SCF files",
-    )
+    # rsi 系: 出力先（run の rsi ステップも同じ）
+    for p in (p_rsi, p_run):
+        p.add_argument(
+            "--rsi-dir", dest="rsi_dir", default=None,
+            help="output directory for RSI/SCF files",
+        )
     p_rsi.add_argument("specialhosts", metavar="hostname", nargs="*")
 
+    # daemon: セッションを保持して UNIX ソケットでジョブを受け付ける
+    p_daemon = subparsers.add_parser(
+        "daemon", help="keep NETCONF sessions open and serve CLI requests",
+    )
+    p_daemon.add_argument(
+        "--socket", default=None,
+        help="UNIX socket path (default: $XDG_RUNTIME_DIR/junos-ops/daemon.sock)",
+    )
+    p_daemon.add_argument(
+        "--idle-timeout", dest="idle_timeout", type=float,
+        default=daemon.DEFAULT_IDLE_TIMEOUT,
+        help=f"close sessions idle for this many seconds (default: {daemon.DEFAULT_IDLE_TIMEOUT})",
+    )
+    p_daemon.add_argument(
+        "--keepalive", type=float, default=daemon.DEFAULT_KEEPALIVE,
+        help=f"keepalive interval for idle sessions in seconds (default: {daemon.DEFAULT_KEEPALIVE})",
+    )
+
     # サブコマンドなし → device facts 表示
     # argparse はサブコマンドなしで positional args を受け取れないため、
     # 引数がサブコマンドに一致しない場合は facts として扱う
@@ -516,7 +628,7 @@ def main():
     except ImportError:
         pass
 
-    args, unknown = parser.parse_known_args()
+    args, unknown = parser.parse_known_args(argv)
 
     # show サブコマンド: 余剰位置引数を show_args に統合
     # （argparse は nargs="*" でもオプション後の位置引数を正しく収集できないため）
@@ -526,16 +638,19 @@ def main():
         else:
             parser.error(f"unrecognized arguments: {' '.join(unknown)}")
 
+    if args.subcommand == "daemon":
+        return daemon.serve(args.socket, args.idle_timeout, args.keepalive)
+
     # サブコマンドなしの場合の処理
     if args.subcommand is None:
         # サブコマンドなしで hostname が指定されたケースを処理
         # 例: junos-ops hostname1 hostname2
-        remaining = sys.argv[1:]
+        remaining = sys.argv[1:] if argv is None else argv
         if remaining and not remaining[0].startswith("-"):
             # 親パーサーで再パース
             facts_parser = argparse.ArgumentParser(parents=[parent], add_help=False)
             facts_parser.add_argument("specialhosts", metavar="hostname", nargs="*")
-            args = facts_parser.parse_args()
+            args = facts_parser.parse_args(argv)
             args.subcommand = None
         else:
             # オプションのみ or 引数なし
@@ -546,7 +661,7 @@ def main():
             facts_parser = argparse.ArgumentParser(parents=[parent], add_help=False)
             facts_parser.add_argument("specialhosts", metavar="hostname", nargs="*")
             try:
-                args = facts_parser.parse_args()
+                args = facts_parser.parse_args(argv)
             except SystemExit:
                 parser.print_help()
                 return 0
@@ -571,6 +686,10 @@ def main():
         args.showfile = None
     if not hasattr(args, "tags"):
         args.tags = None
+    if not hasattr(args, "where"):
+        args.where = None
+    if not hasattr(args, "copy_bandwidth"):
+        args.copy_bandwidth = None
     # process_host 互換用
     args.copy = False
     args.install = False
@@ -592,24 +711,84 @@ def main():
         else:
             parser.error("show: コマンドまたは -f のいずれかを指定してください")
 
+    # run サブコマンド: ステップに必要なオプションの確認
+    if args.subcommand == "run":
+        if "reboot" in args.steps and args.rebootat is None:
+            parser.error("run: reboot ステップには --at を指定してください")
+        if "config" in args.steps and args.configfile is None:
+            parser.error("run: config ステップには -f を指定してください")
+
+    # --resume / --retry-failed: 対象はジャーナルから選ぶため、ホストの指定とは併用できない
+    if args.resume or args.retry_failed:
+        option = "--resume" if args.resume else "--retry-failed"
+        if not journal.journaled(args.subcommand, getattr(args, "steps", None)):
+            parser.error(f"{option}: {args.subcommand or 'facts'} runs are not journaled")
+        if getattr(args, "specialhosts", None) or args.tags or args.where:
+            parser.error(f"{option} cannot be combined with hostnames, --tags or --where")
+
     common.args = args
     if common.args.config is None:
         common.args.config = common.get_default_config()
 
+    # プロファイル: 設定ファイルの読み込みからコーディネーター全体を計測する
+    profiling.stop_quietly()
+    if args.profile:
+        args.profile_output = os.path.abspath(
+            args.profile_output or profiling.DEFAULT_OUTPUT[args.profile]
+        )
+        profiling.start(args.profile, args.profile_output)
+
     logger.debug("start")
 
     if common.read_config():
         print(common.args.config, "is not ready")
         sys.exit(1)
 
-    targets = common.get_targets()
+    # 実行ジャーナル: --resume / --retry-failed は以前の実行の対象から選び直す
+    previous = {}
+    run_id = args.resume or args.retry_failed
+    if run_id:
+        if run_id == "last":
+            run_id = journal.latest()
+            if run_id is None:
+                parser.error("unknown run id: last (no previous run)")
+        try:
+            run_journal = journal.Journal(run_id)
+            header, previous = run_journal.load()
+        except ValueError:
+            parser.error(f"invalid run id: {args.resume or args.retry_failed}")
+        except FileNotFoundError:
+            parser.error(f"unknown run id: {args.resume or args.retry_failed}")
+        if header.get("subcommand") != args.subcommand:
+            parser.error(
+                f"run {run_id} was '{header.get('subcommand') or 'facts'}', "
+                f"not '{args.subcommand or 'facts'}'"
+            )
+        mode = "resume" if args.resume else "retry-failed"
+        targets = journal.select(header, previous, mode)
+        print(f"# {mode} {run_id}: {len(targets)} of {len(header['targets'])} hosts")
+    else:
+        targets = common.get_targets()
+        run_journal = None
+        if journal.journaled(args.subcommand, getattr(args, "steps", None)):
+            try:
+                run_journal = journal.Journal.create(
+                    args.subcommand, targets, sys.argv[1:] if argv is None else argv
+                )
+            except OSError as e:
+                logger.warning(f"journal: disabled: {e}")
+    if run_journal is not None:
+        print(f"# run: {run_journal.run_id}", file=sys.stderr)
 
     # workers のデフォルト値設定
     if common.args.workers is None:
-        if args.subcommand == "rsi":
+        if args.subcommand == "rsi" or common.args.adaptive:
             common.args.workers = 20
         else:
             common.args.workers = 1
+    common.setup_limiter(common.args.workers)
+    common.setup_tag_limits(args.subcommand, getattr(args, "steps", None) or ())
+    common.setup_breaker()
 
     # サブコマンドのディスパッチ
     dispatch = {
@@ -623,14 +802,101 @@ def main():
         "show": cmd_show,
         "config": cmd_config,
         "rsi": rsi.cmd_rsi,
+        "run": cmd_run,
         None: cmd_facts,
     }
 
     func = dispatch.get(args.subcommand, cmd_facts)
-    results = common.run_parallel(func, targets, max_workers=common.args.workers)
-
-    # いずれかのホストが非0を返したら非0で終了
-    for host, ret in results.items():
+    started = time.time()
+    # 事前到達性チェック: 到達不能なホストは失敗として扱い、実行対象から外す
+    # （--progress の表示対象にも含めない）
+    unreachable = {}
+    if common.args.probe:
+        probed = common.probe_targets(targets, timeout=common.args.probe_timeout)
+        unreachable = {t: r for t, r in probed.items() if r is not None}
+        targets = [t for t in targets if t not in unreachable]
+        print(f"# probe: {len(targets)} reachable, {len(unreachable)} unreachable")
+
+    dashboard = None
+    if common.args.progress and common.args.processes > 1:
+        logger.warning("--progress is not available with --processes; ignored")
+    elif common.args.progress:
+        dashboard = progress.Dashboard(targets)
+    # 並列実行時はホストごとの出力をまとめて書き出し、インターリーブを防ぐ
+    if common.args.output_dir:
+        os.makedirs(common.args.output_dir, exist_ok=True)
+    captured = bool(
+        dashboard is not None or common.args.output_dir
+        or common.args.workers > 1 or common.args.processes > 1
+    )
+    if captured:
+        func = output.Captured(func, output_dir=common.args.output_dir)
+    if common.args.trace:
+        trace.enable()
+    else:
+        trace.disable()
+    if common.args.profile_rpc:
+        rpcprofile.enable()
+    else:
+        rpcprofile.disable()
+    collect = bool(
+        common.args.report or common.args.metrics or common.args.trace
+        or dashboard is not None
+    )
+    if collect:
+        report.enable()
+        func = report.Reported(func)
+    with output.capture(hold=dashboard is not None) if captured else contextlib.nullcontext():
+        if dashboard is not None:
+            dashboard.start()
+        try:
+            results = common.run_parallel(
+                func, targets,
+                max_workers=common.args.workers,
+                processes=common.args.processes,
+                on_done=run_journal.record if run_journal is not None else None,
+            )
+        finally:
+            if dashboard is not None:
+                dashboard.stop()
+    if dashboard is not None:
+        dashboard.dump_output()
+    if common.args.output_dir:
+        print(f"# output: {len(targets)} host logs in {common.args.output_dir}")
+
+    for host, reason in unreachable.items():
+        results[host] = 1
+        if run_journal is not None:
+            run_journal.record(host, 1)
+        if collect:
+            report.add(host, 1, error="Unreachable", message=reason)
+
+    copy_steps = common.COPY_SUBCOMMANDS
+    if args.subcommand in copy_steps or (
+        args.subcommand == "run" and set(args.steps) & set(copy_steps)
+    ):
+        bandwidth.print_summary()
+    if unreachable:
+        print("# probe: unreachable hosts")
+        for host, reason in unreachable.items():
+            print(f"  {host}: {reason}")
+    if common.args.profile_rpc:
+        rpcprofile.print_summary()
+    if common.breaker is not None and common.breaker.tripped:
+        print(f"# circuit breaker: {common.breaker.reason()}")
+        print(f"# not attempted: {len(common.breaker.skipped)} hosts")
+
+    if common.args.report:
+        report.write(common.args.report, args.subcommand, started)
+    if common.args.metrics:
+        metrics.write(common.args.metrics, args.subcommand, started)
+    if common.args.trace:
+        trace.write(common.args.trace, common.args.trace_format)
+    if common.args.profile:
+        profiling.finish(common.args.profile_output)
+
+    # いずれかのホストが非0を返したら非0で終了（再開時は以前の結果も含める）
+    for host, ret in {**previous, **results}.items():
         if ret != 0:
             logger.debug(f"{host} returned {ret}")
             sys.exit(ret)
@@ -1,6 +1,7 @@
 """Common utilities: config loading, NETCONF connection, target resolution, parallel execution."""
 
 from concurrent import futures
+from looseversion import LooseVersion
 from jnpr.junos import Device
 from jnpr.junos.exception import (
     ConnectAuthError,
@@ -9,20 +10,54 @@ from jnpr.junos.exception import (
     ConnectRefusedError,
     ConnectTimeoutError,
     ConnectUnknownHostError,
+    RpcTimeoutError,
 )
+import argparse
+import asyncio
 import configparser
+import fnmatch
+import multiprocessing
 import os
+import random
+import re
 import sys
 import threading
+import time
 from logging import getLogger
 
+from junos_ops import bandwidth
+from junos_ops import cache
+from junos_ops import profiling
+from junos_ops import report
+from junos_ops import rpcprofile
+from junos_ops import timeouts
+from junos_ops import trace
+
 logger = getLogger(__name__)
 
 config = None
 config_lock = threading.Lock()
 args = None
+limiter = None
+tag_limits = {}
+breaker = None
+# daemon モードのセッションプール（junos_ops.daemon.SessionPool）
+session_pool = None
+# ワーカープロセスで完了したホストを親プロセスへ知らせるキュー（_init_worker が設定）
+_done_queue = None
+# ワーカープロセス間で共有する認証ブレーカーのカウンタ（_init_worker が設定）
+_breaker_state = None
 
 DEFAULT_CONFIG = "config.ini"
+# ホスト以外の設定セクションの接頭辞（例: [limit:osaka-wan], [timeout:ex2300]）
+LIMIT_PREFIX = "limit:"
+TIMEOUT_PREFIX = "timeout:"
+RESERVED_PREFIXES = (LIMIT_PREFIX, TIMEOUT_PREFIX)
+# パッケージを SCP でコピーするサブコマンド（run のステップ名も同じ）
+COPY_SUBCOMMANDS = ("upgrade", "copy", "install")
+# 接続リトライの待ち時間（秒）: base * 2**attempt を上限で打ち切り、full jitter
+DEFAULT_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
 
 
 def get_default_config():
@@ -46,7 +81,8 @@ def read_config():
     if len(config.sections()) == 0:
         print(args.config, "is empty")
         return True
-    for section in config.sections():
+    timeouts.check_config(config)
+    for section in host_sections():
         if config.has_option(section, "host"):
             host = config.get(section, "host")
         else:
@@ -61,10 +97,33 @@ def read_config():
     return False
 
 
-def connect(hostname):
-    """Open NETCONF connection to a device."""
+def host_sections() -> list[str]:
+    """Return config sections that describe hosts (not reserved sections)."""
+    return [s for s in config.sections() if not s.startswith(RESERVED_PREFIXES)]
+
+
+def connect(hostname, facts=None):
+    """Open NETCONF connection to a device.
+
+    :param facts: fact names to gather at login, or None for the facts
+        kept in the facts cache. PyEZ gathers facts lazily, so only these
+        are fetched (in the ``facts`` phase); facts that are not listed
+        are still fetched on first access.
+    """
     if args.debug:
         print("connect: start")
+    credential = _credential(hostname)
+    if breaker is not None and breaker.is_tripped(credential):
+        breaker.observe_skip(hostname)
+        print(f"Skipped: {breaker.reason(credential)}")
+        return True, None
+    if session_pool is not None:
+        dev = session_pool.checkout(_session_key(hostname))
+        if dev is not None:
+            if args.debug:
+                print("connect: reuse pooled session")
+            _instrument(hostname, dev)
+            return False, dev
     dev = Device(
         host=config.get(hostname, "host"),
         port=int(config.get(hostname, "port")),
@@ -73,34 +132,66 @@ def connect(hostname):
         ssh_private_key_file=os.path.expanduser(config.get(hostname, "sshkey")),
         huge_tree=config.getboolean(hostname, "huge_tree", fallback=False),
     )
+    _instrument(hostname, dev)
+    retries = get_connect_retries(hostname)
+    backoff = config.getfloat(hostname, "connect_backoff", fallback=DEFAULT_BACKOFF)
     err = None
-    try:
-        dev.open()
-        err = False
-    except ConnectAuthError as e:
-        print("Authentication credentials fail to login: {0}".format(e))
-        dev = None
-        err = True
-    except ConnectRefusedError as e:
-        print("NETCONF Connection refused: {0}".format(e))
-        dev = None
-        err = True
-    except ConnectTimeoutError as e:
-        print("Connection timeout: {0}".format(e))
-        dev = None
-        err = True
-    except ConnectError as e:
-        print("Cannot connect to device: {0}".format(e))
-        dev = None
-        err = True
-    except ConnectUnknownHostError as e:
-        print("Unknown Host: {0}".format(e))
+    for attempt in range(retries + 1):
+        retryable = False
+        start = time.monotonic()
+        try:
+            dev.open()
+            err = False
+            # 先の試行で記録したエラーを消す
+            report.recovered()
+            report.connected(time.monotonic() - start)
+            if breaker is not None:
+                breaker.observe_success(credential)
+            if limiter is not None:
+                limiter.observe_connect(time.monotonic() - start)
+                _watch_rpc_timeouts(dev)
+            _gather_facts(hostname, dev, cache.FACTS_KEYS if facts is None else facts)
+        except ConnectAuthError as e:
+            print("Authentication credentials fail to login: {0}".format(e))
+            report.failed(e)
+            err = True
+            if breaker is not None:
+                breaker.observe_auth_failure(hostname, credential)
+        except ConnectRefusedError as e:
+            print("NETCONF Connection refused: {0}".format(e))
+            report.failed(e)
+            err = True
+            retryable = True
+            if limiter is not None:
+                limiter.observe_failure()
+        except ConnectTimeoutError as e:
+            print("Connection timeout: {0}".format(e))
+            report.failed(e)
+            err = True
+            retryable = True
+            if limiter is not None:
+                limiter.observe_failure()
+        except ConnectError as e:
+            print("Cannot connect to device: {0}".format(e))
+            report.failed(e)
+            err = True
+        except ConnectUnknownHostError as e:
+            print("Unknown Host: {0}".format(e))
+            report.failed(e)
+            err = True
+        except Exception as e:
+            print(e)
+            report.failed(e)
+            err = True
+        if not err or not retryable or attempt == retries:
+            break
+        if breaker is not None and breaker.is_tripped(credential):
+            break
+        delay = backoff_delay(attempt, backoff)
+        print(f"connect: retry {attempt + 1}/{retries} in {delay:.1f}s")
+        time.sleep(delay)
+    if err:
         dev = None
-        err = True
-    except Exception as e:
-        print(e)
-        dev = None
-        err = True
     if args.debug:
         print("connect: err=", err, "dev=", dev)
     if args.debug:
@@ -108,6 +199,337 @@ def connect(hostname):
     return err, dev
 
 
+def run_steps(hostname, steps, facts=None, header=True) -> int:
+    """Run steps in order on one NETCONF session, stopping at the first failure.
+
+    :param steps: list of ``(name, func)``; each ``func(hostname, dev)``
+        returns 0 on success. Step names are printed when there is more
+        than one step.
+    :param facts: facts to gather at login (see :func:`connect`).
+    :param header: print ``# hostname`` once connected.
+    :returns: 0 on success, otherwise the failing step's return value
+        (1 on connect failure or exception).
+    """
+    with report.phase("connect"):
+        err, dev = connect(hostname, facts=facts)
+    if err or dev is None:
+        return 1
+    try:
+        if header:
+            print(f"# {hostname}")
+        for name, func in steps:
+            if len(steps) > 1:
+                print(f"## {name}")
+            with report.phase(name):
+                ret = func(hostname, dev)
+            if ret != 0:
+                if len(steps) > 1:
+                    print(f"## {name} failed, remaining steps skipped")
+                return ret
+        return 0
+    except Exception as e:
+        logger.error(f"{hostname}: {e}")
+        report.failed(e)
+        return 1
+    finally:
+        release(hostname, dev)
+
+
+def _instrument(hostname, dev):
+    """Wrap dev.execute for --trace / --profile-rpc when enabled."""
+    if trace.enabled():
+        trace.instrument(dev)
+    if rpcprofile.enabled():
+        rpcprofile.instrument(dev, hostname)
+
+
+def _session_key(hostname):
+    return (
+        config.get(hostname, "host"),
+        config.get(hostname, "port"),
+        config.get(hostname, "id"),
+    )
+
+
+def invalidate_probes(dev):
+    """Forget the probe results memoized on this session."""
+    vars(dev).pop("_junos_ops_probes", None)
+
+
+def release(hostname, dev):
+    """Close the session, or hand it back to the daemon's session pool."""
+    # プールされたセッションを次のジョブが使うときは機器の状態が変わっている
+    invalidate_probes(dev)
+    if session_pool is not None:
+        session_pool.checkin(_session_key(hostname), dev)
+        return
+    try:
+        dev.close()
+    except (ConnectClosedError, Exception):
+        pass
+
+
+def get_connect_retries(hostname) -> int:
+    """Return how many times a failed connect is retried for this host.
+
+    ``--retries`` wins over ``connect_retries`` in config.ini (default 0).
+    """
+    retries = getattr(args, "retries", None)
+    if retries is None:
+        retries = config.getint(hostname, "connect_retries", fallback=0)
+    return max(retries, 0)
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+    """Exponential backoff with full jitter for the given retry attempt."""
+    return random.uniform(0, min(MAX_BACKOFF, base * 2**attempt))
+
+
+class AuthBreaker:
+    """Per-credential circuit breaker for authentication failures.
+
+    Credentials are ``(id, pw, sshkey)`` of the host in config.ini. After
+    ``threshold`` consecutive ``ConnectAuthError`` with one credential (no
+    successful login with it in between) that credential is assumed
+    wrong: the breaker trips for it, and every later connect using it
+    fails immediately without logging in. Hosts with other credentials
+    are not affected.
+
+    With ``--processes`` the counters live in a :mod:`multiprocessing`
+    manager (see :meth:`share`), so the threshold holds for the whole run.
+    """
+
+    def __init__(self, threshold: int, shared=None):
+        self.threshold = threshold
+        self.failures = []
+        self.skipped = []
+        if shared is None:
+            self._consecutive = {}
+            # 作動した認証情報 → ユーザー名（表示用）
+            self._tripped = {}
+            self._lock = threading.Lock()
+        else:
+            self._consecutive, self._tripped, self._lock = shared
+
+    @property
+    def tripped(self) -> bool:
+        """True if the breaker has tripped for any credential."""
+        return len(self._tripped) > 0
+
+    @property
+    def users(self) -> list:
+        """User names of the tripped credentials."""
+        return list(self._tripped.values())
+
+    def is_tripped(self, credential) -> bool:
+        with self._lock:
+            return credential in self._tripped
+
+    def observe_success(self, credential):
+        with self._lock:
+            self._consecutive[credential] = 0
+
+    def observe_auth_failure(self, hostname, credential):
+        with self._lock:
+            self.failures.append(hostname)
+            count = self._consecutive.get(credential, 0) + 1
+            self._consecutive[credential] = count
+            if credential not in self._tripped and count >= self.threshold:
+                self._tripped[credential] = credential[0]
+                logger.warning(f"circuit breaker: {self.reason(credential)}")
+
+    def observe_skip(self, hostname):
+        with self._lock:
+            self.skipped.append(hostname)
+
+    def share(self, manager):
+        """Move the counters into manager for worker processes to update.
+
+        :returns: the shared state to pass to :func:`setup_breaker` in the
+            workers.
+        """
+        with self._lock:
+            consecutive = manager.dict(self._consecutive)
+            tripped = manager.dict(self._tripped)
+        self._consecutive, self._tripped = consecutive, tripped
+        self._lock = manager.Lock()
+        return self._consecutive, self._tripped, self._lock
+
+    def unshare(self):
+        """Copy the counters back from the manager before it shuts down.
+
+        Called after all workers have exited, without taking the shared
+        lock: a terminated worker may have died holding it.
+        """
+        self._consecutive = dict(self._consecutive)
+        self._tripped = dict(self._tripped)
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> tuple:
+        """Return the hosts that failed or were skipped in this process."""
+        with self._lock:
+            return list(self.failures), list(self.skipped)
+
+    def merge(self, more: tuple):
+        """Add the hosts reported by a worker process."""
+        failures, skipped = more
+        self.failures.extend(failures)
+        self.skipped.extend(skipped)
+
+    def reason(self, credential=None) -> str:
+        users = [credential[0]] if credential is not None else self.users
+        return (
+            f"{self.threshold} consecutive authentication failures as "
+            f"{', '.join(users)}, hosts using these credentials skipped"
+        )
+
+
+def _credential(hostname) -> tuple:
+    """Return the login credential of a host, the key of the auth breaker."""
+    return (
+        config.get(hostname, "id"),
+        config.get(hostname, "pw", fallback=None),
+        config.get(hostname, "sshkey", fallback=None),
+    )
+
+
+def setup_breaker(shared=None):
+    """Create the auth-failure circuit breaker from ``args``, or clear it.
+
+    ``--max-auth-failures 0`` disables the breaker.
+
+    :param shared: counters from :meth:`AuthBreaker.share` (worker processes).
+    """
+    global breaker
+    threshold = getattr(args, "max_auth_failures", 0) or 0
+    breaker = AuthBreaker(threshold, shared) if threshold > 0 else None
+    return breaker
+
+
+def _gather_facts(hostname, dev, keys):
+    """Fetch the facts in keys and record them in the on-disk facts cache."""
+    if not keys:
+        return
+    try:
+        # facts は参照時に RPC で取得されるため、ここで取得時間を計測する
+        with report.phase("facts"):
+            gathered = {key: dev.facts[key] for key in keys}
+    except Exception as e:
+        # 失敗した facts は参照時に取り直される
+        logger.warning(f"{hostname}: facts not gathered: {e}")
+        return
+    keys = [key for key in cache.FACTS_KEYS if key in gathered]
+    if not keys:
+        return
+    try:
+        cache.store_facts(hostname, {key: gathered[key] for key in keys}, keys)
+    except Exception as e:
+        logger.warning(f"{hostname}: facts cache not updated: {e}")
+
+
+async def _probe_one(hostname, timeout, semaphore):
+    """Open and close one TCP connection to the host's NETCONF port."""
+    host = config.get(hostname, "host")
+    port = int(config.get(hostname, "port"))
+    async with semaphore:
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), timeout
+            )
+        except asyncio.TimeoutError:
+            return f"timeout after {timeout}s"
+        except OSError as e:
+            return e.strerror or str(e)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return None
+
+
+async def _probe_all(targets, timeout, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    reasons = await asyncio.gather(
+        *(_probe_one(target, timeout, semaphore) for target in targets)
+    )
+    return dict(zip(targets, reasons))
+
+
+def probe_targets(targets, timeout=3.0, concurrency=512) -> dict[str, str | None]:
+    """TCP-probe the NETCONF port of every target concurrently.
+
+    :returns: dict of target to None (reachable) or the failure reason.
+    """
+    if not targets:
+        return {}
+    return asyncio.run(_probe_all(targets, timeout, concurrency))
+
+
+def _watch_rpc_timeouts(dev):
+    """Report RPC timeouts on this session to the adaptive limiter."""
+    execute = dev.execute
+
+    def _execute(*vargs, **kvargs):
+        try:
+            return execute(*vargs, **kvargs)
+        except RpcTimeoutError:
+            if limiter is not None:
+                limiter.observe_failure()
+            raise
+
+    dev.execute = _execute
+
+
+class AdaptiveLimiter:
+    """AIMD controller for the number of hosts in flight.
+
+    The limit starts at ``floor`` and grows by one for every fast connect.
+    It shrinks by one when connect latency exceeds ``slowdown`` times the
+    best latency seen so far, and is halved on connect timeouts, refusals
+    and RPC timeouts. It always stays within ``[floor, ceiling]``.
+    """
+
+    def __init__(self, floor: int, ceiling: int, slowdown: float = 3.0):
+        self.floor = max(floor, 1)
+        self.ceiling = max(ceiling, self.floor)
+        self.slowdown = slowdown
+        self.limit = self.floor
+        self._best = None
+        self._lock = threading.Lock()
+
+    def _set(self, limit: int):
+        limit = min(max(limit, self.floor), self.ceiling)
+        if limit != self.limit:
+            logger.debug(f"adaptive: limit {self.limit} -> {limit}")
+            self.limit = limit
+
+    def observe_connect(self, seconds: float):
+        """Feed one successful connect latency."""
+        with self._lock:
+            if self._best is None or seconds < self._best:
+                self._best = seconds
+            if seconds > self._best * self.slowdown:
+                self._set(self.limit - 1)
+            else:
+                self._set(self.limit + 1)
+
+    def observe_failure(self):
+        """Feed one connect timeout/refusal or RPC timeout."""
+        with self._lock:
+            self._set(self.limit // 2)
+
+
+def setup_limiter(ceiling: int):
+    """Create the adaptive limiter from ``args`` (``--adaptive``), or clear it."""
+    global limiter
+    if getattr(args, "adaptive", False):
+        limiter = AdaptiveLimiter(getattr(args, "min_workers", 1), ceiling)
+    else:
+        limiter = None
+    return limiter
+
+
 def _get_host_tags(section: str) -> set[str]:
     """Return the set of tags for a config section."""
     raw = config.get(section, "tags", fallback="")
@@ -119,14 +541,26 @@ def _get_host_tags(section: str) -> set[str]:
 def _filter_by_tags(required_tags: set[str]) -> list[str]:
     """Return sections whose tags are a superset of required_tags (AND)."""
     matched = []
-    for section in config.sections():
+    for section in host_sections():
         if required_tags <= _get_host_tags(section):
             matched.append(section)
     return matched
 
 
 def get_targets():
-    """Return target host list from CLI args, tags, or config sections."""
+    """Return target host list from CLI args, tags, or config sections.
+
+    With ``--where``, the list is further narrowed by cached facts.
+    """
+    targets = _select_targets()
+    where = getattr(args, "where", None)
+    if where:
+        targets = _filter_by_facts(targets, where)
+    return targets
+
+
+def _select_targets():
+    """Resolve targets from CLI hostnames and ``--tags``."""
     tags = getattr(args, "tags", None)
     has_hosts = len(args.specialhosts) > 0
 
@@ -139,7 +573,7 @@ def get_targets():
     # パターン1: --tags なし & hosts なし → 全セクション（現行動作）
     if not required_tags and not has_hosts:
         targets = []
-        for i in config.sections():
+        for i in host_sections():
             tmp = config.get(i, "host")
             logger.debug(f"{i=} {tmp=}")
             if tmp is not None:
@@ -153,7 +587,7 @@ def get_targets():
     if not required_tags and has_hosts:
         targets = []
         for i in args.specialhosts:
-            if config.has_section(i):
+            if config.has_section(i) and i in host_sections():
                 tmp = config.get(i, "host")
             else:
                 print(i, "is not found in", args.config)
@@ -181,7 +615,7 @@ def get_targets():
             targets.append(i)
     # 明示指定ホストを追加（存在チェック付き）
     for i in args.specialhosts:
-        if not config.has_section(i):
+        if not config.has_section(i) or i not in host_sections():
             print(i, "is not found in", args.config)
             sys.exit(1)
         if i not in seen:
@@ -190,6 +624,141 @@ def get_targets():
     return targets
 
 
+_WHERE_RE = re.compile(r"^\s*(\w+)\s*(<=|>=|!=|=|<|>)\s*(.*?)\s*$")
+
+
+def where_type(expr: str) -> tuple[str, str, str]:
+    """Parse ``--where`` expressions like ``model=EX2300*`` for argparse."""
+    m = _WHERE_RE.match(expr)
+    if m is None or not m.group(3):
+        raise argparse.ArgumentTypeError(
+            f"{expr}: must be FIELD OP VALUE (OP: = != < <= > >=). ex. version<20.4"
+        )
+    return m.group(1).lower(), m.group(2), m.group(3)
+
+
+def _version_key(value: str) -> LooseVersion:
+    # upgrade.compare_version と同じ正規化（-S を 00 に置換）
+    return LooseVersion(value.replace("-S", "00"))
+
+
+def _fact_value(facts: dict, field: str):
+    if field == "vc_members":
+        return len(facts.get("model_info") or {})
+    return facts.get(field)
+
+
+def match_where(facts: dict, field: str, op: str, value: str) -> bool:
+    """Evaluate one ``--where`` condition against cached facts.
+
+    ``=`` and ``!=`` are case-insensitive glob matches. Ordering operators
+    compare ``version`` as JUNOS versions, numbers numerically, and other
+    values as strings.
+    """
+    actual = _fact_value(facts, field)
+    if actual is None:
+        return False
+    if op in ("=", "!="):
+        matched = fnmatch.fnmatchcase(str(actual).upper(), value.upper())
+        return matched if op == "=" else not matched
+    try:
+        if field == "version":
+            left, right = _version_key(str(actual)), _version_key(value)
+        elif isinstance(actual, int):
+            left, right = actual, int(value)
+        else:
+            left, right = str(actual), value
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        if op == ">":
+            return left > right
+        return left >= right
+    except (TypeError, ValueError):
+        return False
+
+
+def _filter_by_facts(targets, where) -> list[str]:
+    """Keep targets whose cached facts satisfy every ``--where`` condition."""
+    ttl = config.getfloat("DEFAULT", "facts_ttl", fallback=cache.DEFAULT_FACTS_TTL)
+    cached = cache.load_facts(ttl)
+    missing = [t for t in targets if t not in cached]
+    if missing:
+        print(f"{len(missing)} hosts have no fresh cached facts and were skipped:",
+              ", ".join(missing))
+    matched = [
+        t for t in targets
+        if t in cached and all(match_where(cached[t], *cond) for cond in where)
+    ]
+    if not matched:
+        print("no hosts matched:", " ".join("".join(cond) for cond in where))
+        sys.exit(1)
+    return matched
+
+
+def get_tag_limits(subcommand=None, steps=()) -> dict[str, int]:
+    """Return per-tag concurrency caps from ``[limit:TAG]`` sections.
+
+    A ``<subcommand> = N`` key caps that subcommand (or ``run`` step)
+    only, and ``copy = N`` caps every subcommand or step that copies the
+    package (:data:`COPY_SUBCOMMANDS`). When several of these keys apply
+    the smallest wins; they take precedence over ``workers = N``, which
+    caps every subcommand.
+    """
+    names = {name for name in (subcommand, *steps) if name}
+    if names & set(COPY_SUBCOMMANDS):
+        names.add("copy")
+    limits = {}
+    for section in config.sections():
+        if not section.startswith(LIMIT_PREFIX):
+            continue
+        tag = section[len(LIMIT_PREFIX):].strip().lower()
+        values = [
+            int(value) for value in
+            (config.get(section, name, fallback=None) for name in sorted(names))
+            if value is not None
+        ]
+        if not values:
+            value = config.get(section, "workers", fallback=None)
+            if value is None:
+                continue
+            values = [int(value)]
+        # 0 以下はデッドロックになるため 1 に丸める
+        limits[tag] = max(min(values), 1)
+    return limits
+
+
+def setup_tag_limits(subcommand=None, steps=()):
+    """Load per-tag caps for subcommand (and ``run`` steps) into ``tag_limits``."""
+    global tag_limits
+    tag_limits = get_tag_limits(subcommand, steps)
+    if tag_limits:
+        logger.debug(f"tag limits: {tag_limits}")
+    return tag_limits
+
+
+def _admit(target, running, host_tags) -> bool:
+    """Return True if starting target keeps every per-tag cap."""
+    for tag in host_tags[target]:
+        cap = tag_limits.get(tag)
+        if cap is None:
+            continue
+        if sum(1 for t in running if tag in host_tags[t]) >= cap:
+            return False
+    return True
+
+
+def _capped_tags(targets) -> dict[str, set[str]]:
+    """Map each target to its tags that have a per-tag cap."""
+    if not tag_limits:
+        return {target: set() for target in targets}
+    return {
+        target: _get_host_tags(target) & tag_limits.keys()
+        for target in targets
+    }
+
+
 def load_commands(filepath: str) -> list[str]:
     """Load command lines from a file, stripping blank lines and comments.
 
@@ -202,15 +771,32 @@ def load_commands(filepath: str) -> list[str]:
         ]
 
 
-def run_parallel(func, targets, max_workers=1):
-    """Run a function against targets using ThreadPoolExecutor.
+def run_parallel(func, targets, max_workers=1, processes=1, on_done=None):
+    """Run a function against targets and collect results per target.
+
+    :param processes: when greater than 1, shard targets across that many
+        worker processes (see :func:`_run_processes`).
+    :param on_done: called as ``on_done(target, ret)`` as soon as each
+        target finishes (inside the worker process with ``processes``, so
+        it must be picklable there).
 
     When max_workers=1, runs serially for backward compatibility.
     """
+    if on_done is None:
+        on_done = _ignore_done
+    if processes > 1 and len(targets) > 1:
+        return _run_processes(func, targets, max_workers, processes, on_done)
+
+    if limiter is not None:
+        return _run_scheduled(func, targets, limiter.ceiling, on_done)
+    if tag_limits and max_workers > 1:
+        return _run_scheduled(func, targets, max_workers, on_done)
+
     if max_workers <= 1:
         results = {}
         for target in targets:
             results[target] = func(target)
+            on_done(target, results[target])
         return results
 
     with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -226,4 +812,223 @@ def run_parallel(func, targets, max_workers=1):
             except Exception as e:
                 logger.error(f"{target} generated an exception: {e}")
                 results[target] = 1
+            on_done(target, results[target])
         return results
+
+
+def _ignore_done(target, ret):
+    pass
+
+
+def _run_scheduled(func, targets, max_workers, on_done=_ignore_done):
+    """Start targets one by one while the concurrency limits allow.
+
+    The global limit is the adaptive limit (``--adaptive``) or max_workers.
+    A host is started only if every per-tag cap that applies to it has
+    room; blocked hosts are skipped in favour of later ones. Hosts already
+    running are never interrupted; when a limit shrinks, new hosts simply
+    wait until enough running hosts have finished.
+    """
+    results = {}
+    pending = list(targets)
+    running = {}
+    host_tags = _capped_tags(targets)
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            limit = limiter.limit if limiter is not None else max_workers
+            while pending and len(running) < limit:
+                started = running.values()
+                target = next(
+                    (t for t in pending if _admit(t, started, host_tags)), None
+                )
+                if target is None:
+                    break
+                pending.remove(target)
+                running[executor.submit(func, target)] = target
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                target = running.pop(future)
+                try:
+                    results[target] = future.result()
+                except Exception as e:
+                    logger.error(f"{target} generated an exception: {e}")
+                    results[target] = 1
+                on_done(target, results[target])
+    return results
+
+
+def _init_worker(worker_args, done_queue=None, breaker_state=None, buckets=None):
+    """Re-create ``args`` and ``config`` inside a worker process.
+
+    :param done_queue: queue to which :func:`_run_shard` reports each
+        finished host as ``(target, ret)``.
+    :param breaker_state: auth breaker counters shared by all workers
+        (:meth:`AuthBreaker.share`).
+    :param buckets: copy bandwidth buckets shared by all workers
+        (:func:`junos_ops.bandwidth.share`).
+    """
+    global args, _done_queue, _breaker_state
+    args = worker_args
+    _done_queue = done_queue
+    _breaker_state = breaker_state
+    if buckets is not None:
+        bandwidth.adopt(buckets)
+    if args is not None:
+        read_config()
+        if getattr(args, "report", None) or getattr(args, "metrics", None):
+            report.enable()
+        if getattr(args, "trace", None):
+            trace.enable()
+        if getattr(args, "profile_rpc", False):
+            rpcprofile.enable()
+        if getattr(args, "profile", None):
+            profiling.start(args.profile)
+
+
+def _run_shard(func, shard, max_workers, on_done=None):
+    """Run one shard of targets inside a worker process.
+
+    :returns: (results, report records, trace spans, RPC samples, auth
+        breaker hosts and copy statistics collected in this process)
+    """
+    setup_limiter(max_workers)
+    setup_breaker(_breaker_state)
+    if args is not None:
+        setup_tag_limits(getattr(args, "subcommand", None), getattr(args, "steps", None) or ())
+
+    def _done(target, ret):
+        if on_done is not None:
+            on_done(target, ret)
+        if _done_queue is not None:
+            _done_queue.put((target, ret))
+
+    results = run_parallel(func, shard, max_workers=max_workers, on_done=_done)
+    if profiling.active():
+        profiling.save_part(args.profile_output)
+    return (
+        results, report.snapshot(), trace.snapshot(), rpcprofile.snapshot(),
+        breaker.snapshot() if breaker is not None else ([], []),
+        bandwidth.snapshot(),
+    )
+
+
+def _shard_targets(targets, processes) -> list[list[str]]:
+    """Split targets into at most ``processes`` balanced shards.
+
+    Hosts linked by any capped tag form one group (union-find); each group
+    goes whole to the currently smallest shard.
+    """
+    host_tags = _capped_tags(targets)
+    parent = {target: target for target in targets}
+
+    def _find(t):
+        while parent[t] != t:
+            parent[t] = parent[parent[t]]
+            t = parent[t]
+        return t
+
+    owner = {}
+    for target in targets:
+        for tag in host_tags[target]:
+            if tag in owner:
+                parent[_find(target)] = _find(owner[tag])
+            else:
+                owner[tag] = target
+
+    groups = {}
+    for target in targets:
+        groups.setdefault(_find(target), []).append(target)
+
+    shards = [[] for _ in range(processes)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return [shard for shard in shards if shard]
+
+
+def _run_processes(func, targets, max_workers, processes, on_done=_ignore_done):
+    """Shard targets across worker processes, each with its own pool.
+
+    ``max_workers`` is the total concurrency and is split evenly across
+    the processes; with ``--adaptive`` each process runs its own limiter.
+    func must be picklable (a module-level function such as the ``cmd_*``
+    entry points). Results are merged into one dict.
+
+    Hosts sharing a capped tag are kept in the same shard so that per-tag
+    caps stay global across processes.
+
+    If a worker process fails, only the hosts of its shard that had not
+    finished yet count as failed (and are passed to on_done); the others
+    keep the result reported while the worker ran.
+    """
+    shards = _shard_targets(targets, processes)
+    per_process = max(-(-max_workers // len(shards)), 1)
+    logger.debug(f"run_parallel: {len(shards)} processes x {per_process} workers")
+
+    # fork はスレッドを持つ親プロセスで安全でないため spawn を使う
+    ctx = multiprocessing.get_context("spawn")
+    # ワーカーで完了したホストの (target, ret)。ワーカーが異常終了したときに使う。
+    # パイプが詰まってワーカーが止まらないよう、スレッドで読み続ける
+    done_queue = ctx.SimpleQueue()
+    finished = {}
+    workers_done = threading.Event()
+
+    def _drain():
+        # 番兵は送らない: 強制終了されたワーカーが書き込みロックを持ったままだと
+        # 親の put が止まるため、終了はイベントで受け取り、空になるまで読む
+        while True:
+            if not done_queue.empty():
+                target, ret = done_queue.get()
+                finished[target] = ret
+            elif workers_done.wait(0.05) and done_queue.empty():
+                return
+
+    drainer = threading.Thread(target=_drain, name="process-results", daemon=True)
+    drainer.start()
+    # 認証失敗の連続回数は全ワーカーで数える（プロセスごとでは上限が N 倍になる）
+    manager = None
+    breaker_state = None
+    if breaker is not None:
+        manager = ctx.Manager()
+        breaker_state = breaker.share(manager)
+    # 帯域の上限も全ワーカーで1つのバケットを使う（プロセス数で割ると偏りで余る）
+    buckets = bandwidth.share(ctx) if config is not None else None
+    failed = []
+    results = {}
+    with futures.ProcessPoolExecutor(
+        max_workers=len(shards), mp_context=ctx,
+        initializer=_init_worker, initargs=(args, done_queue, breaker_state, buckets),
+    ) as executor:
+        future_to_shard = {
+            executor.submit(_run_shard, func, shard, per_process, on_done): shard
+            for shard in shards
+        }
+        for future in futures.as_completed(future_to_shard):
+            shard = future_to_shard[future]
+            try:
+                (shard_results, shard_records, shard_spans, shard_samples,
+                 shard_breaker, shard_copies) = future.result()
+                results.update(shard_results)
+                report.merge(shard_records)
+                trace.merge(shard_spans)
+                rpcprofile.merge(shard_samples)
+                bandwidth.merge(shard_copies)
+                if breaker is not None:
+                    breaker.merge(shard_breaker)
+            except Exception as e:
+                logger.error(f"worker process for {shard} generated an exception: {e}")
+                failed.append(shard)
+    # 全ワーカーの終了後に知らせるので、それまでの完了通知はすべて読まれる
+    workers_done.set()
+    drainer.join()
+    done_queue.close()
+    if manager is not None:
+        breaker.unshare()
+        manager.shutdown()
+    for shard in failed:
+        for target in shard:
+            if target in finished:
+                results[target] = finished[target]
+            else:
+                results[target] = 1
+                on_done(target, 1)
+    return results
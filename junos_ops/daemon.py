@@ -0,0 +1,424 @@
+"""Daemon mode: keep warm NETCONF sessions and serve CLI runs over a UNIX socket.
+
+The client side (:func:`forward` and the console entry point :func:`main`)
+uses only the standard library, so a forwarded command does not pay for
+importing PyEZ, reading config.ini or opening NETCONF sessions. Only the
+short read-only subcommands in :data:`SERVED_SUBCOMMANDS` are forwarded;
+everything else runs in the client process.
+
+Protocol (JSON lines): the client sends ``{"argv": [...], "cwd": "...",
+"env": {...}, "tty": bool}``; the daemon streams ``{"out": text}`` / ``{"err": text}`` and finishes with
+``{"exit": code}``.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import time
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+SOCKET_NAME = "daemon.sock"
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_KEEPALIVE = 60
+# この環境変数が設定されていればデーモンへ転送しない
+NO_DAEMON_ENV = "JUNOS_OPS_NO_DAEMON"
+# デーモンで実行するサブコマンド（短時間で終わる読み取り専用のもの）。
+# upgrade・reboot・rsi などはジョブを長時間占有し、クライアントの Ctrl-C でも
+# 止められないため、常にクライアントのプロセスで実行する
+SERVED_SUBCOMMANDS = ("facts", "version", "show", "ls")
+# クライアントの値でジョブを実行する環境変数（config.ini・キャッシュ・ジャーナルの場所）
+FORWARDED_ENV = ("HOME", "XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_STATE_HOME")
+
+# ジョブは common.args / config や sys.stdout を共有するため1件ずつ実行する
+_job_lock = threading.Lock()
+_server = None
+
+
+def socket_path() -> str:
+    """Return the daemon socket path (XDG_RUNTIME_DIR, else the temp dir)."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "junos-ops", SOCKET_NAME)
+    return os.path.join(tempfile.gettempdir(), f"junos-ops-{os.getuid()}", SOCKET_NAME)
+
+
+def _private(path, kind) -> bool:
+    """Return True if path is a kind (stat.S_IS*) owned by us with no group/other access."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        kind(st.st_mode)
+        and st.st_uid == os.getuid()
+        and stat.S_IMODE(st.st_mode) & 0o077 == 0
+    )
+
+
+# --- client ---
+
+
+def _forwardable(argv) -> bool:
+    if not argv or argv[0] not in SERVED_SUBCOMMANDS:
+        return False
+    if os.environ.get(NO_DAEMON_ENV) or os.environ.get("_ARGCOMPLETE"):
+        return False
+    return not any(a in ("-h", "--help", "--version") for a in argv)
+
+
+def forward(argv, path=None):
+    """Run argv on a running daemon, streaming its output.
+
+    :returns: the exit code, or None if no daemon is listening.
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    # 他のユーザーが用意したディレクトリやソケットには argv を送らない
+    if not (_private(os.path.dirname(path), stat.S_ISDIR) and _private(path, stat.S_ISSOCK)):
+        print(
+            f"junos-ops: ignoring daemon socket {path}: not private to this user",
+            file=sys.stderr,
+        )
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # 古いソケットファイルが残っているだけ
+        sock.close()
+        return None
+    with sock, sock.makefile("rw", encoding="utf-8") as stream:
+        request = {
+            "argv": list(argv),
+            "cwd": os.getcwd(),
+            "env": {k: os.environ[k] for k in FORWARDED_ENV if k in os.environ},
+            "tty": sys.stdout.isatty(),
+        }
+        stream.write(json.dumps(request) + "\n")
+        stream.flush()
+        for line in stream:
+            msg = json.loads(line)
+            if "out" in msg:
+                sys.stdout.write(msg["out"])
+                sys.stdout.flush()
+            elif "err" in msg:
+                sys.stderr.write(msg["err"])
+                sys.stderr.flush()
+            elif "exit" in msg:
+                return msg["exit"]
+    print("junos-ops: daemon closed the connection", file=sys.stderr)
+    return 1
+
+
+def main():
+    """Console entry point: use a running daemon if any, else run in-process."""
+    argv = sys.argv[1:]
+    if _forwardable(argv):
+        ret = forward(argv)
+        if ret is not None:
+            return ret
+    from junos_ops import cli
+    return cli.main()
+
+
+# --- server ---
+
+
+def _close(dev):
+    try:
+        dev.close()
+    except Exception:
+        pass
+
+
+class SessionPool:
+    """Open Device sessions kept between jobs, keyed by (host, port, user).
+
+    A session is checked out for the duration of one host's work, so a
+    host is never driven by two jobs at once. Sessions idle longer than
+    ``idle_timeout`` seconds are closed, and idle sessions get a cheap RPC
+    every ``keepalive`` seconds so the device and middleboxes keep them.
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, keepalive=DEFAULT_KEEPALIVE):
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        # key -> (dev, 最終使用時刻, 最終キープアライブ時刻)
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._idle)
+
+    def checkout(self, key):
+        """Take the idle session for key, or None if there is none."""
+        with self._lock:
+            entry = self._idle.pop(key, None)
+        if entry is None:
+            return None
+        dev = entry[0]
+        if not dev.connected:
+            _close(dev)
+            return None
+        return dev
+
+    def checkin(self, key, dev):
+        """Return a session to the pool (closed if one is already pooled)."""
+        if not dev.connected:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = (dev, now, now)
+                return
+        _close(dev)
+
+    def maintain(self):
+        """Evict idle sessions and send keepalives; called periodically."""
+        now = time.monotonic()
+        expired = []
+        due = []
+        with self._lock:
+            for key, (dev, used, alive) in list(self._idle.items()):
+                if now - used >= self.idle_timeout:
+                    expired.append(dev)
+                    del self._idle[key]
+                elif now - alive >= self.keepalive:
+                    due.append((key, dev, used))
+                    del self._idle[key]
+        for dev in expired:
+            logger.debug(f"daemon: evict idle session {dev.hostname}")
+            _close(dev)
+        for key, dev, used in due:
+            try:
+                dev.rpc.get_system_uptime_information()
+            except Exception as e:
+                logger.info(f"daemon: keepalive failed for {dev.hostname}: {e}")
+                _close(dev)
+                continue
+            with self._lock:
+                if key not in self._idle:
+                    self._idle[key] = (dev, used, time.monotonic())
+                    continue
+            _close(dev)
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._idle.values())
+            self._idle.clear()
+        for dev, _, _ in entries:
+            _close(dev)
+
+
+class _Channel:
+    """Serialize JSON-line messages to one client; ignore a vanished client."""
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._lock = threading.Lock()
+        self._broken = False
+
+    def send(self, msg):
+        data = (json.dumps(msg) + "\n").encode("utf-8")
+        with self._lock:
+            if self._broken:
+                return
+            try:
+                self._wfile.write(data)
+                self._wfile.flush()
+            except OSError:
+                self._broken = True
+
+
+class _Stream:
+    """File-like object that forwards writes as ``{kind: text}`` messages."""
+
+    def __init__(self, channel, kind, tty=False):
+        self._channel = channel
+        self._kind = kind
+        self._tty = tty
+
+    def write(self, text):
+        if text:
+            self._channel.send({self._kind: text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self._tty
+
+
+@contextlib.contextmanager
+def _client_environ(env):
+    """Set FORWARDED_ENV to the client's values for the duration of a job."""
+    saved = {k: os.environ.get(k) for k in FORWARDED_ENV}
+    try:
+        for k in FORWARDED_ENV:
+            if k in env:
+                os.environ[k] = env[k]
+            else:
+                os.environ.pop(k, None)
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def run_job(argv, cwd, out, err, env=None) -> int:
+    """Run one CLI invocation in-process with output sent to out/err.
+
+    :param env: the client's values of :data:`FORWARDED_ENV` (None keeps
+        the daemon's environment).
+    """
+    from junos_ops import bandwidth
+    from junos_ops import cli
+    from junos_ops import timeouts
+
+    with _job_lock:
+        previous = os.getcwd()
+        handler = logging.StreamHandler(out)
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        try:
+            os.chdir(cwd)
+            # 前のジョブの状態を持ち越さない
+            bandwidth.reset()
+            timeouts.clear_cache()
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err), \
+                    _client_environ(env) if env is not None else contextlib.nullcontext():
+                try:
+                    ret = cli.main(argv)
+                except SystemExit as e:
+                    if e.code is None:
+                        ret = 0
+                    elif isinstance(e.code, int):
+                        ret = e.code
+                    else:
+                        print(e.code, file=sys.stderr)
+                        ret = 1
+        except Exception as e:
+            logger.exception(f"daemon: job {argv} failed")
+            err.write(f"junos-ops daemon: {e}\n")
+            ret = 1
+        finally:
+            root.removeHandler(handler)
+            os.chdir(previous)
+    return ret or 0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        channel = _Channel(self.wfile)
+        argv = request.get("argv", [])
+        if not argv or argv[0] not in SERVED_SUBCOMMANDS:
+            served = ", ".join(SERVED_SUBCOMMANDS)
+            channel.send({"err": f"junos-ops daemon: only {served} are served\n"})
+            channel.send({"exit": 2})
+            return
+        tty = bool(request.get("tty"))
+        code = run_job(
+            argv,
+            request.get("cwd") or os.getcwd(),
+            _Stream(channel, "out", tty),
+            _Stream(channel, "err", tty),
+            request.get("env", {}),
+        )
+        channel.send({"exit": code})
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def shutdown():
+    """Stop a daemon started by :func:`serve` in this process."""
+    if _server is not None:
+        threading.Thread(target=_server.shutdown).start()
+
+
+def serve(path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, keepalive=DEFAULT_KEEPALIVE) -> int:
+    """Run the daemon until SIGTERM or Ctrl-C.
+
+    :returns: 0 on clean shutdown, 1 if another daemon is already running.
+    """
+    global _server
+    from junos_ops import common
+
+    path = path or socket_path()
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if not _private(os.path.dirname(path), stat.S_ISDIR):
+        print(
+            f"junos-ops daemon: {os.path.dirname(path)} must be a directory "
+            "owned by this user with mode 0700"
+        )
+        return 1
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            print(f"junos-ops daemon: already running on {path}")
+            return 1
+        except OSError:
+            os.unlink(path)
+        finally:
+            probe.close()
+
+    pool = SessionPool(idle_timeout, keepalive)
+    common.session_pool = pool
+    # bind() の時点でソケットを所有者のみにする（作成後の chmod では隙間ができる）
+    umask = os.umask(0o177)
+    try:
+        server = _server = _Server(path, _Handler)
+    finally:
+        os.umask(umask)
+
+    stop = threading.Event()
+    interval = max(min(idle_timeout, keepalive) / 2, 1)
+
+    def _maintain():
+        while not stop.wait(interval):
+            try:
+                pool.maintain()
+            except Exception as e:
+                logger.warning(f"daemon: maintenance failed: {e}")
+
+    threading.Thread(target=_maintain, name="session-pool", daemon=True).start()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: shutdown())
+    print(f"junos-ops daemon: listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        pool.close_all()
+        common.session_pool = None
+        _server = None
+    print("junos-ops daemon: stopped")
+    return 0
@@ -0,0 +1,152 @@
+"""Run journal: per-host completion records for ``--resume`` / ``--retry-failed``.
+
+Each run appends JSON lines to ``~/.local/state/junos-ops/runs/RUN_ID.jsonl``
+(``XDG_STATE_HOME``): a header with the subcommand and target list, then
+one record per host as soon as it finishes. Records are written with a
+single ``O_APPEND`` write so threads and ``--processes`` workers can share
+one journal.
+"""
+
+import json
+import os
+import re
+import secrets
+import time
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# 機器を変更するサブコマンド（run はこれらのステップを含む場合）だけを記録する
+CHANGING = ("upgrade", "copy", "install", "rollback", "reboot", "config")
+# 保持するジャーナル数（古いものから削除）
+MAX_RUNS = 100
+# RUN_ID の形式（Journal.create が生成する YYYYmmdd-HHMMSS-xxxx）
+RUN_ID_RE = re.compile(r"\d{8}-\d{6}-[0-9a-f]{4}")
+
+
+def journaled(subcommand, steps=None) -> bool:
+    """Return True if runs of this subcommand are journaled.
+
+    Read-only runs (``facts``, ``show``, ``rsi``, ...) are not, so they do
+    not push the runs worth resuming out of the :data:`MAX_RUNS` window.
+    """
+    if subcommand == "run":
+        return bool(set(steps or ()) & set(CHANGING))
+    return subcommand in CHANGING
+
+
+def journal_dir() -> str:
+    """Return the journal directory (XDG_STATE_HOME, default ~/.local/state)."""
+    xdg = os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+    return os.path.join(xdg, "junos-ops", "runs")
+
+
+def valid_run_id(run_id) -> bool:
+    return isinstance(run_id, str) and RUN_ID_RE.fullmatch(run_id) is not None
+
+
+def _path(run_id: str) -> str:
+    # RUN_ID はコマンドラインから来るため、runs ディレクトリの外を指させない
+    if not valid_run_id(run_id):
+        raise ValueError(f"invalid run id: {run_id!r}")
+    return os.path.join(journal_dir(), f"{run_id}.jsonl")
+
+
+def _runs() -> list[str]:
+    """Return run ids, oldest first."""
+    try:
+        names = os.listdir(journal_dir())
+    except FileNotFoundError:
+        return []
+    return sorted(
+        name[: -len(".jsonl")] for name in names
+        if name.endswith(".jsonl") and valid_run_id(name[: -len(".jsonl")])
+    )
+
+
+def latest() -> str | None:
+    """Return the most recent run id, or None."""
+    runs = _runs()
+    return runs[-1] if runs else None
+
+
+class Journal:
+    """Append-only journal of one run.
+
+    Instances hold only the file path, so :meth:`record` can be passed to
+    worker processes as the ``on_done`` callback of ``run_parallel``.
+    """
+
+    def __init__(self, run_id: str):
+        """:raises ValueError: when run_id is not in the run id format."""
+        self.run_id = run_id
+        self.path = _path(run_id)
+
+    @classmethod
+    def create(cls, subcommand, targets, argv) -> "Journal":
+        """Start a new journal and prune old ones."""
+        run_id = time.strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(2)
+        journal = cls(run_id)
+        os.makedirs(journal_dir(), exist_ok=True)
+        journal._append({
+            "run_id": run_id,
+            "subcommand": subcommand,
+            "targets": list(targets),
+            "argv": list(argv),
+            "started": time.time(),
+        })
+        for old in _runs()[:-MAX_RUNS]:
+            try:
+                os.unlink(_path(old))
+            except OSError:
+                pass
+        return journal
+
+    def _append(self, entry: dict):
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def record(self, host, ret):
+        """Record that host finished with exit code ret."""
+        try:
+            self._append({"host": host, "ret": ret, "finished": time.time()})
+        except OSError as e:
+            logger.warning(f"journal: {host} not recorded: {e}")
+
+    def load(self) -> tuple[dict, dict[str, int]]:
+        """Return (header, {host: last exit code}).
+
+        :raises FileNotFoundError: when the run id is unknown.
+        """
+        header = None
+        done = {}
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 中断時に書きかけの行は無視
+                    continue
+                if "host" in entry:
+                    done[entry["host"]] = entry["ret"]
+                elif header is None:
+                    header = entry
+        if header is None:
+            raise FileNotFoundError(self.path)
+        return header, done
+
+
+def select(header, done, mode) -> list[str]:
+    """Return the targets to process again.
+
+    :param mode: ``"resume"`` for hosts without a record, ``"retry-failed"``
+        for hosts whose last record is non-zero.
+    """
+    targets = header["targets"]
+    if mode == "resume":
+        return [t for t in targets if t not in done]
+    return [t for t in targets if done.get(t, 0) != 0]
@@ -0,0 +1,94 @@
+"""Prometheus textfile metrics of a run (``--metrics``).
+
+Built from the host records of :mod:`junos_ops.report` at the end of a
+run and written in the node_exporter textfile collector format. The file
+is replaced atomically, so a scrape never sees a partial file.
+"""
+
+import os
+import time
+
+from junos_ops import report
+
+# ホストごとの所要時間のヒストグラム境界（秒）
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+# 接続時間のヒストグラム境界（秒）
+CONNECT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram(lines, name, help_text, buckets, values, labels):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for bound in buckets:
+        count = sum(1 for v in values if v <= bound)
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {len(values)}")
+    lines.append(f"{name}_sum{_labels(**labels)} {sum(values)}")
+    lines.append(f"{name}_count{_labels(**labels)} {len(values)}")
+
+
+def _gauge(lines, name, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} gauge")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(**labels)} {value}")
+
+
+def build(subcommand, started: float, finished: float | None = None) -> str:
+    """Return the metrics of the run in text exposition format."""
+    finished = finished if finished is not None else time.time()
+    hosts = list(report.snapshot().values())
+    sub = {"subcommand": subcommand or "facts"}
+    ok = sum(1 for r in hosts if r["status"] == 0)
+    failures = {}
+    for r in hosts:
+        if r["status"] != 0:
+            # エラー種別がなければ非0の終了コードとして数える
+            error = r["error"] or "NonZeroExit"
+            failures[error] = failures.get(error, 0) + 1
+
+    lines = []
+    _gauge(lines, "junos_ops_run_last_timestamp_seconds",
+           "Unix time the last run finished.", [(sub, finished)])
+    _gauge(lines, "junos_ops_run_duration_seconds",
+           "Wall-clock duration of the last run.", [(sub, finished - started)])
+    _gauge(lines, "junos_ops_hosts",
+           "Hosts processed in the last run by result.",
+           [({**sub, "result": "ok"}, ok), ({**sub, "result": "failed"}, len(hosts) - ok)])
+    _gauge(lines, "junos_ops_host_failures",
+           "Failed hosts in the last run by error class.",
+           [({**sub, "error": error}, count) for error, count in sorted(failures.items())])
+    _gauge(lines, "junos_ops_copied_bytes",
+           "Bytes copied by SCP in the last run.",
+           [(sub, sum(r["bytes"] for r in hosts))])
+    _histogram(lines, "junos_ops_host_duration_seconds",
+               "Per-host duration in the last run.", DURATION_BUCKETS,
+               [r["duration"] for r in hosts if r["duration"] is not None], sub)
+    _histogram(lines, "junos_ops_connect_seconds",
+               "NETCONF connect latency in the last run.", CONNECT_BUCKETS,
+               [r["connect_time"] for r in hosts if r["connect_time"] is not None], sub)
+    return "\n".join(lines) + "\n"
+
+
+def write(path, subcommand, started: float):
+    """Write the metrics file atomically (temporary file + rename).
+
+    The temporary file does not end in ``.prom``, so node_exporter never
+    reads it.
+    """
+    text = build(subcommand, started)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
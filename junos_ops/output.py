@@ -0,0 +1,167 @@
+"""Per-host output capture for parallel runs (``--output-dir``).
+
+While capture is installed, ``sys.stdout`` is replaced by a proxy that
+sends each write to the buffer of the host running in the current context
+(a context variable set by :class:`Captured`), so concurrent hosts never
+interleave. A host's output is written out in one piece when the host
+finishes: to the real stdout, to ``<output_dir>/<host>.log``, or held for
+:mod:`junos_ops.progress` to print after the run.
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import threading
+
+_buffer = contextvars.ContextVar("junos_ops_output", default=None)
+_lock = threading.Lock()
+# 実行後にまとめて出力するホストの出力（hold=True のとき）: hostname → text
+held = {}
+# hold=True のときのホスト外（メインスレッド等）からの出力
+other = []
+
+
+class _Stdout:
+    """sys.stdout replacement that routes writes to the current host's buffer."""
+
+    def __init__(self, real, hold=False):
+        self.real = real
+        self.hold = hold
+
+    def write(self, text):
+        buf = _buffer.get()
+        if buf is not None:
+            buf.append(text)
+        elif self.hold:
+            with _lock:
+                other.append(text)
+        else:
+            with _lock:
+                self.real.write(text)
+        return len(text)
+
+    def flush(self):
+        if _buffer.get() is None and not self.hold:
+            self.real.flush()
+
+    def isatty(self):
+        return False
+
+
+# 差し替え中のプロキシと、差し替えたログハンドラの元の出力先
+_proxy = None
+_saved_streams = []
+
+
+def install(hold=False) -> bool:
+    """Replace sys.stdout (and log handlers writing to it) with the proxy.
+
+    :returns: False if the proxy was already installed.
+    """
+    global _proxy
+    with _lock:
+        if _proxy is not None:
+            return False
+        held.clear()
+        other.clear()
+        real = sys.stdout
+        _proxy = _Stdout(real, hold=hold)
+        sys.stdout = _proxy
+        # 標準出力へのログもホストごとに捕捉する
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.StreamHandler) and handler.stream is real:
+                _saved_streams.append((handler, handler.setStream(_proxy)))
+    return True
+
+
+def uninstall():
+    """Restore sys.stdout and the log handlers."""
+    global _proxy
+    with _lock:
+        if _proxy is None:
+            return
+        sys.stdout = _proxy.real
+        for handler, stream in _saved_streams:
+            handler.setStream(stream)
+        _saved_streams.clear()
+        _proxy = None
+
+
+@contextlib.contextmanager
+def capture(hold=False):
+    """Install the proxy for the duration of a run.
+
+    :param hold: keep host output in :data:`held` (and any other output in
+        :data:`other`) instead of writing it when each host finishes.
+    """
+    installed = install(hold=hold)
+    try:
+        yield
+    finally:
+        if installed:
+            uninstall()
+
+
+def last_line(text: str) -> str | None:
+    """Return the last non-empty line of text, or None."""
+    for line in reversed(text.splitlines()):
+        if line.strip():
+            return line.strip()
+    return None
+
+
+def _write_log(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class Captured:
+    """Wrap a ``cmd_*`` function so each host's output is captured.
+
+    Picklable when func is, so it can be used with ``--processes`` (the
+    proxy is installed on first use in each worker process).
+
+    :param output_dir: write ``<host>.log`` there instead of stdout.
+    """
+
+    def __init__(self, func, output_dir=None):
+        self.func = func
+        self.output_dir = output_dir
+
+    def __call__(self, hostname):
+        install()
+        buf = []
+        token = _buffer.set(buf)
+        try:
+            return self.func(hostname)
+        finally:
+            _buffer.reset(token)
+            self._emit(hostname, "".join(buf))
+
+    def _emit(self, hostname, text):
+        from junos_ops import report
+
+        record = report.current()
+        if record is not None and record["message"] is None:
+            # レポートのメッセージがなければ最後の出力行を使う
+            record["message"] = last_line(text)
+        if self.output_dir is not None:
+            try:
+                _write_log(os.path.join(self.output_dir, f"{hostname}.log"), text)
+                return
+            except OSError as e:
+                text += f"output: {hostname}.log not written: {e}\n"
+        if not text:
+            return
+        with _lock:
+            proxy = _proxy
+            if proxy is not None and proxy.hold:
+                held[hostname] = text
+                return
+            real = proxy.real if proxy is not None else sys.stdout
+            real.write(text)
+            real.flush()
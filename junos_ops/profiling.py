@@ -0,0 +1,188 @@
+"""Built-in CPU / memory profiling of a run (``--profile cpu|mem``).
+
+``cpu`` runs the coordinator and every worker thread under cProfile and
+writes a pstats file (``python -m pstats FILE``). cProfile is built on
+``sys.monitoring``, which is process-wide, so one profiler sees all
+threads.
+
+``mem`` traces allocations with tracemalloc and writes a top-N report of
+the source lines holding the most memory at the end of the run.
+
+With ``--processes`` each worker process profiles itself and leaves a
+part file next to the output, which the coordinator merges.
+"""
+
+import contextlib
+import cProfile
+import glob
+import itertools
+import linecache
+import os
+import pstats
+import tracemalloc
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+MODES = ("cpu", "mem")
+DEFAULT_OUTPUT = {"cpu": "junos-ops.pstats", "mem": "junos-ops-mem.txt"}
+# メモリレポートに出す行数
+TOP_N = 30
+# tracemalloc が保持するスタックの深さ
+TRACEBACK_FRAMES = 10
+
+_mode = None
+_profile = None
+# ワーカープロセスで書き出したパートファイルの通し番号
+_part_seq = itertools.count()
+# mem: 計測中のピーク使用量（バイト）
+peak = 0
+
+
+def start(mode: str, path=None):
+    """Start profiling this process (threads started later included).
+
+    :param path: output file of the run (coordinator only); part files
+        left next to it by an earlier run that crashed are removed.
+    """
+    global _mode, _profile
+    stop_quietly()
+    if path is not None:
+        for part in _part_paths(path):
+            with contextlib.suppress(OSError):
+                os.unlink(part)
+    _mode = mode
+    if mode == "cpu":
+        _profile = cProfile.Profile()
+        try:
+            _profile.enable()
+        except ValueError as e:
+            # 他のプロファイラ（カバレッジ計測など）が動作中
+            logger.warning(f"profile: cpu profiling unavailable: {e}")
+            _profile = None
+            _mode = None
+    else:
+        tracemalloc.start(TRACEBACK_FRAMES)
+
+
+def active() -> bool:
+    return _mode is not None
+
+
+def _cpu_stats():
+    global _profile
+    profile, _profile = _profile, None
+    if profile is None:
+        return None
+    profile.disable()
+    profile.create_stats()
+    if not profile.stats:
+        return None
+    return pstats.Stats(profile)
+
+
+def _filtered_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib.*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def _stop():
+    """Stop profiling; return pstats.Stats (cpu) or a tracemalloc snapshot (mem)."""
+    global _mode, peak
+    mode, _mode = _mode, None
+    if mode == "cpu":
+        return _cpu_stats()
+    if mode == "mem":
+        snapshot = _filtered_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return snapshot
+    return None
+
+
+def stop_quietly():
+    """Stop a profiler left running (e.g. by an aborted daemon job)."""
+    if _mode is not None:
+        _stop()
+
+
+def _part_paths(path) -> list[str]:
+    return sorted(glob.glob(f"{glob.escape(path)}.part-*"))
+
+
+def save_part(path):
+    """Dump this worker process's profile next to path and keep profiling."""
+    mode = _mode
+    result = _stop()
+    part = f"{path}.part-{os.getpid()}-{next(_part_seq)}"
+    try:
+        if mode == "cpu" and result is not None:
+            result.dump_stats(part)
+        elif mode == "mem":
+            result.dump(part)
+    except OSError as e:
+        logger.warning(f"profile: {part} not written: {e}")
+    if mode is not None:
+        start(mode)
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def memory_report(snapshots, top=TOP_N) -> str:
+    """Return the top source lines by allocated size over all snapshots."""
+    totals = {}
+    for snapshot in snapshots:
+        for stat in snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            key = (frame.filename, frame.lineno)
+            size, count = totals.get(key, (0, 0))
+            totals[key] = (size + stat.size, count + stat.count)
+    ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    total = sum(size for size, _ in totals.values())
+    lines = [
+        f"# tracemalloc: top {min(top, len(ranked))} lines, "
+        f"total {_format_size(total)}, coordinator peak {_format_size(peak)}"
+    ]
+    for i, ((filename, lineno), (size, count)) in enumerate(ranked[:top], 1):
+        lines.append(f"#{i}: {filename}:{lineno}: {_format_size(size)} in {count} blocks")
+        source = linecache.getline(filename, lineno).strip()
+        if source:
+            lines.append(f"    {source}")
+    return "\n".join(lines) + "\n"
+
+
+def finish(path):
+    """Stop profiling, merge worker part files and write path."""
+    mode = _mode
+    result = _stop()
+    parts = _part_paths(path)
+    if mode == "cpu":
+        stats = result
+        for part in parts:
+            if stats is None:
+                stats = pstats.Stats(part)
+            else:
+                stats.add(part)
+        if stats is None:
+            logger.warning("profile: nothing was profiled")
+            return
+        stats.dump_stats(path)
+        print(f"# profile: cpu stats written to {path} (python -m pstats {path})")
+    elif mode == "mem":
+        snapshots = [result] + [tracemalloc.Snapshot.load(part) for part in parts]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(memory_report(snapshots))
+        os.replace(tmp, path)
+        print(f"# profile: allocation report written to {path}")
+    for part in parts:
+        os.unlink(part)
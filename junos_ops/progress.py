@@ -0,0 +1,142 @@
+"""Live fleet progress view for ``--progress`` (plain ANSI, no curses).
+
+The view is redrawn from the host records in :mod:`junos_ops.report`:
+hosts done/running/failed/queued, each running host's current phase,
+aggregate copy throughput and an ETA. While it is shown, output is held
+by :mod:`junos_ops.output` and written out, host by host, when the run
+ends.
+"""
+
+import sys
+import threading
+import time
+
+from junos_ops import bandwidth
+from junos_ops import output
+from junos_ops import report
+
+# 表示する実行中ホストの最大数
+MAX_RUNNING_LINES = 20
+# TTY でない場合の状態行の出力間隔（秒）
+PLAIN_INTERVAL = 10.0
+
+
+def _format_duration(seconds) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Dashboard:
+    """Redraw fleet progress on the terminal until :meth:`stop`."""
+
+    def __init__(self, targets, stream=None, interval=0.5):
+        self.targets = list(targets)
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.interval = interval if self.tty else PLAIN_INTERVAL
+        self._stop = threading.Event()
+        self._thread = None
+        self._lines = 0
+        self._started = None
+        self._last_bytes = 0
+        self._last_time = None
+        self._rate = 0.0
+
+    # --- 集計と描画 ---
+
+    def status(self) -> dict:
+        """Return the counts, throughput and ETA shown on the first line."""
+        now = time.monotonic()
+        records = report.snapshot()
+        done = [r for r in records.values() if r["status"] is not None]
+        failed = sum(1 for r in done if r["status"] != 0)
+        running = [r for r in records.values() if r["status"] is None]
+        queued = max(len(self.targets) - len(records), 0)
+
+        total = bandwidth.total_bytes()
+        if self._last_time is not None and now > self._last_time:
+            self._rate = (total - self._last_bytes) * 8 / (now - self._last_time) / 10**6
+        self._last_bytes, self._last_time = total, now
+
+        elapsed = now - self._started if self._started is not None else 0.0
+        eta = None
+        if done and elapsed > 0:
+            remaining = len(running) + queued
+            eta = remaining * elapsed / len(done)
+        return {
+            "done": len(done),
+            "failed": failed,
+            "running": running,
+            "queued": queued,
+            "mbps": self._rate,
+            "elapsed": elapsed,
+            "eta": eta,
+        }
+
+    def render(self) -> list[str]:
+        """Return the lines of the current view."""
+        st = self.status()
+        eta = _format_duration(st["eta"]) if st["eta"] is not None else "--"
+        lines = [
+            f"done {st['done']}/{len(self.targets)} (failed {st['failed']})"
+            f"  running {len(st['running'])}  queued {st['queued']}"
+            f"  | copy {st['mbps']:.1f} Mbit/s"
+            f"  | elapsed {_format_duration(st['elapsed'])}  ETA {eta}"
+        ]
+        now = time.time()
+        running = sorted(st["running"], key=lambda r: r["started"])
+        for record in running[:MAX_RUNNING_LINES]:
+            phase = record.get("phase") or "-"
+            detail = record.get("detail")
+            if detail and phase == "scp":
+                phase = f"scp {detail}"
+            lines.append(
+                f"  {record['host']:<30} {phase:<16} {_format_duration(now - record['started'])}"
+            )
+        if len(running) > MAX_RUNNING_LINES:
+            lines.append(f"  ... {len(running) - MAX_RUNNING_LINES} more")
+        return lines
+
+    def _draw(self):
+        lines = self.render()
+        if self.tty:
+            # 前回の描画を消して上書き
+            out = f"\x1b[{self._lines}F\x1b[J" if self._lines else ""
+            out += "\n".join(lines) + "\n"
+            self._lines = len(lines)
+        else:
+            out = lines[0] + "\n"
+        self.stream.write(out)
+        self.stream.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._draw()
+
+    # --- 開始・終了 ---
+
+    def start(self):
+        """Start redrawing; run inside ``output.capture(hold=True)``."""
+        self._started = time.monotonic()
+        self._draw()
+        self._thread = threading.Thread(target=self._loop, name="progress", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop redrawing and draw the final state."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._draw()
+
+    def dump_output(self):
+        """Write held output host by host, in target order."""
+        for text in output.other:
+            self.stream.write(text)
+        for target in self.targets:
+            self.stream.write(output.held.get(target, ""))
+        self.stream.flush()
@@ -0,0 +1,225 @@
+"""Structured run report: per-host status, timings and bytes (``--report``).
+
+Each host runs inside :class:`Reported`, which keeps the host's record in
+a context variable so that :func:`connected`, :func:`failed` and
+:func:`phase` can be called from anywhere below ``cmd_*`` without passing
+the record around. All of them are no-ops outside a reported host.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from junos_ops import trace
+
+_current = contextvars.ContextVar("junos_ops_report", default=None)
+_lock = threading.Lock()
+# hostname → record
+records = {}
+
+
+def _new_record(hostname) -> dict:
+    return {
+        "host": hostname,
+        "status": None,
+        "error": None,
+        "message": None,
+        "connect_time": None,
+        "phases": {},
+        "phase": None,
+        "bytes": 0,
+        "started": time.time(),
+        "duration": None,
+    }
+
+
+def current() -> dict | None:
+    """Return the record of the host running in this context, or None."""
+    return _current.get()
+
+
+class Reported:
+    """Wrap a ``cmd_*`` function so each call records a host report.
+
+    Picklable when func is, so it can be used with ``--processes``.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, hostname):
+        record = _new_record(hostname)
+        with _lock:
+            records[hostname] = record
+        token = _current.set(record)
+        start = time.monotonic()
+        ret = 1
+        try:
+            with trace.span("host", host=hostname):
+                ret = self.func(hostname)
+            return ret
+        except Exception as e:
+            failed(e)
+            raise
+        finally:
+            from junos_ops import bandwidth
+
+            throughput = bandwidth.get_throughput(hostname)
+            if throughput is not None:
+                record["bytes"] = throughput[0]
+            record["duration"] = time.monotonic() - start
+            record["status"] = ret
+            record["phase"] = None
+            _current.reset(token)
+
+
+def connected(seconds: float):
+    """Record the NETCONF session setup time of the current host."""
+    record = _current.get()
+    if record is not None:
+        record["connect_time"] = seconds
+
+
+def failed(exc: BaseException):
+    """Record the error class and message of the current host."""
+    record = _current.get()
+    if record is not None:
+        record["error"] = type(exc).__name__
+        record["message"] = str(exc)
+
+
+def recovered():
+    """Clear the error recorded for the current host (e.g. after a retry succeeded)."""
+    record = _current.get()
+    if record is not None:
+        record["error"] = None
+        record["message"] = None
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Time a phase of the current host (phases may nest)."""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    outer = record["phase"]
+    record["phase"] = name
+    start = time.monotonic()
+    try:
+        with trace.span(name):
+            yield
+    finally:
+        phases = record["phases"]
+        phases[name] = phases.get(name, 0.0) + time.monotonic() - start
+        record["phase"] = outer
+
+
+def add(hostname, status, error=None, message=None):
+    """Record a host that did not run (e.g. unreachable in ``--probe``)."""
+    record = _new_record(hostname)
+    record.update(status=status, error=error, message=message, duration=0.0)
+    with _lock:
+        records[hostname] = record
+
+
+def snapshot() -> dict:
+    """Return a copy of all records (sent back from worker processes)."""
+    with _lock:
+        return {host: dict(record) for host, record in records.items()}
+
+
+def merge(more: dict):
+    """Add records collected in a worker process."""
+    with _lock:
+        records.update(more)
+
+
+def reset():
+    with _lock:
+        records.clear()
+
+
+class _MessageHandler(logging.Handler):
+    """Keep the last warning/error logged while a host runs as its message."""
+
+    def emit(self, log_record):
+        record = _current.get()
+        if record is not None and log_record.levelno >= logging.WARNING:
+            record["message"] = log_record.getMessage()
+
+
+_handler = _MessageHandler()
+
+
+def enable():
+    """Start collecting log messages into host records."""
+    reset()
+    root = logging.getLogger()
+    if _handler not in root.handlers:
+        root.addHandler(_handler)
+
+
+def percentile(values, p: float):
+    """Nearest-rank percentile of values (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _latency(values) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def build(subcommand, started: float) -> dict:
+    """Assemble the report document from all records."""
+    hosts = sorted(snapshot().values(), key=lambda r: r["host"])
+    for record in hosts:
+        # --progress 用の一時的な項目は出力しない
+        for key in ("phase", "detail"):
+            record.pop(key, None)
+    elapsed = time.time() - started
+    total_bytes = sum(r["bytes"] for r in hosts)
+    durations = [r["duration"] for r in hosts if r["duration"]]
+    connects = [r["connect_time"] for r in hosts if r["connect_time"] is not None]
+    phase_names = sorted({name for r in hosts for name in r["phases"]})
+    return {
+        "subcommand": subcommand,
+        "started": started,
+        "elapsed": elapsed,
+        "hosts_total": len(hosts),
+        "hosts_ok": sum(1 for r in hosts if r["status"] == 0),
+        "hosts_failed": sum(1 for r in hosts if r["status"] != 0),
+        "hosts_per_minute": len(hosts) / elapsed * 60 if elapsed > 0 else None,
+        "bytes": total_bytes,
+        "throughput_mbps": total_bytes * 8 / elapsed / 10**6 if elapsed > 0 else None,
+        "connect_time": _latency(connects),
+        "duration": _latency(durations),
+        "phases": {
+            name: _latency([r["phases"][name] for r in hosts if name in r["phases"]])
+            for name in phase_names
+        },
+        "hosts": hosts,
+    }
+
+
+def write(path, subcommand, started: float):
+    """Write the report as JSON (atomically, via a temporary file)."""
+    document = build(subcommand, started)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(document, f, indent=2, default=str)
+        f.write("\n")
+    os.replace(tmp, path)
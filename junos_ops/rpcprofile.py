@@ -0,0 +1,182 @@
+"""Per-RPC latency and reply size profiling (``--profile-rpc``).
+
+Every RPC sent on an instrumented session (``dev.rpc.*`` and ``dev.cli``
+both go through ``dev.execute``) is recorded with its latency, reply
+size and outcome. At the end of the run :func:`print_summary` groups the
+samples by RPC name and device model (from facts already gathered on the
+session, else the facts cache) and prints count, errors, p50/p95/p99
+latency and mean reply size.
+"""
+
+import threading
+import time
+
+from lxml import etree
+from ncclient.operations.errors import TimeoutExpiredError
+from jnpr.junos.exception import RpcTimeoutError
+
+from junos_ops import report
+
+_lock = threading.Lock()
+_enabled = False
+# (rpc 名, ホスト名, 秒, 応答サイズ, 結果, モデル) のリスト
+samples = []
+# 応答サイズの見積もりで直列化する深さ
+_SAMPLED_DEPTH = 3
+
+
+def enable():
+    """Start recording RPC samples (discarding earlier ones)."""
+    global _enabled
+    with _lock:
+        samples.clear()
+        _enabled = True
+
+
+def disable():
+    global _enabled
+    with _lock:
+        samples.clear()
+        _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _estimate(element, depth) -> int:
+    if depth == 0 or len(element) == 0:
+        return len(etree.tostring(element))
+    # 開始・終了タグと text/tail、子は先頭の子から外挿する
+    own = 2 * len(element.tag) + 5 + len(element.text or "") + len(element.tail or "")
+    return own + _estimate(element[0], depth - 1) * len(element)
+
+
+def _reply_size(reply) -> int:
+    """Return the reply size in bytes, estimated for XML replies.
+
+    Serializing every reply would cost about as much as parsing it, so
+    each level of the tree is extrapolated from its first child and only
+    one subtree ``_SAMPLED_DEPTH`` levels down is serialized.
+    """
+    if isinstance(reply, etree._Element):
+        return _estimate(reply, _SAMPLED_DEPTH)
+    if isinstance(reply, (str, bytes)):
+        return len(reply)
+    return 0
+
+
+def _cached_model(dev):
+    """Return the model if facts were already gathered on this session.
+
+    Only PyEZ's fact cache is read, so this never sends an RPC.
+    """
+    facts = getattr(dev, "facts", None)
+    cached = getattr(facts, "_cache", facts)
+    if isinstance(cached, dict):
+        return cached.get("model")
+    return None
+
+
+def instrument(dev, hostname):
+    """Record latency, reply size and outcome of every RPC on this session.
+
+    Called again whenever a pooled session is checked out, so samples are
+    filed under the host currently using it. The wrapper stays on the
+    session but records nothing while profiling is disabled.
+    """
+    dev._junos_ops_profiled_host = hostname
+    if vars(dev).get("_junos_ops_profiled"):
+        return
+    execute = dev.execute
+
+    def _execute(rpc_cmd, *vargs, **kvargs):
+        if not _enabled:
+            return execute(rpc_cmd, *vargs, **kvargs)
+        name = getattr(rpc_cmd, "tag", None) or "rpc"
+        outcome = "error"
+        size = 0
+        start = time.monotonic()
+        try:
+            reply = execute(rpc_cmd, *vargs, **kvargs)
+            outcome = "ok"
+            size = _reply_size(reply)
+            return reply
+        except (RpcTimeoutError, TimeoutExpiredError):
+            outcome = "timeout"
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with _lock:
+                samples.append(
+                    (name, dev._junos_ops_profiled_host, elapsed, size, outcome, _cached_model(dev))
+                )
+
+    dev.execute = _execute
+    dev._junos_ops_profiled = True
+
+
+def snapshot() -> list[tuple]:
+    """Return a copy of the samples (sent back from worker processes)."""
+    with _lock:
+        return list(samples)
+
+
+def merge(more: list[tuple]):
+    """Add samples recorded in a worker process."""
+    with _lock:
+        samples.extend(more)
+
+
+def summarize(models: dict[str, str]) -> list[dict]:
+    """Group samples by (RPC, model), slowest p95 first.
+
+    The model recorded from the live session wins over ``models``.
+
+    :param models: {hostname: model}; other hosts count as ``unknown``.
+    """
+    recorded = snapshot()
+    live = {sample[1]: sample[5] for sample in recorded if sample[5]}
+    groups = {}
+    for name, hostname, seconds, size, outcome, _ in recorded:
+        key = (name, live.get(hostname) or models.get(hostname) or "unknown")
+        groups.setdefault(key, []).append((seconds, size, outcome))
+    rows = []
+    for (name, model), values in groups.items():
+        latencies = [v[0] for v in values]
+        rows.append({
+            "rpc": name,
+            "model": model,
+            "count": len(values),
+            "timeouts": sum(1 for v in values if v[2] == "timeout"),
+            "errors": sum(1 for v in values if v[2] == "error"),
+            "p50": report.percentile(latencies, 50),
+            "p95": report.percentile(latencies, 95),
+            "p99": report.percentile(latencies, 99),
+            "max": max(latencies),
+            "size": sum(v[1] for v in values) // len(values),
+        })
+    rows.sort(key=lambda r: (-r["p95"], r["rpc"], r["model"]))
+    return rows
+
+
+def print_summary():
+    """Print the RPC latency table, if any RPC was sent."""
+    from junos_ops import cache
+
+    if not snapshot():
+        return
+    try:
+        models = {host: facts.get("model") for host, facts in cache.load_facts().items()}
+    except Exception:
+        models = {}
+    print("# rpc profile (seconds, mean reply bytes)")
+    print(
+        f"  {'rpc':<40} {'model':<16} {'count':>6} {'tmo':>4} {'err':>4}"
+        f" {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'size':>9}"
+    )
+    for r in summarize(models):
+        print(
+            f"  {r['rpc']:<40} {r['model']:<16} {r['count']:>6} {r['timeouts']:>4} {r['errors']:>4}"
+            f" {r['p50']:>8.3f} {r['p95']:>8.3f} {r['p99']:>8.3f} {r['max']:>8.3f} {r['size']:>9}"
+        )
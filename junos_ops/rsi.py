@@ -4,29 +4,25 @@ from lxml import etree
 from logging import getLogger
 
 from junos_ops import common
+from junos_ops import report
+from junos_ops import timeouts
 
 logger = getLogger(__name__)
 
+# RSI 採取が参照する facts（model/personality/model_info は timeouts の判定に使う）
+FACTS = ("hostname", "model", "personality", "model_info", "srx_cluster")
 
-def get_support_information(dev):
+
+def get_support_information(dev, hostname=None):
     """Run request support information with model-specific timeout.
 
+    The timeout comes from the ``rsi`` entry of the host's timeout profile
+    (see :mod:`junos_ops.timeouts`).
+
     :returns: RPC response, or None on failure.
     """
     try:
-        if dev.facts["personality"] == "SRX_BRANCH":
-            # SRX3xx series is SLOW
-            timeout = 1200
-        elif dev.facts["model"] == "EX2300-24T":
-            timeout = 1200
-        elif len(dev.facts["model_info"]) >= 2:
-            # Virtual Chassis is more SLOW
-            timeout = 1800
-            if dev.facts["model"] == "QFX5110-48S-4C":
-                # QFX5110-48S-4C is most SLOW
-                timeout = 2400
-        else:
-            timeout = 600
+        timeout = timeouts.get_timeout(hostname, dev, "rsi")
 
         logger.debug(f"get_support_information: {dev.facts['hostname']} timeout={timeout}")
 
@@ -44,49 +40,44 @@ def get_support_information(dev):
         return None
 
 
-def cmd_rsi(hostname) -> int:
-    """Collect SCF and RSI for a single host and write to files."""
-    logger.debug(f"cmd_rsi: {hostname} start")
-    print(f"# {hostname}")
-
-    err, dev = common.connect(hostname)
-    if err or dev is None:
-        return 1
+def collect(hostname, dev) -> int:
+    """Collect SCF and RSI from a connected device and write to files.
 
+    :returns: 0 on success, 2 if request support information failed.
+    """
     rsi_dir = common.config.get(hostname, "RSI_DIR", fallback="./")
 
-    try:
-        # show configuration → SCF ファイル
-        display_style = common.config.get(hostname, "DISPLAY_STYLE",
-                                          fallback="display set")
-        if display_style:
-            scf_cmd = f"show configuration | {display_style}"
-        else:
-            scf_cmd = "show configuration"
+    # show configuration → SCF ファイル
+    display_style = common.config.get(hostname, "DISPLAY_STYLE",
+                                      fallback="display set")
+    if display_style:
+        scf_cmd = f"show configuration | {display_style}"
+    else:
+        scf_cmd = "show configuration"
+    with report.phase("scf"):
         output_str = dev.cli(scf_cmd)
-        scf_path = f"{rsi_dir}{hostname}.SCF"
-        with open(scf_path, mode="w") as f:
-            f.write(output_str.strip())
-        print(f"  {hostname}.SCF done")
-
-        # request support information → RSI ファイル
-        rpc = get_support_information(dev)
-        if rpc is None:
-            logger.error(f"{hostname}: get_support_information failed")
-            return 2
-
-        output_str = etree.tostring(rpc, encoding="unicode", method="text")
-        rsi_path = f"{rsi_dir}{hostname}.RSI"
-        with open(rsi_path, mode="w") as f:
-            f.write(output_str.strip())
-        print(f"  {hostname}.RSI done")
-
-        return 0
-    except Exception as e:
-        logger.error(f"{hostname}: {e}")
-        return 1
-    finally:
-        try:
-            dev.close()
-        except Exception:
-            pass
+    scf_path = f"{rsi_dir}{hostname}.SCF"
+    with open(scf_path, mode="w") as f:
+        f.write(output_str.strip())
+    print(f"  {hostname}.SCF done")
+
+    # request support information → RSI ファイル
+    with report.phase("rsi"):
+        rpc = get_support_information(dev, hostname)
+    if rpc is None:
+        logger.error(f"{hostname}: get_support_information failed")
+        return 2
+
+    output_str = etree.tostring(rpc, encoding="unicode", method="text")
+    rsi_path = f"{rsi_dir}{hostname}.RSI"
+    with open(rsi_path, mode="w") as f:
+        f.write(output_str.strip())
+    print(f"  {hostname}.RSI done")
+    return 0
+
+
+def cmd_rsi(hostname) -> int:
+    """Collect SCF and RSI for a single host and write to files."""
+    logger.debug(f"cmd_rsi: {hostname} start")
+    print(f"# {hostname}")
+    return common.run_steps(hostname, [("rsi", collect)], facts=FACTS, header=False)
@@ -0,0 +1,147 @@
+"""Timeout profiles: per-operation timeouts keyed by model, personality and VC size."""
+
+import fnmatch
+import threading
+from logging import getLogger
+
+from junos_ops import common
+
+logger = getLogger(__name__)
+
+# 操作名 → 用途
+#   rsi       request support information
+#   install   request system software add (SW.install timeout)
+#   checksum  remote checksum in safe_copy / install
+#   cleanup   request system storage cleanup (copy)
+#   cleanfs   storage cleanup inside safe_copy / install
+#   rollback  request system software rollback
+#   snapshot  request system snapshot delete
+OPERATIONS = ("rsi", "install", "checksum", "cleanup", "cleanfs", "rollback", "snapshot")
+MATCH_KEYS = ("model", "personality", "vc_members")
+
+# 組み込みプロファイル（上から順に評価、操作ごとに最初に一致したものを採用）
+BUILTIN_PROFILES = [
+    # SRX3xx series is SLOW
+    {"personality": "SRX_BRANCH", "rsi": 1200},
+    {"model": "EX2300-24T", "rsi": 1200},
+    # Virtual Chassis is more SLOW, QFX5110-48S-4C is most SLOW
+    {"model": "QFX5110-48S-4C", "vc_members": 2, "rsi": 2400},
+    {"vc_members": 2, "rsi": 1800},
+    {
+        "rsi": 600,
+        "install": 2400,  # default 1800
+        "checksum": 1200,  # default 300
+        "cleanup": 60,  # default 30, but it's not enough QFX series.
+        "cleanfs": 300,
+        "rollback": 120,  # default 30, but it's not enough SRX4600, MX5 and QFX5110.
+        "snapshot": 60,
+    },
+]
+
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+def _number(key, value):
+    """Return value of a numeric key as int, or None if it is invalid."""
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    # vc_members は 0 以上、タイムアウトは 1 秒以上
+    if number < (0 if key == "vc_members" else 1):
+        return None
+    return number
+
+
+def check_config(config):
+    """Log and drop invalid numbers in ``[timeout:NAME]`` sections.
+
+    Called when config.ini is read, so a typo is reported up front
+    instead of failing a copy or install on every host.
+    """
+    for section in config.sections():
+        if not section.startswith(common.TIMEOUT_PREFIX):
+            continue
+        for key in ("vc_members",) + OPERATIONS:
+            value = config.get(section, key, fallback=None)
+            if value is None or value == "" or _number(key, value) is not None:
+                continue
+            logger.warning(f"[{section}] {key} = {value}: not a valid number, ignored")
+            config.remove_option(section, key)
+
+
+def load_profiles() -> list[dict]:
+    """Read ``[timeout:NAME]`` sections in file order.
+
+    Match keys: ``model`` (glob), ``personality`` (glob) and
+    ``vc_members`` (minimum number of virtual-chassis members).
+    Other keys are operation names from :data:`OPERATIONS`. Invalid
+    numbers are skipped (see :func:`check_config`).
+    """
+    profiles = []
+    if common.config is None:
+        return profiles
+    for section in common.config.sections():
+        if not section.startswith(common.TIMEOUT_PREFIX):
+            continue
+        profile = {"name": section[len(common.TIMEOUT_PREFIX):]}
+        for key in MATCH_KEYS + OPERATIONS:
+            value = common.config.get(section, key, fallback=None)
+            if value is None or value == "":
+                continue
+            if key in ("model", "personality"):
+                profile[key] = value
+            elif _number(key, value) is not None:
+                profile[key] = _number(key, value)
+        profiles.append(profile)
+    return profiles
+
+
+def _matches(profile, model, personality, members) -> bool:
+    pattern = profile.get("model")
+    if pattern is not None and not fnmatch.fnmatchcase(model.upper(), pattern.upper()):
+        return False
+    pattern = profile.get("personality")
+    if pattern is not None and not fnmatch.fnmatchcase(personality.upper(), pattern.upper()):
+        return False
+    if members < profile.get("vc_members", 0):
+        return False
+    return True
+
+
+def resolve(model: str, personality: str, members: int) -> dict[str, int]:
+    """Resolve every operation's timeout from config and built-in profiles."""
+    table = {}
+    for profile in load_profiles() + BUILTIN_PROFILES:
+        if not _matches(profile, model, personality, members):
+            continue
+        for op in OPERATIONS:
+            if op in profile and op not in table:
+                table[op] = profile[op]
+    return table
+
+
+def get_timeout(hostname, dev, op: str) -> int:
+    """Return the timeout in seconds for op on this device.
+
+    The table is resolved once per host (and set of facts) and cached.
+    """
+    facts = dev.facts
+    model = facts.get("model") or ""
+    personality = facts.get("personality") or ""
+    members = len(facts.get("model_info") or {})
+    key = (hostname, model, personality, members)
+    with _resolved_lock:
+        table = _resolved.get(key)
+        if table is None:
+            table = resolve(model, personality, members)
+            _resolved[key] = table
+            logger.debug(f"timeouts: {hostname} {model} {personality} vc={members} {table}")
+    return table[op]
+
+
+def clear_cache():
+    """Forget resolved tables (e.g. after the config was re-read)."""
+    with _resolved_lock:
+        _resolved.clear()
@@ -0,0 +1,189 @@
+"""Span tracing of host phases and RPCs (``--trace``).
+
+Spans are recorded for each host, each :func:`junos_ops.report.phase`
+and each RPC sent on an instrumented session, and exported to a local
+file as Chrome trace-event JSON (``chrome://tracing``, Perfetto) or
+OTLP-compatible JSON. Parents are tracked with a context variable, so
+spans nest correctly across worker threads.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+
+FORMATS = ("chrome", "otlp")
+
+_current = contextvars.ContextVar("junos_ops_trace", default=None)
+_lock = threading.Lock()
+_enabled = False
+# 記録済みの span（dict）
+spans = []
+
+
+def enable():
+    """Start recording spans (discarding earlier ones)."""
+    global _enabled
+    with _lock:
+        spans.clear()
+        _enabled = True
+
+
+def disable():
+    global _enabled
+    with _lock:
+        spans.clear()
+        _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+@contextlib.contextmanager
+def span(name: str, host: str | None = None, **attrs):
+    """Record a span around the block (no-op unless tracing is enabled).
+
+    :param host: the host the span belongs to (default: the parent's host).
+    """
+    if not _enabled:
+        yield
+        return
+    parent = _current.get()
+    record = {
+        "name": name,
+        "host": host or (parent["host"] if parent else None),
+        "span_id": secrets.token_hex(8),
+        "parent_id": parent["span_id"] if parent else None,
+        "pid": os.getpid(),
+        "start": time.time_ns(),
+        "end": None,
+        "error": None,
+        "attrs": attrs,
+    }
+    token = _current.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        record["end"] = time.time_ns()
+        with _lock:
+            spans.append(record)
+
+
+def instrument(dev):
+    """Record a span for every RPC sent on this session."""
+    if vars(dev).get("_junos_ops_traced"):
+        return
+    execute = dev.execute
+
+    def _execute(rpc_cmd, *vargs, **kvargs):
+        name = getattr(rpc_cmd, "tag", None) or "rpc"
+        with span(f"rpc {name}", kind="rpc"):
+            return execute(rpc_cmd, *vargs, **kvargs)
+
+    dev.execute = _execute
+    dev._junos_ops_traced = True
+
+
+def snapshot() -> list[dict]:
+    """Return a copy of the recorded spans (sent back from worker processes)."""
+    with _lock:
+        return list(spans)
+
+
+def merge(more: list[dict]):
+    """Add spans recorded in a worker process."""
+    with _lock:
+        spans.extend(more)
+
+
+def _host_rows(records) -> dict:
+    """Assign one trace-viewer row per host, in host order."""
+    hosts = sorted({r["host"] or "" for r in records})
+    return {host: i + 1 for i, host in enumerate(hosts)}
+
+
+def to_chrome(records) -> dict:
+    """Build a Chrome trace-event document (one row per host)."""
+    rows = _host_rows(records)
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+         "args": {"name": host or "(main)"}}
+        for host, tid in rows.items()
+    ]
+    for r in sorted(records, key=lambda r: r["start"]):
+        args = dict(r["attrs"])
+        if r["error"]:
+            args["error"] = r["error"]
+        events.append({
+            "name": r["name"],
+            "cat": r["attrs"].get("kind", "phase"),
+            "ph": "X",
+            "ts": r["start"] / 1000,
+            "dur": (r["end"] - r["start"]) / 1000,
+            "pid": 1,
+            "tid": rows[r["host"] or ""],
+            "args": args,
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(records, trace_id=None) -> dict:
+    """Build an OTLP/JSON ``ExportTraceServiceRequest`` (one trace per run)."""
+    trace_id = trace_id or secrets.token_hex(16)
+    otlp_spans = []
+    for r in sorted(records, key=lambda r: r["start"]):
+        attrs = {"host": r["host"], "process.pid": r["pid"], **r["attrs"]}
+        otlp_span = {
+            "traceId": trace_id,
+            "spanId": r["span_id"],
+            "name": r["name"],
+            # SPAN_KIND_CLIENT for RPCs, SPAN_KIND_INTERNAL otherwise
+            "kind": 3 if r["attrs"].get("kind") == "rpc" else 1,
+            "startTimeUnixNano": str(r["start"]),
+            "endTimeUnixNano": str(r["end"]),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None
+            ],
+            # STATUS_CODE_ERROR / STATUS_CODE_UNSET
+            "status": {"code": 2, "message": r["error"]} if r["error"] else {},
+        }
+        if r["parent_id"]:
+            otlp_span["parentSpanId"] = r["parent_id"]
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{"key": "service.name", "value": {"stringValue": "junos-ops"}}],
+            },
+            "scopeSpans": [{"scope": {"name": "junos_ops"}, "spans": otlp_spans}],
+        }],
+    }
+
+
+def write(path, fmt="chrome"):
+    """Export the recorded spans (atomically, via a temporary file)."""
+    records = snapshot()
+    document = to_otlp(records) if fmt == "otlp" else to_chrome(records)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(document, f)
+        f.write("\n")
+    os.replace(tmp, path)
@@ -11,17 +11,59 @@ from jnpr.junos.utils.fs import FS
 from jnpr.junos.utils.sw import SW
 from lxml import etree
 from ncclient.operations.errors import TimeoutExpiredError
+from concurrent import futures
 import argparse
 import datetime
+import functools
 import re
+import sqlite3
+import threading
 from logging import getLogger
 
+from junos_ops import bandwidth
+from junos_ops import cache
 from junos_ops import common
+from junos_ops import report
+from junos_ops import timeouts
 
 logger = getLogger(__name__)
 
+# パッケージ操作が参照する facts（model_info は timeouts の VC 判定に使う）
+FACTS = ("hostname", "model", "version", "personality", "model_info")
 
-def delete_snapshots(dev) -> bool:
+# 計算中のローカルチェックサム: (ファイルの同一性, アルゴリズム) → Future
+_digests_inflight = {}
+_digests_lock = threading.Lock()
+
+
+# プローブが RPC エラーで失敗したことを示す（呼び出し元には None を返し、メモしない）
+_PROBE_FAILED = object()
+
+
+def _probe(func):
+    """Memoize a read-only device probe on the session (dev is the last argument).
+
+    The result is reused until a mutating operation (rollback, install,
+    rescue save, commit) calls :func:`junos_ops.common.invalidate_probes`
+    or the session is released. A probe that fails returns
+    ``_PROBE_FAILED``; the caller gets None and the next call asks the
+    device again.
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        probes = vars(args[-1]).setdefault("_junos_ops_probes", {})
+        if func.__name__ in probes:
+            return probes[func.__name__]
+        result = func(*args)
+        if result is _PROBE_FAILED:
+            return None
+        probes[func.__name__] = result
+        return result
+
+    return wrapper
+
+
+def delete_snapshots(dev, hostname=None) -> bool:
     """Delete all snapshots on EX/QFX series for disk space.
 
     :return: True on error, False on success (no-op for non-SWITCH).
@@ -34,7 +76,10 @@ def delete_snapshots(dev) -> bool:
         return False
 
     try:
-        rpc = dev.rpc.request_snapshot(delete="*", dev_timeout=60)
+        with report.phase("snapshot"):
+            rpc = dev.rpc.request_snapshot(
+                delete="*", dev_timeout=timeouts.get_timeout(hostname, dev, "snapshot")
+            )
         xml_str = etree.tostring(rpc, encoding="unicode")
         logger.debug(f"delete_snapshots: {xml_str}")
         print("copy: snapshot delete successful")
@@ -70,10 +115,11 @@ def copy(hostname, dev):
         print("dry-run: request system storage cleanup")
     else:
         try:
-            rpc = dev.rpc.request_system_storage_cleanup(
-                no_confirm=True, dev_timeout=60
-            )
-            # default dev_timeout is 30 seconds, but it's not enough QFX series.
+            with report.phase("cleanup"):
+                rpc = dev.rpc.request_system_storage_cleanup(
+                    no_confirm=True,
+                    dev_timeout=timeouts.get_timeout(hostname, dev, "cleanup"),
+                )
             xml_str = etree.tostring(rpc, encoding="unicode")
             if common.args.debug:
                 print("copy: request-system-storage-cleanup=", xml_str)
@@ -93,7 +139,7 @@ def copy(hostname, dev):
             return True
 
     # EX/QFXシリーズ: スナップショット削除でディスク容量を確保
-    delete_snapshots(dev)
+    delete_snapshots(dev, hostname)
 
     # copy
     if common.args.dry_run:
@@ -108,22 +154,33 @@ def copy(hostname, dev):
         )
         ret = False
     else:
+        # 上書きされるので、検証済みの状態を破棄する
+        clear_hashcache(hostname, get_model_file(hostname, dev.facts["model"]))
         try:
             sw = SW(dev)
-            result = sw.safe_copy(
-                get_model_file(hostname, dev.facts["model"]),
-                remote_path=common.config.get(hostname, "rpath"),
-                progress=True,
-                cleanfs=True,
-                cleanfs_timeout=300,  # default 300
-                checksum=get_model_hash(hostname, dev.facts["model"]),
-                checksum_timeout=1200,  # default 300
-                checksum_algorithm=common.config.get(hostname, "hashalgo"),
-                force_copy=common.args.force,
-            )
+            with report.phase("scp"):
+                result = sw.safe_copy(
+                    get_model_file(hostname, dev.facts["model"]),
+                    remote_path=common.config.get(hostname, "rpath"),
+                    # 帯域制限（--copy-bandwidth 等）と転送量の計測
+                    progress=bandwidth.copy_progress(hostname),
+                    cleanfs=True,
+                    cleanfs_timeout=timeouts.get_timeout(hostname, dev, "cleanfs"),
+                    checksum=get_model_hash(hostname, dev.facts["model"]),
+                    checksum_timeout=timeouts.get_timeout(hostname, dev, "checksum"),
+                    checksum_algorithm=common.config.get(hostname, "hashalgo"),
+                    # 転送前のリモート checksum は check_remote_package で確認済み
+                    # （--force 時は不要）なので、転送後の検証だけを行う
+                    force_copy=True,
+                )
+            throughput = bandwidth.get_throughput(hostname)
+            if throughput is not None:
+                print(f"copy: {bandwidth.format_throughput(*throughput)}")
             if result:
                 if common.args.debug:
                     print("copy: successful")
+                # safe_copy が転送後に検証したので、以降の確認では再計算しない
+                record_remote_package(hostname, dev)
                 ret = False
             else:
                 if common.args.debug:
@@ -149,9 +206,13 @@ def rollback(hostname, dev):
     if common.args.dry_run:
         print("dry-run: request system software rollback")
     else:
+        common.invalidate_probes(dev)
         try:
-            rpc = dev.rpc.request_package_rollback({"format": "text"}, dev_timeout=120)
-            # default dev_timeout is 30 seconds, but it's not enough SRX4600, MX5 and QFX5110.
+            with report.phase("rollback"):
+                rpc = dev.rpc.request_package_rollback(
+                    {"format": "text"},
+                    dev_timeout=timeouts.get_timeout(hostname, dev, "rollback"),
+                )
             xml_str = etree.tostring(rpc, encoding="unicode")
             if common.args.debug:
                 print("rollback: rpc=", rpc, "xml_str=", xml_str)
@@ -274,8 +335,10 @@ def install(hostname, dev):
         print("dry-run: request system configuration rescue save")
     else:
         cu = Config(dev)
+        common.invalidate_probes(dev)
         try:
-            ret = cu.rescue("save")
+            with report.phase("rescue"):
+                ret = cu.rescue("save")
             if ret:
                 print("install: rescue config save successful")
             else:
@@ -300,27 +363,31 @@ def install(hostname, dev):
         ret = False
     else:
         sw = SW(dev)
-        status, msg = sw.install(
-            get_model_file(hostname, dev.facts["model"]),
-            remote_path=common.config.get(hostname, "rpath"),
-            progress=True,
-            validate=True,
-            cleanfs=True,
-            no_copy=True,
-            issu=False,
-            nssu=False,
-            timeout=2400,  # default 1800
-            cleanfs_timeout=300,  # default 300
-            checksum=get_model_hash(hostname, dev.facts["model"]),
-            checksum_timeout=1200,  # default 300
-            checksum_algorithm=common.config.get(hostname, "hashalgo"),
-            force_copy=common.args.force,
-            all_re=True,
-        )
+        common.invalidate_probes(dev)
+        with report.phase("install"):
+            status, msg = sw.install(
+                get_model_file(hostname, dev.facts["model"]),
+                remote_path=common.config.get(hostname, "rpath"),
+                progress=True,
+                validate=True,
+                cleanfs=True,
+                no_copy=True,
+                issu=False,
+                nssu=False,
+                timeout=timeouts.get_timeout(hostname, dev, "install"),
+                cleanfs_timeout=timeouts.get_timeout(hostname, dev, "cleanfs"),
+                checksum=get_model_hash(hostname, dev.facts["model"]),
+                checksum_timeout=timeouts.get_timeout(hostname, dev, "checksum"),
+                checksum_algorithm=common.config.get(hostname, "hashalgo"),
+                force_copy=common.args.force,
+                all_re=True,
+            )
         del sw
         logger.debug(f"{msg=}")
         if status:
             logger.info("install successful")
+            # EX シリーズはインストール後にパッケージを削除する
+            clear_hashcache(hostname, get_model_file(hostname, dev.facts["model"]))
             ret = False
         else:
             logger.info("install failed")
@@ -369,6 +436,65 @@ def set_hashcache(hostname, file, value):
         common.config.set(hostname, file + "hashcache", value)
 
 
+def clear_hashcache(hostname, file):
+    """Forget a cached checksum value (thread-safe)."""
+    with common.config_lock:
+        if common.config.has_section(hostname):
+            common.config.remove_option(hostname, file + "hashcache")
+
+
+def local_checksum(file, algo) -> str:
+    """Return the checksum of a local package, using the digest cache.
+
+    The cache entry is used only while the file's path, size, mtime and
+    inode are unchanged, and a digest is stored only if the file did not
+    change while it was being hashed.
+
+    Concurrent calls for the same file are deduplicated: the first thread
+    hashes it and the others wait for its result.
+
+    :raises FileNotFoundError: when file does not exist.
+    """
+    identity = cache.file_identity(file)
+    key = (identity, algo)
+    with _digests_lock:
+        future = _digests_inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _digests_inflight[key] = futures.Future()
+    if not owner:
+        logger.debug(f"local_checksum: waiting for {file}")
+        return future.result()
+    try:
+        digest = _local_checksum(file, algo, identity)
+        future.set_result(digest)
+        return digest
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _digests_lock:
+            del _digests_inflight[key]
+
+
+def _local_checksum(file, algo, identity) -> str:
+    """Look up the digest cache, else hash the file and record the digest."""
+    try:
+        digest = cache.load_digest(identity, algo)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"digest cache: {e}")
+        digest = None
+    if digest is not None:
+        return digest
+    digest = SW.local_checksum(file, algorithm=algo)
+    if cache.file_identity(file) == identity:
+        try:
+            cache.store_digest(identity, algo, digest)
+        except (sqlite3.Error, OSError) as e:
+            logger.debug(f"digest cache: {e}")
+    return digest
+
+
 def check_local_package(hostname, dev):
     """Check local package checksum.
 
@@ -391,7 +517,7 @@ def check_local_package(hostname, dev):
         return True
     ret = None
     try:
-        val = sw.local_checksum(file, algorithm=algo)
+        val = local_checksum(file, algo)
         if val == pkg_hash:
             print(f"  - local package: {file} is found. checksum is OK.")
             set_hashcache("localhost", file, val)
@@ -408,6 +534,68 @@ def check_local_package(hostname, dev):
     return ret
 
 
+def _remote_stat(dev, path) -> tuple[int, int] | None:
+    """Return (size, mtime) of a file on the device, or None if not found."""
+    st = FS(dev).stat(path)
+    if st is None or st.get("type") != "file":
+        return None
+    return st["size"], int(st["ts_epoc"])
+
+
+def remote_checksum(hostname, dev, path, algo) -> tuple[str | None, bool]:
+    """Return (checksum, from ledger) of a file on the device.
+
+    A digest recorded in the verification ledger is reused when one
+    ``file list detail`` RPC shows the file's size and mtime unchanged;
+    otherwise the checksum is computed on the device and recorded.
+
+    :returns: ``(None, False)`` when the file does not exist.
+    """
+    try:
+        stat = _remote_stat(dev, path)
+    except Exception as e:
+        # サイズと mtime を確認できなければ台帳を使わずに計算する
+        logger.debug(f"remote_checksum: file list failed: {e}")
+        return SW(dev).remote_checksum(path, algorithm=algo), False
+    if stat is None:
+        return None, False
+    try:
+        entry = cache.load_remote_digest(hostname, path, algo)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"verification ledger: {e}")
+        entry = None
+    if entry is not None and entry[:2] == stat:
+        return entry[2], True
+    digest = SW(dev).remote_checksum(path, algorithm=algo)
+    if digest is not None:
+        try:
+            cache.store_remote_digest(hostname, path, algo, *stat, digest)
+        except (sqlite3.Error, OSError) as e:
+            logger.debug(f"verification ledger: {e}")
+    return digest, False
+
+
+def record_remote_package(hostname, dev):
+    """Record the remote package as verified after a checked copy.
+
+    The hashcache makes later checks in this run skip the device, and
+    the verification ledger does the same for later runs.
+    """
+    model = dev.facts["model"]
+    file = get_model_file(hostname, model)
+    pkg_hash = get_model_hash(hostname, model)
+    set_hashcache(hostname, file, pkg_hash)
+    path = common.config.get(hostname, "rpath") + "/" + file
+    try:
+        stat = _remote_stat(dev, path)
+        if stat is not None:
+            cache.store_remote_digest(
+                hostname, path, common.config.get(hostname, "hashalgo"), *stat, pkg_hash
+            )
+    except Exception as e:
+        logger.debug(f"verification ledger: {e}")
+
+
 def check_remote_package(hostname, dev):
     """Check remote package checksum.
 
@@ -424,29 +612,28 @@ def check_remote_package(hostname, dev):
     if len(file) == 0 or len(pkg_hash) == 0:
         return None
     algo = common.config.get(hostname, "hashalgo")
-    sw = SW(dev)
     ret = None
     if get_hashcache(hostname, file) == pkg_hash:
         print(f"  - remote package: {file} is found. checksum(cache) is OK.")
         return True
     try:
-        val = sw.remote_checksum(
-            common.config.get(hostname, "rpath") + "/" + file, algorithm=algo
+        val, cached = remote_checksum(
+            hostname, dev, common.config.get(hostname, "rpath") + "/" + file, algo
         )
+        source = "checksum(cache)" if cached else "checksum"
         if val is None:
             print(f"  - remote package: {file} is not found.")
         elif val == pkg_hash:
-            print(f"  - remote package: {file} is found. checksum is OK.")
+            print(f"  - remote package: {file} is found. {source} is OK.")
             set_hashcache(hostname, file, val)
             ret = True
         else:
-            print(f"  - remote package: {file} is found. checksum is BAD. COPY AGAIN!")
+            print(f"  - remote package: {file} is found. {source} is BAD. COPY AGAIN!")
             ret = False
     except RpcError as e:
         logger.error("Unable to remote checksum: {0}".format(e))
     except Exception as e:
         logger.error(e)
-    del sw
     return ret
 
 
@@ -558,6 +745,7 @@ def compare_version(left: str, right: str) -> int | None:
     return 0
 
 
+@_probe
 def get_pending_version(hostname, dev) -> str:
     """Get pending (staged) version string.
 
@@ -662,19 +850,19 @@ def get_pending_version(hostname, dev) -> str:
                             pending = None
             except Exception as e:
                 print(e)
-                return None
+                return _PROBE_FAILED
         else:
             print("Unknown personality:", dev.facts)
             return None
     except RpcError as e:
         print("Show version failure caused by RpcError:", e)
-        return None
+        return _PROBE_FAILED
     except RpcTimeoutError as e:
         print("Show version failure caused by RpcTimeoutError:", e)
-        return None
+        return _PROBE_FAILED
     except Exception as e:
         print(e)
-        return None
+        return _PROBE_FAILED
     return pending
 
 
@@ -721,6 +909,7 @@ def get_reboot_information(hostname, dev):
     return m.group(1)
 
 
+@_probe
 def get_commit_information(dev):
     """Get the latest commit information.
 
@@ -730,13 +919,13 @@ def get_commit_information(dev):
         xml = dev.rpc.get_commit_information()
     except RpcError as e:
         logger.error(f"get_commit_information: RpcError: {e}")
-        return None
+        return _PROBE_FAILED
     except RpcTimeoutError as e:
         logger.error(f"get_commit_information: RpcTimeoutError: {e}")
-        return None
+        return _PROBE_FAILED
     except Exception as e:
         logger.error(f"get_commit_information: {e}")
-        return None
+        return _PROBE_FAILED
 
     for elem in xml:
         if elem.tag == "commit-history":
@@ -751,6 +940,7 @@ def get_commit_information(dev):
     return None
 
 
+@_probe
 def get_rescue_config_time(dev):
     """Get rescue config file modification time.
 
@@ -760,13 +950,13 @@ def get_rescue_config_time(dev):
         xml = dev.rpc.file_list(path="/config/rescue.conf.gz", detail=True)
     except RpcError as e:
         logger.error(f"get_rescue_config_time: RpcError: {e}")
-        return None
+        return _PROBE_FAILED
     except RpcTimeoutError as e:
         logger.error(f"get_rescue_config_time: RpcTimeoutError: {e}")
-        return None
+        return _PROBE_FAILED
     except Exception as e:
         logger.error(f"get_rescue_config_time: {e}")
-        return None
+        return _PROBE_FAILED
 
     # ファイルが存在しない場合は <output> にエラーメッセージが入る
     file_info = xml.find(".//file-information")
@@ -872,6 +1062,7 @@ def check_and_reinstall(hostname, dev) -> bool:
 
     # rescue config 再保存
     cu = Config(dev)
+    common.invalidate_probes(dev)
     try:
         ret = cu.rescue("save")
         if ret:
@@ -886,21 +1077,23 @@ def check_and_reinstall(hostname, dev) -> bool:
     # 再インストール（validation 付き）
     try:
         sw = SW(dev)
-        status, msg = sw.install(
-            get_model_file(hostname, dev.facts["model"]),
-            remote_path=common.config.get(hostname, "rpath"),
-            progress=True,
-            validate=True,
-            cleanfs=False,
-            no_copy=True,
-            issu=False,
-            nssu=False,
-            timeout=2400,
-            checksum=get_model_hash(hostname, dev.facts["model"]),
-            checksum_timeout=1200,
-            checksum_algorithm=common.config.get(hostname, "hashalgo"),
-            all_re=True,
-        )
+        common.invalidate_probes(dev)
+        with report.phase("install"):
+            status, msg = sw.install(
+                get_model_file(hostname, dev.facts["model"]),
+                remote_path=common.config.get(hostname, "rpath"),
+                progress=True,
+                validate=True,
+                cleanfs=False,
+                no_copy=True,
+                issu=False,
+                nssu=False,
+                timeout=timeouts.get_timeout(hostname, dev, "install"),
+                checksum=get_model_hash(hostname, dev.facts["model"]),
+                checksum_timeout=timeouts.get_timeout(hostname, dev, "checksum"),
+                checksum_algorithm=common.config.get(hostname, "hashalgo"),
+                all_re=True,
+            )
         del sw
         logger.debug(f"check_and_reinstall: {msg=}")
         if status:
@@ -941,7 +1134,9 @@ def reboot(hostname: str, dev, reboot_dt: datetime.datetime):
                 logger.debug("skip clear reboot")
 
     # config 変更検出 + 自動再インストール
-    if check_and_reinstall(hostname, dev):
+    with report.phase("reinstall"):
+        reinstall_failed = check_and_reinstall(hostname, dev)
+    if reinstall_failed:
         return 6
 
     # reboot
@@ -951,7 +1146,8 @@ def reboot(hostname: str, dev, reboot_dt: datetime.datetime):
         if common.args.dry_run:
             msg = f"dry-run: reboot at {at_str}"
         else:
-            msg = sw.reboot(at=at_str)
+            with report.phase("reboot"):
+                msg = sw.reboot(at=at_str)
     except ConnectError as e:
         logger.error(f"{e=}")
         return 4
@@ -1050,6 +1246,7 @@ def load_config(hostname, dev, configfile) -> bool:
 
         # commit confirmed（自動ロールバック付き）
         confirm_timeout = getattr(common.args, "confirm_timeout", 1)
+        common.invalidate_probes(dev)
         cu.commit(confirm=confirm_timeout)
         print(f"\tcommit confirmed {confirm_timeout} applied")
 
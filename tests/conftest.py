@@ -7,6 +7,13 @@ from junos_ops import cli as junos_update_mod
 from junos_ops import upgrade as junos_upgrade_mod
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """~/.cache や ~/.local/state を汚さないよう XDG_* を一時ディレクトリに向ける"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+
+
 @pytest.fixture
 def junos_common():
     """common モジュールを返す"""
@@ -0,0 +1,140 @@
+"""AdaptiveLimiter / --adaptive のテスト"""
+
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+from jnpr.junos.exception import ConnectTimeoutError, RpcTimeoutError
+
+
+@pytest.fixture
+def no_limiter(junos_common):
+    """テスト後にグローバル limiter を元に戻す"""
+    yield
+    junos_common.limiter = None
+
+
+class TestAdaptiveLimiter:
+    """AdaptiveLimiter の増減テスト"""
+
+    def test_starts_at_floor(self, junos_common):
+        lim = junos_common.AdaptiveLimiter(2, 10)
+        assert lim.limit == 2
+
+    def test_fast_connect_increases(self, junos_common):
+        """高速な接続ごとに +1"""
+        lim = junos_common.AdaptiveLimiter(1, 10)
+        for _ in range(3):
+            lim.observe_connect(0.5)
+        assert lim.limit == 4
+
+    def test_ceiling(self, junos_common):
+        """ceiling を超えない"""
+        lim = junos_common.AdaptiveLimiter(1, 3)
+        for _ in range(10):
+            lim.observe_connect(0.5)
+        assert lim.limit == 3
+
+    def test_slow_connect_decreases(self, junos_common):
+        """ベースラインの slowdown 倍を超える遅延で -1"""
+        lim = junos_common.AdaptiveLimiter(1, 10)
+        for _ in range(5):
+            lim.observe_connect(0.5)
+        assert lim.limit == 6
+        lim.observe_connect(5.0)
+        assert lim.limit == 5
+
+    def test_failure_halves(self, junos_common):
+        """タイムアウト等で半減、floor 未満にはならない"""
+        lim = junos_common.AdaptiveLimiter(2, 20)
+        lim.limit = 16
+        lim.observe_failure()
+        assert lim.limit == 8
+        for _ in range(5):
+            lim.observe_failure()
+        assert lim.limit == 2
+
+
+class TestSetupLimiter:
+    """setup_limiter() のテスト"""
+
+    def test_disabled(self, junos_common, mock_args, no_limiter):
+        assert junos_common.setup_limiter(20) is None
+        assert junos_common.limiter is None
+
+    def test_enabled(self, junos_common, mock_args, no_limiter):
+        mock_args.adaptive = True
+        mock_args.min_workers = 4
+        lim = junos_common.setup_limiter(30)
+        assert junos_common.limiter is lim
+        assert (lim.floor, lim.ceiling, lim.limit) == (4, 30, 4)
+
+
+class TestAdaptiveConnect:
+    """connect() から limiter への通知"""
+
+    def test_success_observed(self, junos_common, mock_args, mock_config, no_limiter):
+        junos_common.limiter = junos_common.AdaptiveLimiter(1, 10)
+        with patch.object(junos_common, "Device") as MockDevice:
+            MockDevice.return_value = MagicMock()
+            err, dev = junos_common.connect("test-host")
+        assert err is False
+        assert junos_common.limiter.limit == 2
+
+    def test_timeout_observed(self, junos_common, mock_args, mock_config, no_limiter):
+        junos_common.limiter = junos_common.AdaptiveLimiter(1, 10)
+        junos_common.limiter.limit = 8
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = ConnectTimeoutError(mock_dev)
+            err, dev = junos_common.connect("test-host")
+        assert err is True
+        assert junos_common.limiter.limit == 4
+
+    def test_rpc_timeout_observed(self, junos_common, mock_args, mock_config, no_limiter):
+        """セッション上の RpcTimeoutError も limiter に通知される"""
+        junos_common.limiter = junos_common.AdaptiveLimiter(1, 10)
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.execute.side_effect = RpcTimeoutError(mock_dev, "get-x", 30)
+            err, dev = junos_common.connect("test-host")
+        junos_common.limiter.limit = 8
+        with pytest.raises(RpcTimeoutError):
+            dev.execute("<get-x/>")
+        assert junos_common.limiter.limit == 4
+
+
+class TestRunScheduled:
+    """adaptive limiter 使用時の run_parallel() のテスト"""
+
+    def _run(self, junos_common):
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def work(t):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+            if t == "3":
+                raise RuntimeError("fail")
+            return 0
+
+        results = junos_common.run_parallel(
+            work, [str(i) for i in range(8)], max_workers=10,
+        )
+        return results, state["peak"]
+
+    def test_limit_respected(self, junos_common, no_limiter):
+        """limit を超えて同時実行しない"""
+        junos_common.limiter = junos_common.AdaptiveLimiter(2, 2)
+        results, peak = self._run(junos_common)
+        assert peak <= 2
+        assert len(results) == 8
+        assert results["3"] == 1
+        assert results["0"] == 0
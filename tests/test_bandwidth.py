@@ -0,0 +1,185 @@
+"""copy 帯域制限（bandwidth モジュール）のテスト"""
+
+import argparse
+import inspect
+from unittest.mock import patch
+
+import pytest
+
+from junos_ops import bandwidth
+
+
+def _copy_in_worker(target):
+    """ワーカープロセス内でグローバルバケットから予約し、転送量を記録する"""
+    bucket = bandwidth._get_global_bucket()
+    wait = bucket.reserve(bucket.capacity * 4)
+    bandwidth._record(target, 1000)
+    return wait
+
+
+@pytest.fixture(autouse=True)
+def reset_bandwidth():
+    """モジュール状態をテストごとに初期化"""
+    bandwidth._global_bucket = None
+    bandwidth._tag_buckets.clear()
+    bandwidth._stats.clear()
+    yield
+    bandwidth._global_bucket = None
+    bandwidth._tag_buckets.clear()
+    bandwidth._stats.clear()
+
+
+class TestParseRate:
+    """parse_rate() / rate_type() のテスト"""
+
+    def test_mega(self):
+        assert bandwidth.parse_rate("400M") == 50 * 10**6
+
+    def test_lowercase_kilo(self):
+        assert bandwidth.parse_rate("800k") == 100 * 10**3
+
+    def test_fraction_giga(self):
+        assert bandwidth.parse_rate("1.6G") == 200 * 10**6
+
+    def test_plain_bits(self):
+        assert bandwidth.parse_rate("8000") == 1000
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            bandwidth.parse_rate("fast")
+
+    def test_zero(self):
+        with pytest.raises(ValueError):
+            bandwidth.parse_rate("0M")
+
+    def test_rate_type_error(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            bandwidth.rate_type("400X")
+
+
+class TestTokenBucket:
+    """TokenBucket のテスト"""
+
+    def test_burst_no_wait(self):
+        bucket = bandwidth.TokenBucket(10**6)
+        assert bucket.reserve(100000) == 0.0
+
+    def test_deficit_wait(self):
+        """容量を超えた分はレートに応じて待機時間になる"""
+        bucket = bandwidth.TokenBucket(10**6)
+        wait = bucket.reserve(bucket.capacity + 500000)
+        assert wait == pytest.approx(0.5, abs=0.01)
+
+    def test_waits_accumulate(self):
+        """連続した予約は順に待機時間が延びる（公平な分配）"""
+        bucket = bandwidth.TokenBucket(10**6)
+        bucket.reserve(bucket.capacity)
+        first = bucket.reserve(100000)
+        second = bucket.reserve(100000)
+        assert second > first
+
+
+class TestBucketsFor:
+    """buckets_for() のテスト"""
+
+    def test_none(self, junos_common, mock_args, mock_config):
+        assert bandwidth.buckets_for("test-host") == []
+
+    def test_global(self, junos_common, mock_args, mock_config):
+        mock_args.copy_bandwidth = bandwidth.parse_rate("400M")
+        buckets = bandwidth.buckets_for("test-host")
+        assert [b.rate for b in buckets] == [50 * 10**6]
+        # グローバルバケットは共有される
+        assert bandwidth.buckets_for("test-host")[0] is buckets[0]
+
+    def test_global_not_split_across_processes(self, junos_common, mock_args, mock_config):
+        """--processes でもバケットは全体のレートのまま（ワーカー間で共有する）"""
+        mock_args.copy_bandwidth = bandwidth.parse_rate("400M")
+        mock_args.processes = 4
+        assert bandwidth.buckets_for("test-host")[0].rate == 50 * 10**6
+
+    def test_host_and_tag(self, junos_common, mock_args, mock_config):
+        mock_config.set("test-host", "copy_bandwidth", "80M")
+        mock_config.set("test-host", "tags", "osaka-wan")
+        mock_config.add_section("limit:osaka-wan")
+        mock_config.set("limit:osaka-wan", "bandwidth", "160M")
+        buckets = bandwidth.buckets_for("test-host")
+        assert [b.rate for b in buckets] == [10 * 10**6, 20 * 10**6]
+
+
+class TestProcesses:
+    """--processes のワーカー間でのバケット共有と統計の集約"""
+
+    def test_shared_across_workers(self, junos_common, mock_args, mock_config, tmp_path):
+        cfg = tmp_path / "config.ini"
+        cfg.write_text("[DEFAULT]\nhost = 192.0.2.1\n")
+        mock_args.config = str(cfg)
+        mock_args.copy_bandwidth = bandwidth.parse_rate("8M")
+        results = junos_common.run_parallel(
+            _copy_in_worker, ["a", "b"], max_workers=2, processes=2,
+        )
+        first, second = sorted(results.values())
+        # 1 MB/s のバケットを2プロセスで共有するため、後から予約した側はさらに待つ
+        assert second - first > 0.5
+        assert sorted(bandwidth.snapshot()) == ["a", "b"]
+
+    def test_share_tag_buckets(self, junos_common, mock_args, mock_config):
+        import multiprocessing
+
+        mock_config.add_section("limit:osaka-wan")
+        mock_config.set("limit:osaka-wan", "bandwidth", "160M")
+        global_bucket, tag_buckets = bandwidth.share(multiprocessing.get_context("spawn"))
+        assert global_bucket is None
+        assert tag_buckets["osaka-wan"].rate == 20 * 10**6
+        assert tag_buckets["osaka-wan"].reserve(1000) == 0.0
+
+
+class TestCopyProgress:
+    """copy_progress() のテスト"""
+
+    def test_scp_signature(self, junos_common, mock_args, mock_config):
+        """PyEZ の SCP が (path, total, xfrd) で直接呼ぶ形式"""
+        cb = bandwidth.copy_progress("test-host")
+        assert len(inspect.getfullargspec(cb).args) == 3
+
+    def test_text_report(self, junos_common, mock_args, mock_config, capsys):
+        cb = bandwidth.copy_progress("test-host")
+        cb(object(), "checksum check passed.")
+        assert "test-host: checksum check passed." in capsys.readouterr().out
+
+    def test_records_and_prints(self, junos_common, mock_args, mock_config, capsys):
+        cb = bandwidth.copy_progress("test-host")
+        cb(b"pkg.tgz", 1000, 0)
+        cb(b"pkg.tgz", 1000, 500)
+        cb(b"pkg.tgz", 1000, 1000)
+        nbytes, seconds = bandwidth.get_throughput("test-host")
+        assert nbytes == 1000
+        out = capsys.readouterr().out
+        assert "test-host: pkg.tgz: 1000 / 1000 (100%)" in out
+
+    def test_throttles(self, junos_common, mock_args, mock_config):
+        """予算を超えると sleep で送信を遅らせる"""
+        mock_args.copy_bandwidth = 8 * 10**6 / 8  # 1 MB/s
+        cb = bandwidth.copy_progress("test-host")
+        with patch.object(bandwidth.time, "sleep") as mock_sleep:
+            cb(b"pkg.tgz", 10**7, 0)
+            cb(b"pkg.tgz", 10**7, 2 * 10**6)
+        assert mock_sleep.call_count == 1
+        assert mock_sleep.call_args[0][0] > 1.0
+
+
+class TestSummary:
+    """print_summary() のテスト"""
+
+    def test_empty(self, capsys):
+        bandwidth.print_summary()
+        assert capsys.readouterr().out == ""
+
+    def test_per_host(self, capsys):
+        bandwidth._stats["rt1"] = [10**7, 100.0, 110.0]
+        bandwidth._stats["rt2"] = [10**7, 100.0, 120.0]
+        bandwidth.print_summary()
+        out = capsys.readouterr().out
+        assert "rt1: 10.0 MB in 10.0 s (8.0 Mbit/s)" in out
+        assert "rt2: 10.0 MB in 20.0 s (4.0 Mbit/s)" in out
+        assert "total: 20.0 MB in 20.0 s (8.0 Mbit/s)" in out
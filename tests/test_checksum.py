@@ -0,0 +1,260 @@
+"""ローカルパッケージのチェックサム（ダイジェストキャッシュ）のテスト"""
+
+import hashlib
+import os
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from junos_ops import cache
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "junos-arm-32-22.4R3-S6.5.tgz"
+    path.write_bytes(b"junos image")
+    return path
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+class TestDigestCache:
+    """file_identity() / load_digest() / store_digest() のテスト"""
+
+    def test_roundtrip(self, package):
+        identity = cache.file_identity(str(package))
+        assert cache.load_digest(identity, "md5") is None
+        cache.store_digest(identity, "md5", "abc")
+        assert cache.load_digest(identity, "md5") == "abc"
+        assert cache.load_digest(identity, "sha256") is None
+
+    def test_identity(self, package):
+        path, size, mtime_ns, inode = cache.file_identity(package.name)
+        assert path == str(package)
+        assert size == len(b"junos image")
+        assert inode == os.stat(package).st_ino
+
+    def test_touched_file_invalidates(self, package):
+        identity = cache.file_identity(str(package))
+        cache.store_digest(identity, "md5", "abc")
+        st = os.stat(package)
+        os.utime(package, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        assert cache.load_digest(cache.file_identity(str(package)), "md5") is None
+
+    def test_missing_file(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            cache.file_identity(str(tmp_path / "nosuch.tgz"))
+
+
+class TestLocalChecksum:
+    """upgrade.local_checksum() のテスト"""
+
+    def test_hashed_once_across_runs(self, junos_upgrade, package):
+        with patch.object(
+            junos_upgrade.SW, "local_checksum", return_value=_md5(b"junos image")
+        ) as mock_sum:
+            first = junos_upgrade.local_checksum(package.name, "md5")
+            second = junos_upgrade.local_checksum(package.name, "md5")
+        assert first == second == _md5(b"junos image")
+        mock_sum.assert_called_once()
+
+    def test_changed_file_rehashed(self, junos_upgrade, package):
+        assert junos_upgrade.local_checksum(package.name, "md5") == _md5(b"junos image")
+        package.write_bytes(b"another junos image")
+        assert junos_upgrade.local_checksum(package.name, "md5") == _md5(b"another junos image")
+
+    def test_cache_error_ignored(self, junos_upgrade, package):
+        """キャッシュが使えなくてもチェックサムは計算する"""
+        with patch.object(cache, "load_digest", side_effect=OSError("read-only")), \
+                patch.object(cache, "store_digest", side_effect=OSError("read-only")):
+            assert junos_upgrade.local_checksum(package.name, "md5") == _md5(b"junos image")
+
+    def test_check_local_package(self, junos_upgrade, mock_args, mock_config, package, capsys):
+        mock_config.set("DEFAULT", "ex2300-24t.hash", _md5(b"junos image"))
+        dev = MagicMock()
+        dev.facts = {"model": "EX2300-24T"}
+        assert junos_upgrade.check_local_package("test-host", dev) is True
+        assert "checksum is OK" in capsys.readouterr().out
+
+
+class TestSingleFlight:
+    """同じファイルの同時計算を1回にまとめる"""
+
+    def _run(self, func, n=10):
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(func())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_hashed_once(self, junos_upgrade, package):
+        calls = []
+
+        def slow_checksum(file, algorithm):
+            calls.append(file)
+            time.sleep(0.1)
+            return "digest"
+
+        with patch.object(junos_upgrade.SW, "local_checksum", side_effect=slow_checksum):
+            results, errors = self._run(lambda: junos_upgrade.local_checksum(package.name, "md5"))
+        assert errors == []
+        assert results == ["digest"] * 10
+        assert len(calls) == 1
+        assert junos_upgrade._digests_inflight == {}
+
+    def test_error_shared_then_retried(self, junos_upgrade, package):
+        """計算の失敗は待機中のスレッドにも伝わり、次の呼び出しで再計算する"""
+        def failing(file, algorithm):
+            time.sleep(0.1)
+            raise OSError("I/O error")
+
+        with patch.object(junos_upgrade.SW, "local_checksum", side_effect=failing) as mock_sum:
+            results, errors = self._run(lambda: junos_upgrade.local_checksum(package.name, "md5"))
+        assert results == []
+        assert len(errors) == 10
+        assert mock_sum.call_count == 1
+        with patch.object(junos_upgrade.SW, "local_checksum", return_value="digest"):
+            assert junos_upgrade.local_checksum(package.name, "md5") == "digest"
+
+    def test_algorithms_separate(self, junos_upgrade, package):
+        with patch.object(junos_upgrade.SW, "local_checksum", side_effect=lambda f, algorithm: algorithm):
+            assert junos_upgrade.local_checksum(package.name, "md5") == "md5"
+            assert junos_upgrade.local_checksum(package.name, "sha256") == "sha256"
+
+
+class TestRemoteLedger:
+    """リモートパッケージの検証台帳（remote_checksum / check_remote_package）"""
+
+    PATH = "/var/tmp/junos-arm-32-22.4R3-S6.5.tgz"
+
+    @pytest.fixture
+    def device(self, junos_upgrade):
+        """FS.stat と SW.remote_checksum を差し替えた機器"""
+        stat = {"type": "file", "size": 1000, "ts_epoc": "1700000000"}
+        with patch.object(junos_upgrade, "FS") as MockFS, \
+                patch.object(junos_upgrade, "SW") as MockSW:
+            MockFS.return_value.stat.side_effect = lambda path: stat
+            MockSW.return_value.remote_checksum.return_value = "digest"
+            yield stat, MockFS.return_value, MockSW.return_value
+
+    def test_recorded_then_reused(self, junos_upgrade, device):
+        stat, fs, sw = device
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5") == ("digest", False)
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5") == ("digest", True)
+        sw.remote_checksum.assert_called_once_with(self.PATH, algorithm="md5")
+        assert fs.stat.call_count == 2
+
+    def test_changed_file_rechecked(self, junos_upgrade, device):
+        stat, fs, sw = device
+        junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5")
+        stat["ts_epoc"] = "1700000100"
+        sw.remote_checksum.return_value = "new-digest"
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5") == ("new-digest", False)
+        stat["size"] = 2000
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5")[1] is False
+        assert sw.remote_checksum.call_count == 3
+
+    def test_per_host_and_algo(self, junos_upgrade, device):
+        stat, fs, sw = device
+        junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5")
+        assert junos_upgrade.remote_checksum("h2", MagicMock(), self.PATH, "md5")[1] is False
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "sha256")[1] is False
+
+    def test_not_found(self, junos_upgrade, device):
+        stat, fs, sw = device
+        fs.stat.side_effect = lambda path: None
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5") == (None, False)
+        sw.remote_checksum.assert_not_called()
+
+    def test_stat_error_falls_back(self, junos_upgrade, device):
+        """file list に失敗したら台帳を使わずに計算し、記録もしない"""
+        stat, fs, sw = device
+        fs.stat.side_effect = RuntimeError("rpc failed")
+        assert junos_upgrade.remote_checksum("h1", MagicMock(), self.PATH, "md5") == ("digest", False)
+        assert cache.load_remote_digest("h1", self.PATH, "md5") is None
+
+    def test_check_remote_package(self, junos_upgrade, mock_args, mock_config, device, capsys):
+        stat, fs, sw = device
+        mock_config.set("DEFAULT", "ex2300-24t.hash", "digest")
+        dev = MagicMock()
+        dev.facts = {"model": "EX2300-24T"}
+        assert junos_upgrade.check_remote_package("test-host", dev) is True
+        assert "checksum is OK" in capsys.readouterr().out
+        # 新しいプロセス相当（メモリ上の hashcache なし）でも台帳で検証できる
+        mock_config.remove_option("test-host", "junos-arm-32-22.4R3-S6.5.tgzhashcache")
+        assert junos_upgrade.check_remote_package("test-host", dev) is True
+        assert "checksum(cache) is OK" in capsys.readouterr().out
+        sw.remote_checksum.assert_called_once()
+
+
+class TestVerifiedState:
+    """コピーで検証済みになったパッケージを同じ実行中に再計算しない"""
+
+    @pytest.fixture
+    def dev(self, junos_upgrade, mock_args, mock_config):
+        from lxml import etree
+
+        mock_config.set("DEFAULT", "ex2300-24t.hash", "digest")
+        dev = MagicMock()
+        dev.facts = {"model": "EX2300-24T"}
+        dev.rpc.request_system_storage_cleanup.return_value = etree.fromstring(
+            "<output><success/></output>"
+        )
+        stat = {"type": "file", "size": 1000, "ts_epoc": "1700000000"}
+        with patch.object(junos_upgrade, "FS") as MockFS, \
+                patch.object(junos_upgrade, "SW") as MockSW, \
+                patch.object(junos_upgrade, "check_running_package", return_value=False), \
+                patch.object(junos_upgrade, "delete_snapshots", return_value=False):
+            MockFS.return_value.stat.side_effect = lambda path: None
+            MockSW.return_value.remote_checksum.return_value = None
+            MockSW.return_value.safe_copy.return_value = True
+            dev.stat, dev.fs, dev.sw = stat, MockFS.return_value, MockSW.return_value
+            yield dev
+
+    def test_copy_skips_precheck(self, junos_upgrade, dev):
+        """転送前の checksum は check_remote_package が済ませている"""
+        assert junos_upgrade.copy("test-host", dev) is False
+        assert dev.sw.safe_copy.call_args.kwargs["force_copy"] is True
+
+    def test_copy_records_verified(self, junos_upgrade, dev, capsys):
+        def copied(*args, **kwargs):
+            dev.fs.stat.side_effect = lambda path: dev.stat
+            return True
+
+        dev.sw.safe_copy.side_effect = copied
+        assert junos_upgrade.copy("test-host", dev) is False
+        assert junos_upgrade.get_hashcache("test-host", "junos-arm-32-22.4R3-S6.5.tgz") == "digest"
+        assert cache.load_remote_digest(
+            "test-host", "/var/tmp/junos-arm-32-22.4R3-S6.5.tgz", "md5"
+        ) == (1000, 1700000000, "digest")
+        capsys.readouterr()
+        assert junos_upgrade.check_remote_package("test-host", dev) is True
+        assert "checksum(cache) is OK" in capsys.readouterr().out
+        dev.sw.remote_checksum.assert_not_called()
+
+    def test_failed_copy_not_recorded(self, junos_upgrade, mock_args, dev):
+        mock_args.force = True
+        junos_upgrade.set_hashcache("test-host", "junos-arm-32-22.4R3-S6.5.tgz", "digest")
+        dev.sw.safe_copy.return_value = False
+        assert junos_upgrade.copy("test-host", dev) is True
+        assert junos_upgrade.get_hashcache("test-host", "junos-arm-32-22.4R3-S6.5.tgz") is None
+
+    def test_clear_hashcache(self, junos_upgrade, mock_config):
+        junos_upgrade.set_hashcache("test-host", "file.tgz", "hash")
+        junos_upgrade.clear_hashcache("test-host", "file.tgz")
+        assert junos_upgrade.get_hashcache("test-host", "file.tgz") is None
+        junos_upgrade.clear_hashcache("nonexistent-host", "file.tgz")
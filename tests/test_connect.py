@@ -1,7 +1,10 @@
 """connect() のモックテスト"""
 
+import time
 from unittest.mock import patch, MagicMock
 
+import pytest
+
 from jnpr.junos.exception import (
     ConnectAuthError,
     ConnectClosedError,
@@ -85,3 +88,246 @@ class TestConnect:
 
             assert err is True
             assert dev is None
+
+
+class _LazyFacts(dict):
+    """PyEZ の new-style facts と同様に、参照時に取得する facts"""
+
+    def __init__(self):
+        super().__init__()
+        self.fetched = []
+
+    def __getitem__(self, key):
+        if key not in self:
+            time.sleep(0.01)
+            self.fetched.append(key)
+            self[key] = f"{key}-value"
+        return super().__getitem__(key)
+
+
+class TestConnectFacts:
+    """connect() の facts 取得範囲のテスト"""
+
+    @pytest.fixture
+    def mock_dev(self, junos_common):
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            mock_dev.facts = _LazyFacts()
+            MockDevice.return_value = mock_dev
+            yield mock_dev
+
+    def _connect(self, junos_common, **kwargs):
+        """report を有効にして接続し、ホストの記録を返す"""
+        from junos_ops import report
+
+        report.enable()
+        report.Reported(lambda h: junos_common.connect(h, **kwargs)[0])("test-host")
+        record = report.snapshot()["test-host"]
+        report.reset()
+        return record
+
+    def test_all_facts(self, junos_common, mock_args, mock_config, mock_dev):
+        """facts 未指定時は facts キャッシュに載せる facts を取得"""
+        from junos_ops import cache
+
+        record = self._connect(junos_common)
+        mock_dev.open.assert_called_once_with()
+        assert mock_dev.facts.fetched == list(cache.FACTS_KEYS)
+        assert cache.load_facts()["test-host"]["model"] == "model-value"
+        assert record["phases"]["facts"] >= 0.01 * len(cache.FACTS_KEYS)
+
+    def test_subset(self, junos_common, mock_args, mock_config, mock_dev):
+        """指定した facts だけを facts フェーズで取得"""
+        record = self._connect(junos_common, facts=("model", "version"))
+        assert mock_dev.facts.fetched == ["model", "version"]
+        assert record["phases"]["facts"] >= 0.02
+        # 接続時間には facts の取得時間を含めない
+        assert record["connect_time"] < record["phases"]["facts"]
+
+    def test_none(self, junos_common, mock_args, mock_config, mock_dev):
+        """空タプルなら facts を一切取得しない"""
+        record = self._connect(junos_common, facts=())
+        assert mock_dev.facts.fetched == []
+        assert "facts" not in record["phases"]
+
+    def test_facts_failure(self, junos_common, mock_args, mock_config, mock_dev):
+        """facts の取得に失敗しても接続は成功とし、参照時に取り直す"""
+        mock_dev.facts = MagicMock()
+        mock_dev.facts.__getitem__.side_effect = RuntimeError("rpc failed")
+        err, dev = junos_common.connect("test-host", facts=("model",))
+        assert err is False
+        assert dev is mock_dev
+
+    def test_show_skips_facts(self, junos_common, mock_args, mock_config):
+        """show サブコマンドは facts を取得せずに接続する"""
+        from junos_ops import cli
+        mock_args.show_command = "show version"
+        mock_args.showfile = None
+        with patch.object(junos_common, "connect") as mock_connect:
+            mock_dev = MagicMock()
+            mock_dev.cli.return_value = "ok"
+            mock_connect.return_value = (False, mock_dev)
+            assert cli.cmd_show("test-host") == 0
+            mock_connect.assert_called_once_with("test-host", facts=())
+
+
+class TestConnectRetry:
+    """connect() のリトライ（指数バックオフ + jitter）のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def no_sleep(self, junos_common, monkeypatch):
+        self.sleeps = []
+        monkeypatch.setattr(junos_common.time, "sleep", self.sleeps.append)
+
+    def test_retry_then_success(self, junos_common, mock_args, mock_config):
+        mock_args.retries = 2
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = [ConnectTimeoutError(mock_dev), None]
+            err, dev = junos_common.connect("test-host")
+        assert err is False
+        assert dev is mock_dev
+        assert mock_dev.open.call_count == 2
+        assert len(self.sleeps) == 1
+
+    def test_retry_clears_error(self, junos_common, mock_args, mock_config):
+        """リトライで接続できたホストにはエラーを残さない"""
+        from junos_ops import report
+
+        mock_args.retries = 1
+        report.enable()
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = [ConnectTimeoutError(mock_dev), None]
+            report.Reported(lambda h: junos_common.connect(h, facts=())[0])("test-host")
+        record = report.snapshot()["test-host"]
+        report.reset()
+        assert record["status"] == 0
+        assert record["error"] is None
+        assert record["message"] is None
+
+    def test_retry_exhausted(self, junos_common, mock_args, mock_config):
+        mock_args.retries = 2
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = ConnectRefusedError(mock_dev)
+            err, dev = junos_common.connect("test-host")
+        assert err is True
+        assert dev is None
+        assert mock_dev.open.call_count == 3
+
+    def test_auth_not_retried(self, junos_common, mock_args, mock_config):
+        """認証エラーはリトライしない"""
+        mock_args.retries = 5
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = ConnectAuthError(mock_dev)
+            err, dev = junos_common.connect("test-host")
+        assert err is True
+        assert mock_dev.open.call_count == 1
+        assert self.sleeps == []
+
+    def test_config_retries(self, junos_common, mock_args, mock_config):
+        """--retries 未指定時は config の connect_retries を使う"""
+        mock_config.set("test-host", "connect_retries", "1")
+        assert junos_common.get_connect_retries("test-host") == 1
+        mock_args.retries = 0
+        assert junos_common.get_connect_retries("test-host") == 0
+
+    def test_backoff_bounds(self, junos_common):
+        for attempt in range(10):
+            delay = junos_common.backoff_delay(attempt, 2.0)
+            assert 0 <= delay <= min(junos_common.MAX_BACKOFF, 2.0 * 2**attempt)
+
+
+class TestAuthBreaker:
+    """認証失敗のサーキットブレーカーのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def reset_breaker(self, junos_common):
+        yield
+        junos_common.breaker = None
+
+    def _connect_auth_fail(self, junos_common, hostname="test-host"):
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = ConnectAuthError(mock_dev)
+            junos_common.connect(hostname)
+        return MockDevice
+
+    def test_trips(self, junos_common, mock_args, mock_config):
+        mock_args.max_auth_failures = 2
+        breaker = junos_common.setup_breaker()
+        self._connect_auth_fail(junos_common)
+        assert not breaker.tripped
+        self._connect_auth_fail(junos_common)
+        assert breaker.tripped
+        # 以降の接続はログインせずに失敗
+        MockDevice = self._connect_auth_fail(junos_common)
+        MockDevice.assert_not_called()
+        assert breaker.skipped == ["test-host"]
+
+    def test_success_resets(self, junos_common, mock_args, mock_config):
+        """成功したログインを挟むと連続回数はリセットされる"""
+        mock_args.max_auth_failures = 2
+        breaker = junos_common.setup_breaker()
+        self._connect_auth_fail(junos_common)
+        with patch.object(junos_common, "Device") as MockDevice:
+            MockDevice.return_value = MagicMock()
+            junos_common.connect("test-host")
+        self._connect_auth_fail(junos_common)
+        assert not breaker.tripped
+
+    def test_per_credential(self, junos_common, mock_args, mock_config):
+        """ホスト個別の認証情報が誤っていても、他の認証情報のホストは止めない"""
+        mock_args.max_auth_failures = 2
+        breaker = junos_common.setup_breaker()
+        for name, user in (("h1", "wrong1"), ("h2", "wrong2"), ("h3", "wrong1")):
+            mock_config.add_section(name)
+            mock_config.set(name, "host", name)
+            mock_config.set(name, "id", user)
+        self._connect_auth_fail(junos_common, "h1")
+        self._connect_auth_fail(junos_common, "h2")
+        assert not breaker.tripped
+        self._connect_auth_fail(junos_common, "h3")
+        assert breaker.tripped
+        assert breaker.users == ["wrong1"]
+        # wrong1 のホストはログインせず、その他の認証情報のホストは接続する
+        assert self._connect_auth_fail(junos_common, "h1").call_count == 0
+        with patch.object(junos_common, "Device") as MockDevice:
+            MockDevice.return_value = MagicMock()
+            err, dev = junos_common.connect("test-host", facts=())
+        assert err is False
+        assert breaker.skipped == ["h1"]
+
+    def test_disabled(self, junos_common, mock_args, mock_config):
+        mock_args.max_auth_failures = 0
+        assert junos_common.setup_breaker() is None
+
+    def test_run_parallel_skips(self, junos_common, mock_args, mock_config):
+        """ブレーカー作動後のホストは接続を試みない"""
+        mock_args.max_auth_failures = 1
+        junos_common.setup_breaker()
+        attempted = []
+
+        def func(hostname):
+            attempted.append(hostname)
+            err, dev = junos_common.connect(hostname)
+            return 1 if err else 0
+
+        for name in ("h1", "h2", "h3"):
+            mock_config.add_section(name)
+            mock_config.set(name, "host", name)
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = ConnectAuthError(mock_dev)
+            results = junos_common.run_parallel(func, ["h1", "h2", "h3"])
+            assert MockDevice.call_count == 1
+        assert results == {"h1": 1, "h2": 1, "h3": 1}
+        assert junos_common.breaker.skipped == ["h2", "h3"]
@@ -0,0 +1,228 @@
+"""daemon モード（セッションプールと UNIX ソケット経由の実行）のテスト"""
+
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+import types
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from junos_ops import cli
+from junos_ops import daemon
+
+
+@contextlib.contextmanager
+def _serving(path):
+    """別スレッドで serve() を起動し、待ち受け開始を待つ"""
+    thread = threading.Thread(target=daemon.serve, args=(path,))
+    thread.start()
+    try:
+        # ソケットファイルは listen 前に作られるため、サーバーの起動完了を待つ
+        for _ in range(100):
+            if daemon._server is not None:
+                break
+            time.sleep(0.02)
+        yield
+    finally:
+        daemon.shutdown()
+        thread.join(5)
+
+
+def _forward(argv, path):
+    """forward() を実行し、(終了コード, stdout, stderr) を返す"""
+    # 同一プロセス内ではジョブ実行中の sys.stdout がリダイレクトされているため、
+    # クライアント側の出力先は別に用意する
+    client = types.SimpleNamespace(stdout=io.StringIO(), stderr=io.StringIO())
+    with patch.object(daemon, "sys", client):
+        code = daemon.forward(argv, path)
+    return code, client.stdout.getvalue(), client.stderr.getvalue()
+
+
+def _dev(connected=True):
+    dev = MagicMock()
+    dev.connected = connected
+    return dev
+
+
+class TestSessionPool:
+    """SessionPool のテスト"""
+
+    def test_checkin_checkout(self):
+        pool = daemon.SessionPool()
+        dev = _dev()
+        pool.checkin("k", dev)
+        assert pool.checkout("k") is dev
+        assert pool.checkout("k") is None
+
+    def test_closed_session_dropped(self):
+        pool = daemon.SessionPool()
+        dev = _dev()
+        pool.checkin("k", dev)
+        dev.connected = False
+        assert pool.checkout("k") is None
+
+    def test_duplicate_closed(self):
+        """同じ機器のセッションが既にあれば返却分は閉じる"""
+        pool = daemon.SessionPool()
+        first, second = _dev(), _dev()
+        pool.checkin("k", first)
+        pool.checkin("k", second)
+        second.close.assert_called_once()
+        assert len(pool) == 1
+
+    def test_idle_eviction(self, monkeypatch):
+        pool = daemon.SessionPool(idle_timeout=10, keepalive=100)
+        now = time.monotonic()
+        monkeypatch.setattr(daemon.time, "monotonic", lambda: now)
+        dev = _dev()
+        pool.checkin("k", dev)
+        monkeypatch.setattr(daemon.time, "monotonic", lambda: now + 11)
+        pool.maintain()
+        dev.close.assert_called_once()
+        assert len(pool) == 0
+
+    def test_keepalive(self, monkeypatch):
+        pool = daemon.SessionPool(idle_timeout=100, keepalive=10)
+        now = time.monotonic()
+        monkeypatch.setattr(daemon.time, "monotonic", lambda: now)
+        ok, broken = _dev(), _dev()
+        broken.rpc.get_system_uptime_information.side_effect = Exception("gone")
+        pool.checkin("ok", ok)
+        pool.checkin("broken", broken)
+        monkeypatch.setattr(daemon.time, "monotonic", lambda: now + 11)
+        pool.maintain()
+        ok.rpc.get_system_uptime_information.assert_called_once()
+        assert pool.checkout("ok") is ok
+        broken.close.assert_called_once()
+        assert pool.checkout("broken") is None
+
+
+class TestPooledConnect:
+    """session_pool 設定時の connect() / release()"""
+
+    @pytest.fixture(autouse=True)
+    def pool(self, junos_common):
+        junos_common.session_pool = daemon.SessionPool()
+        yield junos_common.session_pool
+        junos_common.session_pool = None
+
+    def test_reuse(self, junos_common, mock_args, mock_config):
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = _dev()
+            MockDevice.return_value = mock_dev
+            assert junos_common.run_steps("test-host", [("a", lambda h, d: 0)]) == 0
+            assert junos_common.run_steps("test-host", [("a", lambda h, d: 0)]) == 0
+        MockDevice.assert_called_once()
+        mock_dev.open.assert_called_once()
+        mock_dev.close.assert_not_called()
+
+
+class TestForward:
+    """forward() と serve() のテスト"""
+
+    def test_no_daemon(self, tmp_path):
+        assert daemon.forward(["version"], str(tmp_path / "none.sock")) is None
+
+    def test_stale_socket(self, tmp_path):
+        path = tmp_path / "stale.sock"
+        path.write_text("")
+        assert daemon.forward(["version"], str(path)) is None
+
+    def test_shared_dir_ignored(self, tmp_path, capsys):
+        """他のユーザーも書けるディレクトリのソケットには転送しない"""
+        import socket
+
+        directory = tmp_path / "shared"
+        directory.mkdir(mode=0o700)
+        path = str(directory / "d.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen()
+        try:
+            directory.chmod(0o777)
+            assert daemon.forward(["version"], path) is None
+            assert "not private" in capsys.readouterr().err
+            directory.chmod(0o700)
+            with patch.object(daemon.os, "getuid", return_value=os.getuid() + 1):
+                assert daemon.forward(["version"], path) is None
+        finally:
+            sock.close()
+
+    def test_serve_refuses_shared_dir(self, tmp_path, capsys):
+        directory = tmp_path / "shared"
+        directory.mkdir()
+        directory.chmod(0o755)
+        assert daemon.serve(str(directory / "d.sock")) == 1
+        assert "mode 0700" in capsys.readouterr().out
+
+    def test_client_environ(self, monkeypatch):
+        """ジョブ実行中だけクライアントの XDG_* を使う"""
+        monkeypatch.setenv("XDG_CONFIG_HOME", "/daemon/config")
+        monkeypatch.setenv("XDG_STATE_HOME", "/daemon/state")
+        seen = {}
+
+        def fake_main(argv):
+            seen.update({k: os.environ.get(k) for k in ("XDG_CONFIG_HOME", "XDG_STATE_HOME")})
+            seen["tty"] = sys.stdout.isatty()
+            return 0
+
+        channel = MagicMock()
+        with patch.object(cli, "main", fake_main):
+            daemon.run_job(
+                ["version"], os.getcwd(),
+                daemon._Stream(channel, "out", True), daemon._Stream(channel, "err", True),
+                {"XDG_CONFIG_HOME": "/client/config"},
+            )
+        assert seen == {"XDG_CONFIG_HOME": "/client/config", "XDG_STATE_HOME": None, "tty": True}
+        assert os.environ["XDG_CONFIG_HOME"] == "/daemon/config"
+        assert os.environ["XDG_STATE_HOME"] == "/daemon/state"
+
+    def test_forwardable(self, monkeypatch):
+        monkeypatch.delenv(daemon.NO_DAEMON_ENV, raising=False)
+        assert daemon._forwardable(["version", "rt1"])
+        assert daemon._forwardable(["show", "show version", "rt1"])
+        assert not daemon._forwardable([])
+        assert not daemon._forwardable(["daemon"])
+        # 長時間かかる・機器を変更するサブコマンドはローカルで実行する
+        for subcommand in ("upgrade", "reboot", "rsi", "config", "run"):
+            assert not daemon._forwardable([subcommand, "rt1"])
+        assert not daemon._forwardable(["show", "--help"])
+        monkeypatch.setenv(daemon.NO_DAEMON_ENV, "1")
+        assert not daemon._forwardable(["version"])
+
+    def test_roundtrip(self, tmp_path, monkeypatch):
+        """デーモン経由で実行し、出力と終了コードを受け取る"""
+        monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+        path = str(tmp_path / "d.sock")
+        seen = {}
+
+        def fake_main(argv):
+            seen["argv"] = argv
+            seen["cwd"] = os.getcwd()
+            seen["config"] = os.environ.get("XDG_CONFIG_HOME")
+            print("hello from daemon")
+            raise SystemExit(3)
+
+        with patch.object(cli, "main", fake_main), _serving(path):
+            assert os.stat(path).st_mode & 0o777 == 0o600
+            code, out, _ = _forward(["version", "rt1"], path)
+        assert code == 3
+        assert seen["argv"] == ["version", "rt1"]
+        assert seen["cwd"] == os.getcwd()
+        assert seen["config"] == str(tmp_path / "config")
+        assert out == "hello from daemon\n"
+        assert not os.path.exists(path)
+
+    def test_refuses_long_jobs(self, tmp_path):
+        """読み取り専用以外のサブコマンドはデーモンで実行しない"""
+        path = str(tmp_path / "d.sock")
+        fake_main = MagicMock(return_value=0)
+        with patch.object(cli, "main", fake_main), _serving(path):
+            code, _, err = _forward(["upgrade", "rt1"], path)
+        assert code == 2
+        assert "only facts, version, show, ls are served" in err
+        fake_main.assert_not_called()
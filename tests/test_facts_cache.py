@@ -0,0 +1,172 @@
+"""facts キャッシュと --where によるターゲット選択のテスト"""
+
+import argparse
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from junos_ops import cache
+
+
+def _facts(model="EX2300-24T", version="20.4R3-S1", personality="SWITCH", members=1):
+    return {
+        "hostname": "dummy",
+        "model": model,
+        "version": version,
+        "personality": personality,
+        "model_info": {f"{model}-{i}": model for i in range(members)},
+        "srx_cluster": None,
+        "serialnumber": "not cached",
+    }
+
+
+class TestFactsStore:
+    """store_facts() / load_facts() のテスト"""
+
+    def test_roundtrip(self):
+        cache.store_facts("sw1", _facts())
+        loaded = cache.load_facts()
+        assert loaded["sw1"]["model"] == "EX2300-24T"
+        assert loaded["sw1"]["model_info"] == {"EX2300-24T-0": "EX2300-24T"}
+        # FACTS_KEYS 以外は保存しない
+        assert "serialnumber" not in loaded["sw1"]
+
+    def test_ttl(self, monkeypatch):
+        cache.store_facts("sw1", _facts())
+        now = time.time()
+        monkeypatch.setattr(cache.time, "time", lambda: now + 100)
+        assert "sw1" in cache.load_facts(ttl=200)
+        assert cache.load_facts(ttl=50) == {}
+
+    def test_replace(self):
+        cache.store_facts("sw1", _facts(version="18.4R3"))
+        cache.store_facts("sw1", _facts(version="22.4R3"))
+        assert cache.load_facts()["sw1"]["version"] == "22.4R3"
+
+    def test_no_db(self):
+        assert cache.load_facts() == {}
+
+    def test_partial_update(self):
+        """keys 指定時はそのキーだけを更新し、残りは保持する"""
+        cache.store_facts("sw1", _facts(version="18.4R3"))
+        cache.store_facts("sw1", {"version": "22.4R3"}, keys=("version",))
+        loaded = cache.load_facts()["sw1"]
+        assert loaded["version"] == "22.4R3"
+        assert loaded["model"] == "EX2300-24T"
+
+    def test_partial_new_host(self):
+        cache.store_facts("sw1", {"model": "EX4300-48T"}, keys=("model",))
+        loaded = cache.load_facts()["sw1"]
+        assert loaded["model"] == "EX4300-48T"
+        assert loaded["version"] is None
+
+
+class TestConnectStoresFacts:
+    """connect() 成功時に facts が記録される"""
+
+    def test_stored(self, junos_common, mock_args, mock_config):
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            mock_dev.facts = _facts()
+            MockDevice.return_value = mock_dev
+            err, dev = junos_common.connect("test-host")
+        assert err is False
+        assert cache.load_facts()["test-host"]["version"] == "20.4R3-S1"
+
+    def test_subset_stored(self, junos_common, mock_args, mock_config):
+        """facts を限定した接続では取得したキーだけを記録する"""
+        cache.store_facts("test-host", _facts(version="18.4R3", personality="MX"))
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            mock_dev.facts = _facts(version="22.4R3")
+            MockDevice.return_value = mock_dev
+            junos_common.connect("test-host", facts=("model", "version"))
+        loaded = cache.load_facts()["test-host"]
+        assert loaded["version"] == "22.4R3"
+        assert loaded["personality"] == "MX"
+
+    def test_no_facts_not_stored(self, junos_common, mock_args, mock_config):
+        with patch.object(junos_common, "Device") as MockDevice:
+            MockDevice.return_value = MagicMock()
+            junos_common.connect("test-host", facts=())
+        assert cache.load_facts() == {}
+
+    def test_cache_error_ignored(self, junos_common, mock_args, mock_config):
+        """キャッシュ書き込み失敗は接続を失敗させない"""
+        with patch.object(junos_common, "Device") as MockDevice, \
+                patch.object(cache, "store_facts", side_effect=OSError("read-only")):
+            MockDevice.return_value = MagicMock()
+            err, dev = junos_common.connect("test-host")
+        assert err is False
+
+
+class TestMatchWhere:
+    """match_where() / where_type() のテスト"""
+
+    def test_parse(self, junos_common):
+        assert junos_common.where_type("model=EX2300*") == ("model", "=", "EX2300*")
+        assert junos_common.where_type(" version <= 20.4 ") == ("version", "<=", "20.4")
+
+    def test_parse_invalid(self, junos_common):
+        with pytest.raises(argparse.ArgumentTypeError):
+            junos_common.where_type("model")
+        with pytest.raises(argparse.ArgumentTypeError):
+            junos_common.where_type("model=")
+
+    def test_glob(self, junos_common):
+        facts = _facts()
+        assert junos_common.match_where(facts, "model", "=", "ex2300*")
+        assert not junos_common.match_where(facts, "model", "=", "EX3400*")
+        assert junos_common.match_where(facts, "model", "!=", "EX3400*")
+
+    def test_version(self, junos_common):
+        facts = _facts(version="18.4R3-S9.2")
+        assert junos_common.match_where(facts, "version", "<", "20.4")
+        assert junos_common.match_where(facts, "version", "<", "18.4R3-S10")
+        assert not junos_common.match_where(facts, "version", ">=", "20.4")
+
+    def test_vc_members(self, junos_common):
+        facts = _facts(members=2)
+        assert junos_common.match_where(facts, "vc_members", ">=", "2")
+        assert not junos_common.match_where(facts, "vc_members", ">", "2")
+
+    def test_unknown_field(self, junos_common):
+        assert not junos_common.match_where(_facts(), "nosuch", "=", "*")
+
+
+class TestGetTargetsWhere:
+    """get_targets() の --where フィルタ"""
+
+    @pytest.fixture
+    def cached(self, junos_common, mock_args, mock_config):
+        for name in ("sw1", "sw2", "rt1"):
+            mock_config.add_section(name)
+            mock_config.set(name, "host", name)
+        cache.store_facts("sw1", _facts(version="18.4R3-S10"))
+        cache.store_facts("sw2", _facts(version="22.4R3"))
+        cache.store_facts("rt1", _facts(model="MX204", personality="MX", version="18.4R3"))
+
+    def test_model(self, junos_common, mock_args, cached):
+        mock_args.where = [("model", "=", "EX2300*")]
+        assert junos_common.get_targets() == ["sw1", "sw2"]
+
+    def test_and(self, junos_common, mock_args, cached):
+        mock_args.where = [("model", "=", "EX2300*"), ("version", "<", "20.4")]
+        assert junos_common.get_targets() == ["sw1"]
+
+    def test_uncached_skipped(self, junos_common, mock_args, cached, capsys):
+        """キャッシュのないホストは接続せずに除外される"""
+        mock_args.where = [("personality", "=", "*")]
+        assert junos_common.get_targets() == ["sw1", "sw2", "rt1"]
+        assert "test-host" in capsys.readouterr().out
+
+    def test_combined_with_hosts(self, junos_common, mock_args, cached):
+        mock_args.specialhosts = ["sw2", "rt1"]
+        mock_args.where = [("model", "=", "EX2300*")]
+        assert junos_common.get_targets() == ["sw2"]
+
+    def test_no_match_exits(self, junos_common, mock_args, cached):
+        mock_args.where = [("model", "=", "SRX*")]
+        with pytest.raises(SystemExit):
+            junos_common.get_targets()
@@ -0,0 +1,174 @@
+"""実行ジャーナル（--resume / --retry-failed）のテスト"""
+
+import json
+
+import pytest
+
+from junos_ops import journal
+
+
+def _fail_on_b(target):
+    """プロセスプール用（pickle 可能なモジュールレベル関数）"""
+    return 1 if target == "b" else 0
+
+
+class TestJournal:
+    """Journal の記録と読み込み"""
+
+    def test_roundtrip(self):
+        j = journal.Journal.create("rsi", ["a", "b", "c"], ["rsi"])
+        j.record("a", 0)
+        j.record("b", 2)
+        header, done = journal.Journal(j.run_id).load()
+        assert header["subcommand"] == "rsi"
+        assert header["targets"] == ["a", "b", "c"]
+        assert done == {"a": 0, "b": 2}
+
+    def test_last_record_wins(self):
+        j = journal.Journal.create("rsi", ["a"], [])
+        j.record("a", 1)
+        j.record("a", 0)
+        assert j.load()[1] == {"a": 0}
+
+    def test_truncated_line_ignored(self):
+        """中断で書きかけになった行は無視する"""
+        j = journal.Journal.create("rsi", ["a", "b"], [])
+        j.record("a", 0)
+        with open(j.path, "a") as f:
+            f.write('{"host": "b", "re')
+        assert j.load()[1] == {"a": 0}
+
+    def test_unknown(self):
+        with pytest.raises(FileNotFoundError):
+            journal.Journal("20260101-000000-abcd").load()
+
+    @pytest.mark.parametrize("run_id", [
+        "../../../etc/passwd", "20260101-000000-abcd/../x", "nosuch", "", None,
+    ])
+    def test_invalid_run_id(self, run_id):
+        """runs ディレクトリの外を指す RUN_ID は開かない"""
+        with pytest.raises(ValueError):
+            journal.Journal(run_id)
+
+    def test_other_files_ignored(self):
+        """RUN_ID の形式でないファイルは一覧・削除の対象外"""
+        j = journal.Journal.create("rsi", [], [])
+        with open(f"{journal.journal_dir()}/notes.jsonl", "w"):
+            pass
+        assert journal._runs() == [j.run_id]
+
+    def test_latest(self):
+        assert journal.latest() is None
+        j = journal.Journal.create("rsi", [], [])
+        assert journal.latest() == j.run_id
+
+    def test_prune(self, monkeypatch):
+        monkeypatch.setattr(journal, "MAX_RUNS", 2)
+        ids = []
+        for i in range(3):
+            monkeypatch.setattr(journal.secrets, "token_hex", lambda n, i=i: f"000{i}")
+            ids.append(journal.Journal.create("rsi", [], []).run_id)
+        assert journal._runs() == ids[1:]
+
+
+class TestSelect:
+    """select() のテスト"""
+
+    header = {"targets": ["a", "b", "c", "d"]}
+    done = {"a": 0, "b": 1, "c": 0}
+
+    def test_resume(self):
+        assert journal.select(self.header, self.done, "resume") == ["d"]
+
+    def test_retry_failed(self):
+        assert journal.select(self.header, self.done, "retry-failed") == ["b"]
+
+
+class TestOnDone:
+    """run_parallel(on_done=...) で完了したホストが順次記録される"""
+
+    @pytest.mark.parametrize("kwargs", [
+        {"max_workers": 1},
+        {"max_workers": 3},
+    ])
+    def test_workers(self, junos_common, kwargs):
+        seen = []
+        results = junos_common.run_parallel(
+            _fail_on_b, ["a", "b", "c"], on_done=lambda t, r: seen.append((t, r)), **kwargs
+        )
+        assert sorted(seen) == sorted(results.items())
+
+    def test_scheduled(self, junos_common, monkeypatch):
+        monkeypatch.setattr(junos_common, "tag_limits", {"x": 1})
+        monkeypatch.setattr(junos_common, "_capped_tags", lambda targets: {t: set() for t in targets})
+        seen = []
+        junos_common.run_parallel(
+            _fail_on_b, ["a", "b"], max_workers=2, on_done=lambda t, r: seen.append((t, r))
+        )
+        assert sorted(seen) == [("a", 0), ("b", 1)]
+
+    def test_processes(self, junos_common):
+        """ワーカープロセス内からジャーナルに記録できる"""
+        junos_common.args = None
+        j = journal.Journal.create(None, ["a", "b", "c"], [])
+        junos_common.run_parallel(
+            _fail_on_b, ["a", "b", "c"], max_workers=2, processes=2, on_done=j.record
+        )
+        assert j.load()[1] == {"a": 0, "b": 1, "c": 0}
+
+
+class TestJournaled:
+    """機器を変更する実行だけをジャーナルに記録する"""
+
+    CONFIG = "[DEFAULT]\nid = u\npw = p\nsshkey = k\nport = 830\n[rt1]\ntags = core\n[rt2]\n"
+
+    def test_journaled(self):
+        assert journal.journaled("rollback")
+        assert journal.journaled("run", ["version", "copy"])
+        assert not journal.journaled("run", ["version", "ls", "rsi"])
+        for subcommand in ("show", "version", "ls", "rsi", None):
+            assert not journal.journaled(subcommand)
+
+    def test_read_only_not_recorded(self, junos_common, tmp_path, monkeypatch, capsys):
+        from junos_ops import cli
+
+        config = tmp_path / "config.ini"
+        config.write_text(self.CONFIG)
+        monkeypatch.setattr(cli, "cmd_version", lambda hostname: 0)
+        assert cli.main(["version", "rt1", "-c", str(config)]) == 0
+        assert journal.latest() is None
+        assert "# run:" not in capsys.readouterr().err
+
+    def test_changing_recorded(self, junos_common, tmp_path, monkeypatch, capsys):
+        from junos_ops import cli
+
+        config = tmp_path / "config.ini"
+        config.write_text(self.CONFIG)
+        monkeypatch.setattr(cli, "cmd_rollback", lambda hostname: 0)
+        assert cli.main(["rollback", "rt1", "-c", str(config)]) == 0
+        run_id = journal.latest()
+        assert f"# run: {run_id}" in capsys.readouterr().err
+        assert journal.Journal(run_id).load()[1] == {"rt1": 0}
+
+    @pytest.mark.parametrize("extra", [["rt1"], ["--tags", "core"], ["--where", "model=MX*"]])
+    def test_resume_rejects_selection(self, junos_common, tmp_path, extra, capsys):
+        """--resume はホスト名・--tags・--where と併用できない"""
+        from junos_ops import cli
+
+        config = tmp_path / "config.ini"
+        config.write_text(self.CONFIG)
+        run_id = journal.Journal.create("rollback", ["rt1", "rt2"], []).run_id
+        with pytest.raises(SystemExit) as e:
+            cli.main(["rollback", *extra, "-c", str(config), "--resume", run_id])
+        assert e.value.code == 2
+        assert "cannot be combined" in capsys.readouterr().err
+
+    def test_resume_read_only_rejected(self, junos_common, tmp_path, capsys):
+        from junos_ops import cli
+
+        config = tmp_path / "config.ini"
+        config.write_text(self.CONFIG)
+        with pytest.raises(SystemExit) as e:
+            cli.main(["version", "-c", str(config), "--retry-failed", "last"])
+        assert e.value.code == 2
+        assert "not journaled" in capsys.readouterr().err
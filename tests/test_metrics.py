@@ -0,0 +1,74 @@
+"""--metrics（Prometheus textfile 出力）のテスト"""
+
+import os
+
+import pytest
+
+from junos_ops import metrics
+from junos_ops import report
+
+
+@pytest.fixture(autouse=True)
+def records():
+    report.enable()
+    report.records["h1"] = {
+        **report._new_record("h1"), "status": 0, "duration": 12.0, "connect_time": 0.3,
+        "bytes": 1000,
+    }
+    report.records["h2"] = {
+        **report._new_record("h2"), "status": 1, "duration": 400.0, "connect_time": 2.0,
+        "error": "ConnectAuthError", "bytes": 500,
+    }
+    report.add("h3", 1, error="Unreachable", message="timed out")
+    report.add("h4", 2)
+    yield
+    report.reset()
+
+
+def _samples(text) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestBuild:
+    """build() の内容"""
+
+    def test_counts(self):
+        s = _samples(metrics.build("rsi", started=100.0, finished=160.0))
+        assert s['junos_ops_hosts{subcommand="rsi",result="ok"}'] == 1
+        assert s['junos_ops_hosts{subcommand="rsi",result="failed"}'] == 3
+        assert s['junos_ops_host_failures{subcommand="rsi",error="ConnectAuthError"}'] == 1
+        assert s['junos_ops_host_failures{subcommand="rsi",error="Unreachable"}'] == 1
+        assert s['junos_ops_host_failures{subcommand="rsi",error="NonZeroExit"}'] == 1
+        assert s['junos_ops_run_duration_seconds{subcommand="rsi"}'] == 60.0
+        assert s['junos_ops_copied_bytes{subcommand="rsi"}'] == 1500
+
+    def test_histograms(self):
+        s = _samples(metrics.build(None, started=0.0, finished=1.0))
+        assert s['junos_ops_host_duration_seconds_bucket{subcommand="facts",le="10"}'] == 2
+        assert s['junos_ops_host_duration_seconds_bucket{subcommand="facts",le="30"}'] == 3
+        assert s['junos_ops_host_duration_seconds_bucket{subcommand="facts",le="+Inf"}'] == 4
+        assert s['junos_ops_host_duration_seconds_count{subcommand="facts"}'] == 4
+        assert s['junos_ops_connect_seconds_bucket{subcommand="facts",le="0.5"}'] == 1
+        assert s['junos_ops_connect_seconds_count{subcommand="facts"}'] == 2
+        assert s['junos_ops_connect_seconds_sum{subcommand="facts"}'] == pytest.approx(2.3)
+
+    def test_help_and_type(self):
+        text = metrics.build("version", started=0.0)
+        assert "# TYPE junos_ops_host_duration_seconds histogram" in text
+        assert "# TYPE junos_ops_hosts gauge" in text
+
+    def test_escape(self):
+        assert metrics._labels(error='a"b\\c\n') == '{error="a\\"b\\\\c\\n"}'
+
+
+class TestWrite:
+    def test_atomic(self, tmp_path):
+        path = tmp_path / "junos_ops.prom"
+        metrics.write(str(path), "version", started=0.0)
+        assert "junos_ops_hosts" in path.read_text()
+        assert os.listdir(tmp_path) == ["junos_ops.prom"]
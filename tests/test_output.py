@@ -0,0 +1,106 @@
+"""ホストごとの出力の捕捉（output.Captured / --output-dir）のテスト"""
+
+import logging
+import sys
+import threading
+
+import pytest
+
+from junos_ops import output
+from junos_ops import report
+
+
+@pytest.fixture(autouse=True)
+def restore():
+    yield
+    output.uninstall()
+
+
+def _chatty(hostname, barrier=None):
+    print(f"# {hostname}")
+    if barrier is not None:
+        # 他のスレッドと出力を交互にする
+        barrier.wait()
+    print(f"{hostname}: line 1")
+    if barrier is not None:
+        barrier.wait()
+    print(f"{hostname}: line 2")
+    return 0
+
+
+class TestCaptured:
+    """Captured ラッパーのテスト"""
+
+    def test_no_interleave(self, capsys):
+        barrier = threading.Barrier(2)
+        func = output.Captured(lambda h: _chatty(h, barrier))
+        with output.capture():
+            threads = [threading.Thread(target=func, args=(h,)) for h in ("h1", "h2")]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        blocks = capsys.readouterr().out.split("# ")[1:]
+        assert sorted(blocks) == [
+            "h1\nh1: line 1\nh1: line 2\n",
+            "h2\nh2: line 1\nh2: line 2\n",
+        ]
+
+    def test_return_value_and_restore(self, capsys):
+        with output.capture():
+            assert output.Captured(_chatty)("h1") == 0
+            print("outside")
+        assert not isinstance(sys.stdout, output._Stdout)
+        assert capsys.readouterr().out.endswith("h1: line 2\noutside\n")
+
+    def test_exception_still_flushed(self, capsys):
+        def broken(hostname):
+            print("partial")
+            raise RuntimeError("boom")
+
+        with output.capture(), pytest.raises(RuntimeError):
+            output.Captured(broken)("h1")
+        assert capsys.readouterr().out == "partial\n"
+
+    def test_logging_captured(self, capsys):
+        handler = logging.StreamHandler(sys.stdout)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        old_level = root.level
+        root.setLevel(logging.INFO)
+
+        def logs(hostname):
+            logging.getLogger("test").info(f"{hostname} logged")
+            return 0
+
+        try:
+            with output.capture(hold=True):
+                output.Captured(logs)("h1")
+            assert handler.stream is sys.stdout
+        finally:
+            root.removeHandler(handler)
+            root.setLevel(old_level)
+        assert capsys.readouterr().out == ""
+        assert output.held["h1"] == "h1 logged\n"
+
+    def test_output_dir(self, capsys, tmp_path):
+        with output.capture():
+            output.Captured(_chatty, output_dir=str(tmp_path))("h1")
+        assert capsys.readouterr().out == ""
+        assert (tmp_path / "h1.log").read_text() == "# h1\nh1: line 1\nh1: line 2\n"
+        assert not (tmp_path / "h1.log.tmp").exists()
+
+    def test_report_message_fallback(self, capsys):
+        report.enable()
+        try:
+            with output.capture():
+                report.Reported(output.Captured(_chatty))("h1")
+            assert report.records["h1"]["message"] == "h1: line 2"
+        finally:
+            report.reset()
+
+
+class TestLastLine:
+    def test_last_line(self):
+        assert output.last_line("a\nb\n\n  \n") == "b"
+        assert output.last_line("") is None
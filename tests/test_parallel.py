@@ -5,6 +5,51 @@ import configparser
 
 import pytest
 
+from junos_ops import common
+
+
+def _upper(target):
+    """プロセスプール用（pickle 可能なモジュールレベル関数）"""
+    return target.upper()
+
+
+def _host_and_pid(target):
+    """ワーカープロセス内で再構築された config を参照する"""
+    import os
+    return (common.config.get(target, "host"), os.getpid())
+
+
+def _fail_on_b(target):
+    if target == "b":
+        raise RuntimeError("fail")
+    return 0
+
+
+def _exit_on_c(target):
+    """c でワーカープロセスごと異常終了する"""
+    import os
+    if target == "c":
+        os._exit(1)
+    return 0
+
+
+def _login_fails(target):
+    """ワーカープロセス内で認証エラーを報告する（ブレーカー作動後はスキップ）"""
+    credential = ("wrong", None, None)
+    if common.breaker.is_tripped(credential):
+        common.breaker.observe_skip(target)
+        return 1
+    common.breaker.observe_auth_failure(target, credential)
+    return 1
+
+
+# 親プロセスで on_done に渡された (target, ret)
+_coordinator_done = []
+
+
+def _record_done(target, ret):
+    _coordinator_done.append((target, ret))
+
 
 class TestRunParallel:
     """run_parallel() のテスト"""
@@ -37,6 +82,96 @@ class TestRunParallel:
         assert results == {}
 
 
+class TestRunParallelProcesses:
+    """run_parallel(processes=N) のテスト"""
+
+    def test_results_merged(self, junos_common):
+        """各プロセスの結果が1つの dict にマージされる"""
+        junos_common.args = None
+        results = junos_common.run_parallel(
+            _upper, ["a", "b", "c", "d"], max_workers=2, processes=2,
+        )
+        assert results == {"a": "A", "b": "B", "c": "C", "d": "D"}
+
+    def test_exception_in_worker(self, junos_common):
+        """ワーカー内の例外はエラーコード1"""
+        junos_common.args = None
+        results = junos_common.run_parallel(
+            _fail_on_b, ["a", "b", "c"], max_workers=3, processes=2,
+        )
+        assert results == {"a": 0, "b": 1, "c": 0}
+
+    def test_worker_crash_keeps_finished(self, junos_common):
+        """ワーカーが異常終了しても、完了済みのホストは失敗扱いにしない"""
+        junos_common.args = None
+        _coordinator_done.clear()
+        # a と c が同じシャードに入り、a の完了後に c でプロセスが落ちる
+        results = junos_common.run_parallel(
+            _exit_on_c, ["a", "b", "c", "d"], max_workers=2, processes=2,
+            on_done=_record_done,
+        )
+        assert results["a"] == 0
+        assert results["c"] == 1
+        assert ("a", 1) not in _coordinator_done
+        assert ("c", 1) in _coordinator_done
+
+    def test_worker_rereads_config(self, junos_common, mock_args, tmp_path):
+        """ワーカープロセスは args から config を再構築する"""
+        import os
+
+        cfg = tmp_path / "config.ini"
+        cfg.write_text("[h1]\nhost = 192.0.2.1\n[h2]\nhost = 192.0.2.2\n")
+        mock_args.config = str(cfg)
+        results = junos_common.run_parallel(
+            _host_and_pid, ["h1", "h2"], max_workers=2, processes=2,
+        )
+        assert results["h1"][0] == "192.0.2.1"
+        assert results["h2"][0] == "192.0.2.2"
+        assert os.getpid() not in {pid for _, pid in results.values()}
+
+    def test_breaker_shared(self, junos_common, mock_args, tmp_path):
+        """認証失敗の連続回数は全ワーカープロセスで数える"""
+        cfg = tmp_path / "config.ini"
+        cfg.write_text("[DEFAULT]\nhost = 192.0.2.1\n")
+        mock_args.config = str(cfg)
+        mock_args.max_auth_failures = 2
+        breaker = junos_common.setup_breaker()
+        targets = [f"h{i}" for i in range(6)]
+        try:
+            junos_common.run_parallel(_login_fails, targets, max_workers=3, processes=3)
+        finally:
+            junos_common.breaker = None
+        assert breaker.tripped
+        assert breaker.users == ["wrong"]
+        # プロセスごとに数えると 6 ホストすべてがログインを試みる
+        assert len(breaker.failures) <= 2 + 2
+        assert sorted(breaker.failures + breaker.skipped) == targets
+
+    def test_breaker_unshare_ignores_lock(self, junos_common):
+        """異常終了したワーカーが共有ロックを持ったままでも unshare は止まらない"""
+        import multiprocessing
+
+        breaker = junos_common.AuthBreaker(2)
+        breaker.observe_auth_failure("h1", ("wrong", None, None))
+        manager = multiprocessing.get_context("spawn").Manager()
+        try:
+            breaker.share(manager)
+            breaker._lock.acquire()
+            breaker.unshare()
+        finally:
+            manager.shutdown()
+        assert breaker._consecutive == {("wrong", None, None): 1}
+        breaker.observe_auth_failure("h2", ("wrong", None, None))
+        assert breaker.users == ["wrong"]
+
+    def test_single_target_runs_inline(self, junos_common):
+        """ターゲットが1つならプロセスを起動しない"""
+        results = junos_common.run_parallel(
+            lambda t: t.upper(), ["a"], max_workers=1, processes=4,
+        )
+        assert results == {"a": "A"}
+
+
 class TestGetTargets:
     """get_targets() のテスト"""
 
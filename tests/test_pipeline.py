@@ -0,0 +1,127 @@
+"""run サブコマンド（1セッションで複数ステップを実行）のテスト"""
+
+import argparse
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from junos_ops import cli
+from junos_ops import rsi
+from junos_ops import upgrade
+
+
+class TestRunSteps:
+    """common.run_steps() のテスト"""
+
+    def test_order_and_single_session(self, junos_common, mock_args, mock_config):
+        calls = []
+        steps = [
+            ("a", lambda h, d: calls.append(("a", d)) or 0),
+            ("b", lambda h, d: calls.append(("b", d)) or 0),
+        ]
+        mock_dev = MagicMock()
+        with patch.object(junos_common, "connect", return_value=(False, mock_dev)) as mock_connect:
+            assert junos_common.run_steps("test-host", steps) == 0
+        mock_connect.assert_called_once()
+        assert calls == [("a", mock_dev), ("b", mock_dev)]
+        mock_dev.close.assert_called_once()
+
+    def test_stops_at_first_failure(self, junos_common, mock_args, mock_config, capsys):
+        calls = []
+        steps = [
+            ("a", lambda h, d: calls.append("a") or 0),
+            ("b", lambda h, d: calls.append("b") or 2),
+            ("c", lambda h, d: calls.append("c") or 0),
+        ]
+        with patch.object(junos_common, "connect", return_value=(False, MagicMock())):
+            assert junos_common.run_steps("test-host", steps) == 2
+        assert calls == ["a", "b"]
+        assert "## b failed" in capsys.readouterr().out
+
+    def test_exception(self, junos_common, mock_args, mock_config):
+        def boom(h, d):
+            raise RuntimeError("boom")
+
+        mock_dev = MagicMock()
+        with patch.object(junos_common, "connect", return_value=(False, mock_dev)):
+            assert junos_common.run_steps("test-host", [("a", boom)]) == 1
+        mock_dev.close.assert_called_once()
+
+    def test_connect_failure(self, junos_common, mock_args, mock_config):
+        step = MagicMock(return_value=0)
+        with patch.object(junos_common, "connect", return_value=(True, None)):
+            assert junos_common.run_steps("test-host", [("a", step)]) == 1
+        step.assert_not_called()
+
+
+class TestStepsType:
+    """steps_type() / steps_facts() のテスト"""
+
+    def test_parse(self):
+        assert cli.steps_type("Version, copy,install") == ["version", "copy", "install"]
+
+    def test_unknown(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            cli.steps_type("version,nosuch")
+
+    def test_reboot_last(self):
+        """reboot はセッションを閉じるので最後のステップに限る"""
+        assert cli.steps_type("install,reboot") == ["install", "reboot"]
+        with pytest.raises(argparse.ArgumentTypeError):
+            cli.steps_type("reboot,version")
+
+    def test_empty(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            cli.steps_type(",")
+
+    def test_facts_union(self):
+        facts = cli.steps_facts(["ls", "version", "rsi"])
+        assert set(facts) == set(upgrade.FACTS) | set(rsi.FACTS)
+        assert cli.steps_facts(["ls", "config"]) == ()
+
+    def test_facts_all(self):
+        """facts ステップを含むと全 facts を取得"""
+        assert cli.steps_facts(["version", "facts"]) is None
+
+
+class TestCmdRun:
+    """cmd_run() のテスト"""
+
+    def test_pipeline(self, junos_common, mock_args, mock_config):
+        mock_args.steps = ["version", "copy", "install"]
+        mock_dev = MagicMock()
+        with patch.object(junos_common, "connect", return_value=(False, mock_dev)) as mock_connect, \
+                patch.object(upgrade, "show_version", return_value=False) as m_version, \
+                patch.object(upgrade, "copy", return_value=True) as m_copy, \
+                patch.object(upgrade, "install") as m_install:
+            assert cli.cmd_run("test-host") == 1
+        mock_connect.assert_called_once_with("test-host", facts=upgrade.FACTS)
+        m_version.assert_called_once_with("test-host", mock_dev)
+        m_copy.assert_called_once_with("test-host", mock_dev)
+        # copy が失敗したので install は実行しない
+        m_install.assert_not_called()
+
+    def test_ls_and_rsi_options(self, junos_common, tmp_path, monkeypatch):
+        """run でも ls の -l と rsi の --rsi-dir を指定できる"""
+        config = tmp_path / "config.ini"
+        config.write_text("[DEFAULT]\nid = u\npw = p\nsshkey = k\nport = 830\n[rt1]\n")
+        seen = []
+        monkeypatch.setattr(
+            cli, "cmd_run",
+            lambda hostname: seen.append(
+                (junos_common.args.list_format, junos_common.args.rsi_dir)
+            ) or 0,
+        )
+        rsi_dir = str(tmp_path / "rsi")
+        assert cli.main(["run", "ls,rsi", "rt1", "-c", str(config), "-l", "--rsi-dir", rsi_dir]) == 0
+        assert seen == [("long", rsi_dir)]
+
+    def test_ls_short_by_default(self, junos_common, tmp_path, monkeypatch):
+        config = tmp_path / "config.ini"
+        config.write_text("[DEFAULT]\nid = u\npw = p\nsshkey = k\nport = 830\n[rt1]\n")
+        seen = []
+        monkeypatch.setattr(
+            cli, "cmd_run", lambda hostname: seen.append(junos_common.args.list_format) or 0,
+        )
+        assert cli.main(["run", "ls", "rt1", "-c", str(config)]) == 0
+        assert seen == ["short"]
@@ -0,0 +1,64 @@
+"""probe_targets()（事前到達性チェック）のテスト"""
+
+import asyncio
+import socket
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def listener():
+    """ローカルの待ち受けソケット（到達可能なポート）"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+    """待ち受けていないポート（接続拒否）"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestProbeTargets:
+    """probe_targets() のテスト"""
+
+    def test_reachable(self, junos_common, mock_args, mock_config, listener):
+        mock_config.set("test-host", "host", "127.0.0.1")
+        mock_config.set("test-host", "port", str(listener))
+        assert junos_common.probe_targets(["test-host"]) == {"test-host": None}
+
+    def test_refused(self, junos_common, mock_args, mock_config, closed_port):
+        mock_config.set("test-host", "host", "127.0.0.1")
+        mock_config.set("test-host", "port", str(closed_port))
+        result = junos_common.probe_targets(["test-host"])
+        assert result["test-host"] is not None
+
+    def test_timeout(self, junos_common, mock_args, mock_config):
+        """期限内に応答がなければタイムアウト理由を返す"""
+        async def hang(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        with patch.object(junos_common.asyncio, "open_connection", hang):
+            result = junos_common.probe_targets(["test-host"], timeout=0.05)
+        assert result == {"test-host": "timeout after 0.05s"}
+
+    def test_mixed(self, junos_common, mock_args, mock_config, listener, closed_port):
+        mock_config.set("test-host", "host", "127.0.0.1")
+        mock_config.set("test-host", "port", str(listener))
+        mock_config.add_section("dead-host")
+        mock_config.set("dead-host", "host", "127.0.0.1")
+        mock_config.set("dead-host", "port", str(closed_port))
+        result = junos_common.probe_targets(["test-host", "dead-host"])
+        assert result["test-host"] is None
+        assert result["dead-host"] is not None
+
+    def test_empty(self, junos_common, mock_args, mock_config):
+        assert junos_common.probe_targets([]) == {}
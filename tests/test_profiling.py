@@ -0,0 +1,90 @@
+"""--profile cpu|mem のテスト"""
+
+import pstats
+import sys
+import threading
+
+import pytest
+
+from junos_ops import profiling
+
+
+@pytest.fixture(autouse=True)
+def stop_profiler():
+    yield
+    profiling.stop_quietly()
+
+
+def _busy_worker():
+    return sum(i * i for i in range(1000))
+
+
+def _run_in_thread():
+    t = threading.Thread(target=_busy_worker)
+    t.start()
+    t.join()
+
+
+class TestCpu:
+    """cProfile による計測"""
+
+    @pytest.mark.skipif(
+        sys.version_info < (3, 12), reason="cProfile sees every thread from Python 3.12"
+    )
+    def test_worker_threads_included(self, tmp_path, capsys):
+        path = str(tmp_path / "out.pstats")
+        profiling.start("cpu")
+        _run_in_thread()
+        profiling.finish(path)
+        stats = pstats.Stats(path)
+        names = {func[2] for func in stats.stats}
+        assert "_busy_worker" in names
+        assert not profiling.active()
+        assert "python -m pstats" in capsys.readouterr().out
+
+    def test_parts_merged(self, tmp_path):
+        """ワーカープロセスのパートファイルを統合して削除する"""
+        path = str(tmp_path / "out.pstats")
+        profiling.start("cpu")
+        _busy_worker()
+        profiling.save_part(path)
+        assert profiling.active()
+        assert len(list(tmp_path.glob("out.pstats.part-*"))) == 1
+        profiling.finish(path)
+        names = {func[2] for func in pstats.Stats(path).stats}
+        assert "_busy_worker" in names
+        assert list(tmp_path.glob("out.pstats.part-*")) == []
+
+
+    def test_stale_parts_removed(self, tmp_path):
+        """以前の異常終了で残ったパートファイルは統合しない"""
+        path = str(tmp_path / "out.pstats")
+        profiling.start("cpu")
+        _run_in_thread()
+        profiling.save_part(path)
+        profiling.stop_quietly()
+        profiling.start("cpu", path)
+        assert list(tmp_path.glob("out.pstats.part-*")) == []
+        _busy_worker()
+        profiling.finish(path)
+        names = {func[2] for func in pstats.Stats(path).stats}
+        assert "_run_in_thread" not in names
+
+
+class TestMem:
+    """tracemalloc による計測"""
+
+    def test_report(self, tmp_path):
+        path = tmp_path / "mem.txt"
+        profiling.start("mem")
+        held = [bytearray(1024) for _ in range(200)]  # noqa: F841
+        profiling.finish(str(path))
+        report = path.read_text()
+        assert report.startswith("# tracemalloc: top")
+        assert "test_profiling.py" in report
+        assert "bytearray(1024)" in report
+
+    def test_format_size(self):
+        assert profiling._format_size(512) == "512 B"
+        assert profiling._format_size(2048) == "2.0 KiB"
+        assert profiling._format_size(3 * 1024 ** 3) == "3.0 GiB"
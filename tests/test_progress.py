@@ -0,0 +1,148 @@
+"""--progress（ライブ進捗表示）のテスト"""
+
+import io
+import sys
+
+import pytest
+
+from junos_ops import bandwidth
+from junos_ops import output
+from junos_ops import progress
+from junos_ops import report
+
+
+@pytest.fixture(autouse=True)
+def clean_report():
+    report.enable()
+    bandwidth.reset()
+    yield
+    report.reset()
+    bandwidth.reset()
+
+
+def _record(host, status=None, phase=None, detail=None):
+    record = report._new_record(host)
+    record.update(status=status, phase=phase)
+    if detail is not None:
+        record["detail"] = detail
+    report.records[host] = record
+    return record
+
+
+class TestRender:
+    """status() / render() のテスト"""
+
+    def test_counts(self):
+        dashboard = progress.Dashboard(["h1", "h2", "h3", "h4"], stream=io.StringIO())
+        dashboard._started = 0.0
+        _record("h1", status=0)
+        _record("h2", status=1)
+        _record("h3", phase="scp", detail="42%")
+        lines = dashboard.render()
+        assert "done 2/4 (failed 1)" in lines[0]
+        assert "running 1  queued 1" in lines[0]
+        assert "h3" in lines[1] and "scp 42%" in lines[1]
+
+    def test_eta(self, monkeypatch):
+        dashboard = progress.Dashboard(["h1", "h2", "h3"], stream=io.StringIO())
+        monkeypatch.setattr(progress.time, "monotonic", lambda: 100.0)
+        dashboard._started = 40.0
+        _record("h1", status=0)
+        st = dashboard.status()
+        # 1台に60秒、残り2台
+        assert st["eta"] == pytest.approx(120.0)
+
+    def test_no_eta_before_first_host(self):
+        dashboard = progress.Dashboard(["h1"], stream=io.StringIO())
+        dashboard._started = 0.0
+        assert dashboard.render()[0].endswith("ETA --")
+
+    def test_running_lines_capped(self, monkeypatch):
+        monkeypatch.setattr(progress, "MAX_RUNNING_LINES", 2)
+        targets = [f"h{i}" for i in range(5)]
+        dashboard = progress.Dashboard(targets, stream=io.StringIO())
+        dashboard._started = 0.0
+        for host in targets:
+            _record(host, phase="install")
+        lines = dashboard.render()
+        assert len(lines) == 4
+        assert lines[-1].strip() == "... 3 more"
+
+    def test_plain_stream_summary_only(self):
+        stream = io.StringIO()
+        dashboard = progress.Dashboard(["h1"], stream=stream)
+        dashboard._started = 0.0
+        _record("h1", phase="rsi")
+        dashboard._draw()
+        assert stream.getvalue().count("\n") == 1
+        assert "\x1b[" not in stream.getvalue()
+
+
+class TestDumpOutput:
+    """終了後のホストごとの出力"""
+
+    def test_output_per_host(self, monkeypatch):
+        stream = io.StringIO()
+        monkeypatch.setattr(sys, "stdout", stream)
+
+        def cmd(hostname):
+            print(f"# {hostname}")
+            print(f"{hostname} done")
+            return 0
+
+        dashboard = progress.Dashboard(["h1", "h2"], stream=stream)
+        func = report.Reported(output.Captured(cmd))
+        with output.capture(hold=True):
+            dashboard.start()
+            print("before")
+            # 逆順に実行しても対象の順で出力される
+            func("h2")
+            func("h1")
+            dashboard.stop()
+        assert sys.stdout is stream
+        before = stream.getvalue()
+        assert "h1 done" not in before
+        dashboard.dump_output()
+        out = stream.getvalue()[len(before):]
+        assert out == "before\n# h1\nh1 done\n# h2\nh2 done\n"
+
+    def test_detail_not_in_report(self):
+        _record("h1", status=0, phase="scp", detail="42%")
+        document = report.build("version", 0.0)
+        assert "detail" not in document["hosts"][0]
+        assert "phase" not in document["hosts"][0]
+
+
+class TestProbeAndProgress:
+    """--probe と --progress の併用"""
+
+    def test_unreachable_not_queued(self, tmp_path, monkeypatch):
+        """到達不能なホストは表示対象に含めず、完了数が対象数に達する"""
+        from junos_ops import cli
+        from junos_ops import common
+
+        config = tmp_path / "config.ini"
+        config.write_text(
+            "[DEFAULT]\nid = u\npw = p\nsshkey = k\nport = 830\n"
+            "[rt1]\nhost = 192.0.2.1\n[rt2]\nhost = 192.0.2.2\n"
+        )
+        dashboards = []
+
+        class _Dashboard(progress.Dashboard):
+            def __init__(self, targets, **kwargs):
+                super().__init__(targets, stream=io.StringIO(), **kwargs)
+                dashboards.append(self)
+
+        monkeypatch.setattr(progress, "Dashboard", _Dashboard)
+        monkeypatch.setattr(
+            common, "probe_targets", lambda targets, timeout: {"rt1": None, "rt2": "refused"}
+        )
+        monkeypatch.setattr(cli, "cmd_version", lambda hostname: 0)
+        with pytest.raises(SystemExit) as e:
+            cli.main(["version", "-c", str(config), "--probe", "--progress"])
+        assert e.value.code == 1
+        (dashboard,) = dashboards
+        assert dashboard.targets == ["rt1"]
+        # stop() での最後の描画
+        last = dashboard.stream.getvalue().splitlines()[-1]
+        assert last.startswith("done 1/1 (failed 0)  running 0  queued 0")
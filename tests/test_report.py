@@ -0,0 +1,134 @@
+"""--report（構造化された実行レポート）のテスト"""
+
+import json
+import logging
+from unittest.mock import patch, MagicMock
+
+import pytest
+from jnpr.junos.exception import ConnectTimeoutError
+
+from junos_ops import bandwidth
+from junos_ops import report
+
+
+@pytest.fixture(autouse=True)
+def clean_report():
+    report.enable()
+    bandwidth.reset()
+    yield
+    report.reset()
+    bandwidth.reset()
+
+
+def _ok(hostname):
+    with report.phase("step"):
+        with report.phase("inner"):
+            pass
+    return 0
+
+
+class TestReported:
+    """Reported ラッパーと phase() のテスト"""
+
+    def test_record(self):
+        assert report.Reported(_ok)("h1") == 0
+        record = report.records["h1"]
+        assert record["status"] == 0
+        assert set(record["phases"]) == {"step", "inner"}
+        assert record["duration"] >= record["phases"]["step"]
+
+    def test_exception(self):
+        def boom(hostname):
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            report.Reported(boom)("h1")
+        record = report.records["h1"]
+        assert record["status"] == 1
+        assert record["error"] == "RuntimeError"
+        assert record["message"] == "boom"
+
+    def test_log_message(self):
+        """ホスト実行中の warning/error ログを message に残す"""
+        def warn(hostname):
+            logging.getLogger("junos_ops.test").error("disk full")
+            return 1
+
+        report.Reported(warn)("h1")
+        assert report.records["h1"]["message"] == "disk full"
+
+    def test_bytes(self):
+        def copy(hostname):
+            bandwidth._record(hostname, 1000)
+            return 0
+
+        report.Reported(copy)("h1")
+        assert report.records["h1"]["bytes"] == 1000
+
+    def test_noop_outside_host(self):
+        with report.phase("x"):
+            report.connected(1.0)
+            report.failed(RuntimeError("x"))
+        assert report.records == {}
+
+
+class TestConnectReport:
+    """connect() / run_steps() からの記録"""
+
+    def test_connect_error(self, junos_common, mock_args, mock_config):
+        def cmd(hostname):
+            return junos_common.run_steps(hostname, [("a", lambda h, d: 0)])
+
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            mock_dev.open.side_effect = ConnectTimeoutError(mock_dev)
+            report.Reported(cmd)("test-host")
+        record = report.records["test-host"]
+        assert record["error"] == "ConnectTimeoutError"
+        assert "connect" in record["phases"]
+        assert record["connect_time"] is None
+
+    def test_connect_time(self, junos_common, mock_args, mock_config):
+        def cmd(hostname):
+            return junos_common.run_steps(hostname, [("version", lambda h, d: 0)])
+
+        with patch.object(junos_common, "Device") as MockDevice:
+            MockDevice.return_value = MagicMock()
+            report.Reported(cmd)("test-host")
+        record = report.records["test-host"]
+        assert record["connect_time"] is not None
+        assert set(record["phases"]) == {"connect", "facts", "version"}
+
+
+class TestBuild:
+    """集計とファイル出力のテスト"""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert report.percentile(values, 50) == 50
+        assert report.percentile(values, 99) == 99
+        assert report.percentile([3.0], 90) == 3.0
+        assert report.percentile([], 50) is None
+
+    def test_write(self, tmp_path):
+        report.Reported(_ok)("h1")
+        report.add("h2", 1, error="Unreachable", message="timeout after 3s")
+        path = tmp_path / "out.json"
+        report.write(str(path), "version", report.records["h1"]["started"])
+        doc = json.loads(path.read_text())
+        assert doc["hosts_total"] == 2
+        assert doc["hosts_ok"] == 1
+        assert doc["hosts_failed"] == 1
+        assert [h["host"] for h in doc["hosts"]] == ["h1", "h2"]
+        assert doc["hosts"][1]["error"] == "Unreachable"
+        assert "step" in doc["phases"]
+        assert "phase" not in doc["hosts"][0]
+
+    def test_processes(self, junos_common):
+        """ワーカープロセスの記録が親に集約される"""
+        junos_common.args = None
+        junos_common.run_parallel(
+            report.Reported(_ok), ["a", "b", "c"], max_workers=2, processes=2,
+        )
+        assert sorted(report.records) == ["a", "b", "c"]
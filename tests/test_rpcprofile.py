@@ -0,0 +1,156 @@
+"""--profile-rpc（RPC ごとのレイテンシ・応答サイズ計測）のテスト"""
+
+from unittest.mock import patch, MagicMock
+
+import pytest
+from lxml import etree
+from jnpr.junos.exception import RpcError, RpcTimeoutError
+
+from junos_ops import cache
+from junos_ops import rpcprofile
+
+
+@pytest.fixture(autouse=True)
+def profiling():
+    rpcprofile.enable()
+    yield
+    rpcprofile.disable()
+
+
+def _rpc(tag):
+    rpc = MagicMock()
+    rpc.tag = tag
+    return rpc
+
+
+def _device(reply=None, side_effect=None):
+    dev = MagicMock()
+    dev.execute.return_value = reply
+    dev.execute.side_effect = side_effect
+    return dev
+
+
+class TestInstrument:
+    """instrument() による記録"""
+
+    def test_ok_with_size(self):
+        reply = etree.fromstring("<software-information><x/></software-information>")
+        dev = _device(reply=reply)
+        rpcprofile.instrument(dev, "h1")
+        rpcprofile.instrument(dev, "h1")  # 二重に包まない
+        assert dev.execute(_rpc("get-software-information")) is reply
+        assert len(rpcprofile.samples) == 1
+        name, host, seconds, size, outcome, model = rpcprofile.samples[0]
+        assert (name, host, outcome) == ("get-software-information", "h1", "ok")
+        assert size == len(etree.tostring(reply))
+        assert seconds >= 0
+        assert model is None
+
+    def test_large_reply_estimated(self):
+        """大きな応答は全体を直列化せずに見積もる"""
+        items = "".join(f"<file><name>f{i:04}</name></file>" for i in range(1000))
+        reply = etree.fromstring(f"<directory-list><directory>{items}</directory></directory-list>")
+        dev = _device(reply=reply)
+        rpcprofile.instrument(dev, "h1")
+        with patch.object(rpcprofile.etree, "tostring", wraps=etree.tostring) as mock_tostring:
+            dev.execute(_rpc("file-list"))
+        assert all(len(call.args[0]) == 0 for call in mock_tostring.call_args_list)
+        assert rpcprofile.samples[0][3] == len(etree.tostring(reply))
+
+    def test_model_from_session(self):
+        """取得済みの facts からモデルを記録する（facts の収集はしない）"""
+        dev = _device(reply=etree.fromstring("<ok/>"))
+        dev.facts._cache = {"model": "MX204"}
+        rpcprofile.instrument(dev, "h1")
+        dev.execute(_rpc("get-software-information"))
+        assert rpcprofile.samples[0][5] == "MX204"
+
+    def test_disabled_not_recorded(self):
+        """無効化後はプールされたセッションでも記録しない"""
+        reply = etree.fromstring("<ok/>")
+        dev = _device(reply=reply)
+        rpcprofile.instrument(dev, "h1")
+        rpcprofile.disable()
+        with patch.object(rpcprofile, "_reply_size") as mock_size:
+            assert dev.execute(_rpc("get-software-information")) is reply
+        mock_size.assert_not_called()
+        assert rpcprofile.samples == []
+
+    def test_host_per_checkout(self):
+        """同じセッションを別ホストのジョブが使えば、そのホストとして記録する"""
+        dev = _device(reply=etree.fromstring("<ok/>"))
+        rpcprofile.instrument(dev, "h1")
+        dev.execute(_rpc("get-software-information"))
+        rpcprofile.instrument(dev, "h2")
+        dev.execute(_rpc("get-software-information"))
+        assert [sample[1] for sample in rpcprofile.samples] == ["h1", "h2"]
+
+    def test_timeout(self):
+        dev = _device(side_effect=RpcTimeoutError(MagicMock(), "file-list", 30))
+        rpcprofile.instrument(dev, "h1")
+        with pytest.raises(RpcTimeoutError):
+            dev.execute(_rpc("file-list"))
+        assert rpcprofile.samples[0][4] == "timeout"
+
+    def test_error(self):
+        dev = _device(side_effect=RpcError())
+        rpcprofile.instrument(dev, "h1")
+        with pytest.raises(RpcError):
+            dev.execute(_rpc("file-list"))
+        assert rpcprofile.samples[0][4] == "error"
+
+
+class TestSummary:
+    """summarize() / print_summary() のテスト"""
+
+    def test_group_by_model(self):
+        rpcprofile.merge([
+            ("file-list", "q1", 1.0, 100, "ok", None),
+            ("file-list", "q2", 3.0, 300, "timeout", None),
+            ("file-list", "e1", 0.1, 100, "ok", None),
+            ("get-software-information", "x1", 0.2, 50, "ok", None),
+        ])
+        rows = rpcprofile.summarize({"q1": "QFX5100", "q2": "QFX5100", "e1": "EX2300"})
+        assert [(r["rpc"], r["model"]) for r in rows] == [
+            ("file-list", "QFX5100"),
+            ("get-software-information", "unknown"),
+            ("file-list", "EX2300"),
+        ]
+        qfx = rows[0]
+        assert qfx["count"] == 2
+        assert qfx["timeouts"] == 1
+        assert qfx["p50"] == 1.0
+        assert qfx["p99"] == 3.0
+        assert qfx["size"] == 200
+
+    def test_print_uses_facts_cache(self, capsys):
+        cache.store_facts("q1", {"model": "QFX5100"}, keys=("model",))
+        rpcprofile.merge([("file-list", "q1", 0.5, 10, "ok", None)])
+        rpcprofile.print_summary()
+        out = capsys.readouterr().out
+        assert "# rpc profile" in out
+        assert "QFX5100" in out
+
+    def test_live_model_wins(self):
+        """セッションで記録したモデルを facts キャッシュより優先する"""
+        rpcprofile.merge([
+            ("file-list", "q1", 0.5, 10, "ok", None),
+            ("file-list", "q1", 0.7, 10, "ok", "QFX5110-48S-4C"),
+        ])
+        rows = rpcprofile.summarize({"q1": "QFX5100"})
+        assert [(r["model"], r["count"]) for r in rows] == [("QFX5110-48S-4C", 2)]
+
+    def test_nothing_recorded(self, capsys):
+        rpcprofile.print_summary()
+        assert capsys.readouterr().out == ""
+
+
+class TestConnectInstruments:
+    """connect() が --profile-rpc 時にセッションを計測する"""
+
+    def test_connect(self, junos_common, mock_args, mock_config):
+        with patch.object(junos_common, "Device") as MockDevice:
+            mock_dev = MagicMock()
+            MockDevice.return_value = mock_dev
+            err, dev = junos_common.connect("test-host", facts=())
+        assert vars(dev).get("_junos_ops_profiled")
@@ -0,0 +1,143 @@
+"""タグ単位の同時実行数制限（[limit:TAG] セクション）のテスト"""
+
+import configparser
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def mock_config_with_limits(junos_common):
+    """[limit:TAG] セクション付きの設定"""
+    cfg = configparser.ConfigParser(allow_no_value=True)
+    cfg.read_dict(
+        {
+            "DEFAULT": {"id": "testuser", "port": "830"},
+            "rt1": {"host": "rt1", "tags": "osaka-wan, core"},
+            "rt2": {"host": "rt2", "tags": "osaka-wan"},
+            "rt3": {"host": "rt3", "tags": "osaka-wan"},
+            "rt4": {"host": "rt4", "tags": "tokyo"},
+            "rt5": {"host": "rt5", "tags": "tokyo"},
+            "limit:osaka-wan": {"workers": "2", "copy": "1"},
+            "limit:core": {"upgrade": "1"},
+        }
+    )
+    junos_common.config = cfg
+    yield cfg
+    junos_common.tag_limits = {}
+
+
+class TestGetTagLimits:
+    """get_tag_limits() のテスト"""
+
+    def test_workers_key(self, junos_common, mock_config_with_limits):
+        assert junos_common.get_tag_limits("version") == {"osaka-wan": 2}
+
+    def test_subcommand_key_precedence(self, junos_common, mock_config_with_limits):
+        """サブコマンド別の値が workers より優先される"""
+        assert junos_common.get_tag_limits("copy") == {"osaka-wan": 1}
+
+    def test_subcommand_only_section(self, junos_common, mock_config_with_limits):
+        assert junos_common.get_tag_limits("version") == {"osaka-wan": 2}
+        assert junos_common.get_tag_limits("upgrade")["core"] == 1
+
+    @pytest.mark.parametrize("subcommand", ["upgrade", "install"])
+    def test_copy_cap_applies_to_copying_subcommands(
+        self, junos_common, mock_config_with_limits, subcommand
+    ):
+        """copy の上限はコピーを伴う upgrade / install にも適用される"""
+        assert junos_common.get_tag_limits(subcommand)["osaka-wan"] == 1
+
+    def test_copy_cap_applies_to_run_steps(self, junos_common, mock_config_with_limits):
+        assert junos_common.get_tag_limits("run", ["version", "copy"]) == {"osaka-wan": 1}
+        assert junos_common.get_tag_limits("run", ["version"]) == {"osaka-wan": 2}
+        assert junos_common.get_tag_limits("run", ["upgrade"]) == {"osaka-wan": 1, "core": 1}
+
+    def test_smallest_cap_wins(self, junos_common, mock_config_with_limits):
+        mock_config_with_limits.set("limit:core", "copy", "3")
+        assert junos_common.get_tag_limits("upgrade")["core"] == 1
+
+    def test_no_subcommand(self, junos_common, mock_config_with_limits):
+        assert junos_common.get_tag_limits(None) == {"osaka-wan": 2}
+
+    def test_zero_rounded_up(self, junos_common, mock_config_with_limits):
+        mock_config_with_limits.set("limit:osaka-wan", "workers", "0")
+        assert junos_common.get_tag_limits("version") == {"osaka-wan": 1}
+
+
+class TestReservedSections:
+    """[limit:TAG] はホストとして扱わない"""
+
+    def test_all_targets(self, junos_common, mock_args, mock_config_with_limits):
+        assert junos_common.get_targets() == ["rt1", "rt2", "rt3", "rt4", "rt5"]
+
+    def test_explicit_limit_section_rejected(self, junos_common, mock_args, mock_config_with_limits):
+        mock_args.specialhosts = ["limit:core"]
+        with pytest.raises(SystemExit):
+            junos_common.get_targets()
+
+
+class TestTagScheduling:
+    """run_parallel() がタグ上限を守るテスト"""
+
+    def _run(self, junos_common):
+        lock = threading.Lock()
+        state = {"running": set(), "peak": 0}
+
+        def work(t):
+            with lock:
+                state["running"].add(t)
+                osaka = {"rt1", "rt2", "rt3"} & state["running"]
+                state["peak"] = max(state["peak"], len(osaka))
+            time.sleep(0.02)
+            with lock:
+                state["running"].discard(t)
+            return 0
+
+        results = junos_common.run_parallel(
+            work, ["rt1", "rt2", "rt3", "rt4", "rt5"], max_workers=5,
+        )
+        return results, state["peak"]
+
+    def test_cap_respected(self, junos_common, mock_config_with_limits):
+        junos_common.setup_tag_limits("copy")
+        results, peak = self._run(junos_common)
+        assert peak == 1
+        assert results == {t: 0 for t in ["rt1", "rt2", "rt3", "rt4", "rt5"]}
+
+    def test_uncapped_hosts_not_blocked(self, junos_common, mock_config_with_limits):
+        """上限に達したタグのホストは後続の別ホストをブロックしない"""
+        junos_common.setup_tag_limits("copy")
+        order = []
+        lock = threading.Lock()
+
+        def work(t):
+            with lock:
+                order.append(t)
+            time.sleep(0.05 if t == "rt1" else 0)
+            return 0
+
+        junos_common.run_parallel(
+            work, ["rt1", "rt2", "rt4", "rt5"], max_workers=4,
+        )
+        # rt2 は rt1 の終了待ち、その間に rt4/rt5 が先に開始される
+        assert order.index("rt4") < order.index("rt2")
+        assert order.index("rt5") < order.index("rt2")
+
+
+class TestShardTargets:
+    """_shard_targets() のテスト"""
+
+    def test_capped_tag_same_shard(self, junos_common, mock_config_with_limits):
+        """上限付きタグを共有するホストは同じシャードに入る"""
+        junos_common.setup_tag_limits("upgrade")
+        shards = junos_common._shard_targets(["rt1", "rt2", "rt3", "rt4", "rt5"], 3)
+        osaka = [s for s in shards if "rt1" in s][0]
+        assert {"rt1", "rt2", "rt3"} <= set(osaka)
+        assert sorted(t for s in shards for t in s) == ["rt1", "rt2", "rt3", "rt4", "rt5"]
+
+    def test_no_caps_balanced(self, junos_common, mock_config_with_limits):
+        junos_common.tag_limits = {}
+        shards = junos_common._shard_targets(["rt1", "rt2", "rt3", "rt4"], 2)
+        assert sorted(len(s) for s in shards) == [2, 2]
@@ -0,0 +1,136 @@
+"""タイムアウトプロファイル（[timeout:NAME] セクション）のテスト"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from junos_ops import rsi
+from junos_ops import timeouts
+
+
+@pytest.fixture(autouse=True)
+def clear_timeout_cache():
+    timeouts.clear_cache()
+    yield
+    timeouts.clear_cache()
+
+
+def _dev(model="MX204", personality="MX", members=1):
+    dev = MagicMock()
+    dev.facts = {
+        "model": model,
+        "personality": personality,
+        "model_info": {f"{model}-{i}": {} for i in range(members)},
+        "hostname": "test",
+        "srx_cluster": None,
+    }
+    return dev
+
+
+class TestBuiltinProfiles:
+    """組み込みプロファイル（従来のハードコード値）のテスト"""
+
+    def test_defaults(self, junos_common, mock_args, mock_config):
+        table = timeouts.resolve("MX204", "MX", 1)
+        assert table == {
+            "rsi": 600, "install": 2400, "checksum": 1200, "cleanup": 60,
+            "cleanfs": 300, "rollback": 120, "snapshot": 60,
+        }
+
+    def test_srx_branch_vc_rsi(self, junos_common, mock_args, mock_config):
+        """SRX_BRANCH は VC より先に評価される"""
+        assert timeouts.resolve("SRX345", "SRX_BRANCH", 2)["rsi"] == 1200
+
+    def test_qfx5110_vc(self, junos_common, mock_args, mock_config):
+        assert timeouts.resolve("QFX5110-48S-4C", "SWITCH", 2)["rsi"] == 2400
+
+    def test_qfx5110_standalone(self, junos_common, mock_args, mock_config):
+        assert timeouts.resolve("QFX5110-48S-4C", "SWITCH", 1)["rsi"] == 600
+
+
+class TestConfigProfiles:
+    """config.ini のプロファイルのテスト"""
+
+    def test_model_glob(self, junos_common, mock_args, mock_config):
+        mock_config.add_section("timeout:ex2300")
+        mock_config.set("timeout:ex2300", "model", "EX2300-*")
+        mock_config.set("timeout:ex2300", "install", "3600")
+        table = timeouts.resolve("EX2300-48P", "SWITCH", 1)
+        assert table["install"] == 3600
+        # 未指定の操作は組み込み値
+        assert table["checksum"] == 1200
+
+    def test_overrides_builtin(self, junos_common, mock_args, mock_config):
+        """config のプロファイルは組み込みより優先"""
+        mock_config.add_section("timeout:fast-mx")
+        mock_config.set("timeout:fast-mx", "personality", "MX")
+        mock_config.set("timeout:fast-mx", "rsi", "120")
+        assert timeouts.resolve("MX204", "MX", 1)["rsi"] == 120
+
+    def test_first_match_wins(self, junos_common, mock_args, mock_config):
+        mock_config.add_section("timeout:vc")
+        mock_config.set("timeout:vc", "vc_members", "3")
+        mock_config.set("timeout:vc", "install", "7200")
+        mock_config.add_section("timeout:switch")
+        mock_config.set("timeout:switch", "personality", "SWITCH")
+        mock_config.set("timeout:switch", "install", "1800")
+        assert timeouts.resolve("EX4300-48T", "SWITCH", 4)["install"] == 7200
+        assert timeouts.resolve("EX4300-48T", "SWITCH", 2)["install"] == 1800
+
+    def test_not_a_host(self, junos_common, mock_args, mock_config):
+        mock_config.add_section("timeout:ex2300")
+        assert junos_common.get_targets() == ["test-host"]
+
+    def test_invalid_value_dropped(self, junos_common, mock_args, tmp_path, monkeypatch):
+        """不正な数値は読み込み時に警告して無視する"""
+        ini = tmp_path / "test.ini"
+        ini.write_text(
+            "[DEFAULT]\nid = testuser\n\n"
+            "[rt1.example.jp]\n\n"
+            "[timeout:mx]\nmodel = MX*\ninstall = 36OO\nrollback = -5\nrsi = 120\n"
+        )
+        junos_common.args.config = str(ini)
+        warned = []
+        monkeypatch.setattr(timeouts.logger, "warning", warned.append)
+        assert junos_common.read_config() is False
+        assert len(warned) == 2
+        assert "install = 36OO" in warned[0]
+        assert "rollback = -5" in warned[1]
+        table = timeouts.resolve("MX204", "MX", 1)
+        # 不正な値は組み込み値、正しい値はそのまま使う
+        assert table["install"] == 2400
+        assert table["rollback"] == 120
+        assert table["rsi"] == 120
+
+
+class TestGetTimeout:
+    """get_timeout() のテスト"""
+
+    def test_resolved_once(self, junos_common, mock_args, mock_config, monkeypatch):
+        calls = []
+        original = timeouts.resolve
+        monkeypatch.setattr(timeouts, "resolve", lambda *a: calls.append(a) or original(*a))
+        dev = _dev()
+        timeouts.get_timeout("test-host", dev, "install")
+        timeouts.get_timeout("test-host", dev, "checksum")
+        assert len(calls) == 1
+
+    def test_install_uses_profile(self, junos_common, mock_args, mock_config):
+        mock_config.add_section("timeout:mx")
+        mock_config.set("timeout:mx", "model", "MX*")
+        mock_config.set("timeout:mx", "rollback", "45")
+        dev = _dev()
+        dev.rpc.request_package_rollback.return_value = MagicMock()
+        from junos_ops import upgrade
+        upgrade.rollback("test-host", dev)
+        assert dev.rpc.request_package_rollback.call_args.kwargs["dev_timeout"] == 45
+
+    def test_rsi_uses_profile(self, junos_common, mock_args, mock_config):
+        mock_config.add_section("timeout:slow")
+        mock_config.set("timeout:slow", "model", "MX204")
+        mock_config.set("timeout:slow", "rsi", "900")
+        dev = _dev()
+        rsi.get_support_information(dev, "test-host")
+        dev.rpc.get_support_information.assert_called_once_with(
+            {"format": "text"}, dev_timeout=900
+        )
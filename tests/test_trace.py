@@ -0,0 +1,133 @@
+"""--trace（phase / RPC の span 出力）のテスト"""
+
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from junos_ops import report
+from junos_ops import trace
+
+
+@pytest.fixture(autouse=True)
+def tracing():
+    trace.enable()
+    report.enable()
+    yield
+    trace.disable()
+    report.reset()
+
+
+def _cmd(hostname):
+    with report.phase("connect"):
+        pass
+    with report.phase("copy"):
+        with report.phase("scp"):
+            pass
+    return 0
+
+
+def _by_name(name):
+    return [s for s in trace.spans if s["name"] == name]
+
+
+class TestSpan:
+    """span() と Reported / phase() からの記録"""
+
+    def test_disabled_noop(self):
+        trace.disable()
+        with trace.span("x") as record:
+            assert record is None
+        assert trace.spans == []
+
+    def test_host_and_phases(self):
+        report.Reported(_cmd)("h1")
+        host = _by_name("host")[0]
+        copy = _by_name("copy")[0]
+        scp = _by_name("scp")[0]
+        assert host["parent_id"] is None
+        assert copy["parent_id"] == host["span_id"]
+        assert scp["parent_id"] == copy["span_id"]
+        assert scp["host"] == "h1"
+        assert host["start"] <= scp["start"] <= scp["end"] <= host["end"]
+
+    def test_threads_separate(self):
+        threads = [
+            threading.Thread(target=report.Reported(_cmd), args=(h,)) for h in ("h1", "h2")
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        hosts = {s["span_id"]: s["host"] for s in _by_name("host")}
+        connects = _by_name("connect")
+        assert len(connects) == 2
+        for s in connects:
+            assert hosts[s["parent_id"]] == s["host"]
+
+    def test_error_recorded(self):
+        with pytest.raises(RuntimeError):
+            with trace.span("broken", host="h1"):
+                raise RuntimeError("boom")
+        assert _by_name("broken")[0]["error"] == "RuntimeError: boom"
+
+
+class TestInstrument:
+    """instrument() による RPC の span"""
+
+    def test_rpc_span(self):
+        dev = MagicMock()
+        execute = dev.execute
+        execute.return_value = "reply"
+        trace.instrument(dev)
+        trace.instrument(dev)  # 二重に包まない
+        rpc = MagicMock()
+        rpc.tag = "get-software-information"
+        with trace.span("host", host="h1"):
+            assert dev.execute(rpc) == "reply"
+        spans = _by_name("rpc get-software-information")
+        assert len(spans) == 1
+        assert spans[0]["host"] == "h1"
+        assert spans[0]["attrs"]["kind"] == "rpc"
+        execute.assert_called_once_with(rpc)
+
+
+class TestExport:
+    """Chrome trace / OTLP JSON への出力"""
+
+    def test_chrome(self, tmp_path):
+        report.Reported(_cmd)("h2")
+        report.Reported(_cmd)("h1")
+        path = tmp_path / "trace.json"
+        trace.write(str(path), "chrome")
+        doc = json.loads(path.read_text())
+        meta = {e["args"]["name"]: e["tid"] for e in doc["traceEvents"] if e["ph"] == "M"}
+        assert meta == {"h1": 1, "h2": 2}
+        scp = [e for e in doc["traceEvents"] if e["name"] == "scp"]
+        assert {e["tid"] for e in scp} == {1, 2}
+        assert all(e["ph"] == "X" and e["dur"] >= 0 for e in scp)
+        assert not (tmp_path / "trace.json.tmp").exists()
+
+    def test_otlp(self, tmp_path):
+        report.Reported(_cmd)("h1")
+        path = tmp_path / "trace.json"
+        trace.write(str(path), "otlp")
+        doc = json.loads(path.read_text())
+        spans = doc["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert len({s["traceId"] for s in spans}) == 1
+        ids = {s["name"]: s["spanId"] for s in spans}
+        scp = next(s for s in spans if s["name"] == "scp")
+        assert scp["parentSpanId"] == ids["copy"]
+        assert "parentSpanId" not in next(s for s in spans if s["name"] == "host")
+        assert {"key": "host", "value": {"stringValue": "h1"}} in scp["attributes"]
+        assert int(scp["endTimeUnixNano"]) >= int(scp["startTimeUnixNano"])
+
+    def test_merge(self):
+        """ワーカープロセスの span を取り込む"""
+        report.Reported(_cmd)("h1")
+        shard = trace.snapshot()
+        trace.enable()
+        report.Reported(_cmd)("h2")
+        trace.merge(shard)
+        assert {s["host"] for s in _by_name("host")} == {"h1", "h2"}
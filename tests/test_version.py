@@ -197,3 +197,94 @@ class TestGetRescueConfigTime:
         dev.rpc.file_list.side_effect = RpcError()
         result = junos_upgrade.get_rescue_config_time(dev)
         assert result is None
+
+
+class TestProbeMemo:
+    """セッション単位の機器プローブのメモ化"""
+
+    @pytest.fixture
+    def dev(self):
+        dev = MagicMock()
+        dev.facts = {"personality": "SWITCH", "model": "EX2300-24T"}
+        dev.rpc.get_software_information.return_value = etree.fromstring(
+            "<output>\nPending: 22.4R3-S6.5\n</output>"
+        )
+        return dev
+
+    def test_pending_version_once(self, junos_upgrade, mock_args, dev):
+        assert junos_upgrade.get_pending_version("test-host", dev) == "22.4R3-S6.5"
+        assert junos_upgrade.get_pending_version("test-host", dev) == "22.4R3-S6.5"
+        dev.rpc.get_software_information.assert_called_once()
+
+    def test_per_session(self, junos_upgrade, mock_args, dev):
+        other = MagicMock()
+        other.facts = dev.facts
+        other.rpc.get_software_information.return_value = etree.fromstring("<output/>")
+        junos_upgrade.get_pending_version("test-host", dev)
+        assert junos_upgrade.get_pending_version("test-host", other) is None
+
+    def test_invalidate(self, junos_upgrade, junos_common, mock_args, dev):
+        dev.rpc.get_commit_information.return_value = etree.Element("commit-information")
+        junos_upgrade.get_pending_version("test-host", dev)
+        junos_upgrade.get_commit_information(dev)
+        junos_common.invalidate_probes(dev)
+        junos_upgrade.get_pending_version("test-host", dev)
+        junos_upgrade.get_commit_information(dev)
+        assert dev.rpc.get_software_information.call_count == 2
+        assert dev.rpc.get_commit_information.call_count == 2
+
+    def test_rollback_invalidates(self, junos_upgrade, mock_args, mock_config, dev):
+        dev.rpc.request_package_rollback.return_value = etree.fromstring(
+            "<output>NOTICE: The 'pending' set has been removed</output>"
+        )
+        junos_upgrade.get_pending_version("test-host", dev)
+        assert junos_upgrade.rollback("test-host", dev) is False
+        dev.rpc.get_software_information.return_value = etree.fromstring("<output/>")
+        assert junos_upgrade.get_pending_version("test-host", dev) is None
+
+    def test_reinstall_invalidates(self, junos_upgrade, mock_args, mock_config, dev):
+        """check_and_reinstall の rescue save と install の後は取り直す"""
+        dev.rpc.get_commit_information.return_value = etree.Element("commit-information")
+        junos_upgrade.get_commit_information(dev)
+        mock_cu = MagicMock()
+        mock_cu.rescue.return_value = True
+        mock_sw = MagicMock()
+        mock_sw.install.return_value = (True, "install ok")
+        with patch.object(junos_upgrade, "get_commit_information", return_value=(2000, "", "", "")), \
+                patch.object(junos_upgrade, "get_rescue_config_time", return_value=1000), \
+                patch("junos_ops.upgrade.Config", return_value=mock_cu), \
+                patch("junos_ops.upgrade.SW", return_value=mock_sw):
+            assert junos_upgrade.check_and_reinstall("test-host", dev) is False
+        assert "_junos_ops_probes" not in vars(dev)
+
+    def test_release_invalidates(self, junos_upgrade, junos_common, mock_args, dev):
+        junos_upgrade.get_pending_version("test-host", dev)
+        junos_common.release("test-host", dev)
+        junos_upgrade.get_pending_version("test-host", dev)
+        assert dev.rpc.get_software_information.call_count == 2
+
+    def test_timeout_not_memoized(self, junos_upgrade, mock_args, dev):
+        """RPC タイムアウトの結果はメモせず、次の呼び出しで取り直す"""
+        from jnpr.junos.exception import RpcTimeoutError
+
+        reply = dev.rpc.get_software_information.return_value
+        dev.rpc.get_software_information.side_effect = [
+            RpcTimeoutError(dev, "get-software-information", 30),
+            reply,
+        ]
+        assert junos_upgrade.get_pending_version("test-host", dev) is None
+        assert junos_upgrade.get_pending_version("test-host", dev) == "22.4R3-S6.5"
+        assert junos_upgrade.get_pending_version("test-host", dev) == "22.4R3-S6.5"
+        assert dev.rpc.get_software_information.call_count == 2
+
+    def test_commit_error_not_memoized(self, junos_upgrade, mock_args, dev):
+        from jnpr.junos.exception import RpcTimeoutError
+
+        dev.rpc.get_commit_information.side_effect = [
+            RpcTimeoutError(dev, "get-commit-information", 30),
+            etree.Element("commit-information"),
+        ]
+        assert junos_upgrade.get_commit_information(dev) is None
+        assert junos_upgrade.get_commit_information(dev) is None
+        junos_upgrade.get_commit_information(dev)
+        assert dev.rpc.get_commit_information.call_count == 2